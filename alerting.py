@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import codecs
+import collections
+import configparser
+import json
+import logging
+import os.path
+import threading
+import time
+
+from anomaly import Alert
+from eventbus import EventBus
+
+logger = logging.getLogger(__name__)
+
+# what was sent: the first notification, a later (higher) tier, or the all clear
+RAISED = "raised"
+ESCALATED = "escalated"
+CLEARED = "cleared"
+
+Tier = collections.namedtuple("Tier", ["after", "channels"])
+Notification = collections.namedtuple("Notification", ["host", "condition", "state", "tier", "alert", "since"])
+
+# [Alert] kinds that end a condition -> the kind they end
+CLEAR_KINDS = {"cleared": "threshold", "deviation_cleared": "deviation"}
+DEFAULT_TIERS = "0 mqtt, 3600 email"
+
+
+def parse_tiers(text: str) -> list:
+    """
+    Parses escalation tiers.
+     Example: "0 mqtt, 900 mqtt email, 3600 email"
+     -> notify on MQTT right away, on MQTT and email if the condition lasts 15 minutes, by email again after an hour
+    :return: a list of [Tier] sorted by [after]
+    """
+    tiers = []
+    for part in text.split(","):
+        words = part.split()
+        if not words:
+            continue
+        if len(words) < 2:
+            raise ValueError("Tier '{}' needs a time and at least one channel".format(part.strip()))
+        tiers.append(Tier(float(words[0]), tuple(words[1:])))
+    if not tiers:
+        raise ValueError("No alert tiers configured")
+    return sorted(tiers, key=lambda t: t.after)
+
+
+def condition_of(alert: Alert) -> str:
+    """
+    :return: the condition an [Alert] belongs to, "[metric].[kind]". Clear alerts map to the kind they end.
+    """
+    return "{}.{}".format(alert.metric, CLEAR_KINDS.get(alert.kind, alert.kind))
+
+
+def notification_text(n: Notification) -> str:
+    """
+    Example: RPI-B cpu_temp.threshold raised: value 71.20, limit 65.00 (tier 1, since 20181010T1644)
+    """
+    a = n.alert
+    return "{} {} {}: value {}, limit {} (tier {}, since {})".format(
+        n.host, n.condition, n.state,
+        "{0:.2f}".format(a.value) if isinstance(a.value, (int, float)) else a.value,
+        "{0:.2f}".format(a.limit) if isinstance(a.limit, (int, float)) else a.limit,
+        n.tier + 1, time.strftime("%Y%m%dT%H%M", time.localtime(n.since)))
+
+
+class AlertManager(object):
+    """
+    Turns [Alert]s into notifications right away, without waiting for (or triggering) a report.
+    Every condition ([metric].[kind]) is notified through the channels of its escalation tiers: tier 0
+    when it is raised, later tiers while it lasts. Notifications of one condition are at least its
+    rate limit apart, so a flapping value does not flood anyone. When a condition clears, the channels
+    of the last tier that was notified get an all clear.
+    Delivery runs on one [EventBus] per channel, so a slow email never delays an MQTT alert or the caller.
+    """
+
+    def __init__(self, host: str, senders: dict, tiers: list = None, rate_limit: float = 600.0,
+                 rate_limits: dict = None):
+        """
+        :param host: name of this host, copied to every notification
+        :param senders: dict {channel name: callable(Notification)}
+        :param tiers: list of [Tier]. None = DEFAULT_TIERS
+        :param rate_limit: minimum seconds between two notifications of the same condition
+        :param rate_limits: dict {metric or condition: seconds}, overrides [rate_limit]
+        """
+        self.host = host
+        self.tiers = tiers or parse_tiers(DEFAULT_TIERS)
+        self.rate_limit = rate_limit
+        self.rate_limits = dict(rate_limits or {})
+        self.active = {}  # condition -> {"alert": Alert, "since": ts, "tier": last notified tier or -1}
+        self.last_sent = {}  # condition -> ts
+        self._lock = threading.Lock()
+        self._buses = {}
+        for channel, sender in senders.items():
+            self._buses[channel] = EventBus(maxsize=100)
+            self._buses[channel].subscribe(sender)
+
+    @classmethod
+    def from_config(cls, config: configparser.ConfigParser, host: str, senders: dict):
+        """
+        Reads section [alerts] in config.ini
+        :return: an [AlertManager]
+        """
+        c = cls(host, senders)
+        c.configure(config)
+        return c
+
+    def configure(self, config: configparser.ConfigParser):
+        """
+        (Re)reads tiers and rate limits from section [alerts]. Active conditions are kept.
+        """
+        tiers = parse_tiers(config.get("alerts", "tiers", fallback=DEFAULT_TIERS))
+        rate_limits = {}
+        if config.has_section("alerts"):
+            for option in config.options("alerts"):
+                if option.startswith("rate_limit_"):
+                    rate_limits[option[len("rate_limit_"):]] = config.getfloat("alerts", option)
+        with self._lock:
+            self.tiers = tiers
+            self.rate_limit = config.getfloat("alerts", "rate_limit", fallback=600.0)
+            self.rate_limits = rate_limits
+
+    def feed(self, alerts: list, now: float = None):
+        """
+        Applies trip and clear alerts (as raised by [AnomalyDetector.feed]) and notifies what is due.
+        :param alerts: a list of [Alert]
+        :param now: unix time. None = now
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            for a in alerts:
+                if a.kind in CLEAR_KINDS:
+                    self._clear(condition_of(a), a, now)
+                else:
+                    self._raise(condition_of(a), a, now)
+            self._escalate(now)
+
+    def sync(self, active: list, kinds: tuple = None, now: float = None):
+        """
+        For checks that only know what is breached right now (one sample per run):
+        conditions in [active] are raised, active conditions of [kinds] that are missing are cleared.
+        :param active: a list of [Alert], one per breached condition
+        :param kinds: the alert kinds [active] covers. None = every kind
+        :param now: unix time. None = now
+        """
+        now = time.time() if now is None else now
+        current = {condition_of(a): a for a in active}
+        with self._lock:
+            for condition, state in list(self.active.items()):
+                if condition not in current and (kinds is None or state["alert"].kind in kinds):
+                    a = state["alert"]
+                    self._clear(condition, Alert(a.metric, CLEARED, None, a.limit, None), now)
+            for condition, a in current.items():
+                self._raise(condition, a, now)
+            self._escalate(now)
+
+    def tick(self, now: float = None):
+        """
+        Sends escalations that became due since the last [feed] or [sync]. The daemon calls it once per
+        sample interval, so a condition escalates on time even when no new alert arrives.
+        :param now: unix time. None = now
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._escalate(now)
+
+    def close(self, wait: bool = True):
+        """ Stops delivery. Queued notifications are delivered first if [wait] is set. """
+        for bus in self._buses.values():
+            bus.close(wait)
+
+    def save(self, filename: str):
+        """ Writes active conditions and send times to [filename] (json), for runs started by cron """
+        with self._lock:
+            state = {"active": {c: {"alert": list(s["alert"]), "since": s["since"], "tier": s["tier"]}
+                                for c, s in self.active.items()},
+                     "last_sent": self.last_sent}
+        with codecs.open(filename, "w", "utf-8") as file:
+            json.dump(state, file, default=str)
+
+    def load(self, filename: str):
+        """
+        Reads the state written by [save]. A missing or broken file starts with no active conditions.
+        :return: self
+        """
+        if not os.path.isfile(filename):
+            return self
+        try:
+            with codecs.open(filename, "r", "utf-8") as file:
+                state = json.load(file)
+            with self._lock:
+                self.last_sent = {c: float(t) for c, t in state.get("last_sent", {}).items()}
+                self.active = {c: {"alert": Alert(*s["alert"]), "since": float(s["since"]), "tier": int(s["tier"])}
+                               for c, s in state.get("active", {}).items()}
+        except (ValueError, TypeError, KeyError):
+            logger.error("Failed to read alert state " + filename, exc_info=True)
+        return self
+
+    def _raise(self, condition: str, alert: Alert, now: float):
+        state = self.active.get(condition)
+        if state is None:
+            self.active[condition] = {"alert": alert, "since": now, "tier": -1}
+        else:
+            state["alert"] = alert
+
+    def _clear(self, condition: str, alert: Alert, now: float):
+        state = self.active.pop(condition, None)
+        if state is None or state["tier"] < 0:
+            return  # never notified (rate limited), so nobody is waiting for an all clear
+        self._send(Notification(self.host, condition, CLEARED, state["tier"], alert, state["since"]),
+                   self.tiers[min(state["tier"], len(self.tiers) - 1)].channels)
+
+    def _escalate(self, now: float):
+        for condition, state in self.active.items():
+            due = max(i for i, t in enumerate(self.tiers) if t.after <= now - state["since"]) \
+                if self.tiers[0].after <= now - state["since"] else -1
+            if due <= state["tier"]:
+                continue
+            if now - self.last_sent.get(condition, 0.0) < self._rate_limit(condition):
+                continue  # rate limited, sent by a later call
+            self._send(Notification(self.host, condition, RAISED if state["tier"] < 0 else ESCALATED, due,
+                                    state["alert"], state["since"]), self.tiers[due].channels)
+            state["tier"] = due
+            self.last_sent[condition] = now
+
+    def _rate_limit(self, condition: str) -> float:
+        """ The most specific of: [metric].[kind], [metric], the metric family ("disk_full" for "disk_full:/") """
+        metric = condition.rpartition(".")[0]
+        for key in (condition, metric, metric.partition(":")[0]):
+            if key in self.rate_limits:
+                return self.rate_limits[key]
+        return self.rate_limit
+
+    def _send(self, n: Notification, channels: tuple):
+        logger.info(notification_text(n))
+        for channel in channels:
+            bus = self._buses.get(channel)
+            if bus is None:
+                logger.debug("alert channel '{}' is not configured".format(channel))
+                continue
+            bus.publish(n)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import configparser
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+Alert = collections.namedtuple("Alert", ["metric", "kind", "value", "limit", "when"])
+
+
+class Ewma(object):
+    """
+    Exponentially weighted moving average and variance.
+    Constant memory and time per update, no matter how many samples it has seen.
+    """
+
+    def __init__(self, alpha: float):
+        """
+        :param alpha: weight of the newest sample, 0 < alpha <= 1. Smaller is smoother/slower.
+        """
+        self.alpha = alpha
+        self.mean = None
+        self.var = 0.0
+        self.count = 0
+
+    def update(self, x: float):
+        self.count += 1
+        if self.mean is None:
+            self.mean = x
+            return self.mean
+        diff = x - self.mean
+        incr = self.alpha * diff
+        self.mean += incr
+        self.var = (1 - self.alpha) * (self.var + diff * incr)
+        return self.mean
+
+    @property
+    def std(self):
+        return math.sqrt(self.var)
+
+
+class Latch(object):
+    """
+    Hysteresis state machine. Trips after [sustain] consecutive breaching samples
+    and clears after [sustain] consecutive clearing samples. A single spike does neither.
+    """
+
+    def __init__(self, sustain: int):
+        self.sustain = max(1, sustain)
+        self.tripped = False
+        self._streak = 0
+
+    def update(self, breach: bool, clear: bool):
+        """
+        :param breach: the sample is beyond the trip level
+        :param clear: the sample is back below the (lower) clear level
+        :return: "trip", "clear" or None
+        """
+        if not self.tripped:
+            self._streak = self._streak + 1 if breach else 0
+            if self._streak >= self.sustain:
+                self.tripped, self._streak = True, 0
+                return "trip"
+        else:
+            self._streak = self._streak + 1 if clear else 0
+            if self._streak >= self.sustain:
+                self.tripped, self._streak = False, 0
+                return "clear"
+        return None
+
+
+class MetricDetector(object):
+    """
+    Online detector for one metric. Raises an [Alert] when
+     - the value stays at/above [threshold] for [sustain] samples (kind "threshold"), or
+     - a fast EWMA drifts more than [z_score] (short term) standard deviations away
+       from a slow EWMA baseline for [sustain] samples (kind "deviation").
+    Both conditions clear with hysteresis (kind "cleared" / "deviation_cleared").
+    """
+
+    def __init__(self, name: str, threshold: float = None, sustain: int = 3, hysteresis: float = 5.0,
+                 fast_alpha: float = 0.3, slow_alpha: float = 0.01, z_score: float = 4.0, warmup: int = 30,
+                 min_std: float = 0.5):
+        """
+        :param name: name of the metric, used in alerts
+        :param threshold: fixed warning level. None = only detect deviations
+        :param sustain: number of consecutive samples needed to trip or clear
+        :param hysteresis: value must drop below [threshold - hysteresis] to clear
+        :param fast_alpha: EWMA weight of the short term average
+        :param slow_alpha: EWMA weight of the baseline
+        :param z_score: deviation limit in short term standard deviations
+        :param warmup: number of samples before deviations are reported
+        :param min_std: floor for the standard deviation, keeps flat metrics from alerting on tiny changes
+        """
+        self.name = name
+        self.threshold = threshold
+        self.hysteresis = hysteresis
+        self.z_score = z_score
+        self.warmup = warmup
+        self.min_std = min_std
+        self.fast = Ewma(fast_alpha)
+        self.baseline = Ewma(slow_alpha)
+        self._threshold_latch = Latch(sustain)
+        self._deviation_latch = Latch(sustain)
+
+    def update(self, value: float, when=None):
+        """
+        Feeds one sample to the detector
+        :param value: the sample value
+        :param when: timestamp of the sample, copied to the alerts
+        :return: a list of [Alert], usually empty
+        """
+        alerts = []
+        if value is None:
+            return alerts
+
+        if self.threshold is not None:
+            state = self._threshold_latch.update(value >= self.threshold,
+                                                 value < self.threshold - self.hysteresis)
+            if state == "trip":
+                alerts.append(Alert(self.name, "threshold", value, self.threshold, when))
+            elif state == "clear":
+                alerts.append(Alert(self.name, "cleared", value, self.threshold, when))
+
+        fast = self.fast.update(value)
+        if self.baseline.count >= self.warmup:
+            # scaled by the short term noise: the baseline variance would grow along with a slow drift
+            z = (fast - self.baseline.mean) / max(self.fast.std, self.min_std)
+            state = self._deviation_latch.update(abs(z) >= self.z_score, abs(z) < self.z_score / 2)
+            if state == "trip":
+                alerts.append(Alert(self.name, "deviation", value, self.baseline.mean, when))
+            elif state == "clear":
+                alerts.append(Alert(self.name, "deviation_cleared", value, self.baseline.mean, when))
+        self.baseline.update(value)
+        return alerts
+
+    @property
+    def breached(self):
+        return self._threshold_latch.tripped or self._deviation_latch.tripped
+
+
+class AnomalyDetector(object):
+    """
+    Runs one [MetricDetector] per [PollData] field.
+    Feed it every sample from the sampling loop with [feed].
+    """
+    # PollData field -> option in config section [warning_thresholds]
+    THRESHOLD_OPTIONS = collections.OrderedDict([
+        ("cpu_load", "cpu_utilization_percent"),
+        ("cpu_temp", "cpu_temp"),
+        ("disk_usage_percent", "disk_used_percent"),
+        ("memory_percent", "memory_utilization"),
+    ])
+
+    def __init__(self, detectors: list):
+        self.detectors = detectors
+
+    @classmethod
+    def from_config(cls, config: configparser.ConfigParser):
+        """
+        Builds detectors from section [warning_thresholds] (fixed levels)
+        and section [anomaly] (sustain, hysteresis and EWMA settings).
+        :return: an [AnomalyDetector]
+        """
+        detectors = []
+        for field, option in AnomalyDetector.THRESHOLD_OPTIONS.items():
+            detectors.append(MetricDetector(
+                field,
+                config.getfloat("warning_thresholds", option, fallback=None),
+                config.getint("anomaly", "sustain_samples", fallback=3),
+                config.getfloat("anomaly", "hysteresis", fallback=5.0),
+                config.getfloat("anomaly", "fast_alpha", fallback=0.3),
+                config.getfloat("anomaly", "slow_alpha", fallback=0.01),
+                config.getfloat("anomaly", "z_score", fallback=4.0),
+                config.getint("anomaly", "warmup_samples", fallback=30)))
+        return cls(detectors)
+
+    def set_thresholds(self, config: configparser.ConfigParser):
+        """
+        Applies new fixed levels from section [warning_thresholds] without losing the learned baselines
+        :return: None
+        """
+        options = AnomalyDetector.THRESHOLD_OPTIONS
+        for d in self.detectors:
+            if d.name in options:
+                d.threshold = config.getfloat("warning_thresholds", options[d.name], fallback=None)
+
+    def feed(self, data):
+        """
+        :param data: a [PollData] object
+        :return: a list of [Alert] raised by this sample
+        """
+        alerts = []
+        for d in self.detectors:
+            alerts += d.update(getattr(data, d.name, None), data.when)
+        for a in alerts:
+            logger.info("{} {}: value={} limit={}".format(a.metric, a.kind, a.value, a.limit))
+        return alerts
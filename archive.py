@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import array
+import codecs
+import json
+import logging
+import lzma
+import math
+import os
+import struct
+import sys
+import zlib
+
+from customtypes import PollDataBatch
+
+logger = logging.getLogger(__name__)
+
+CODECS = ("zlib", "lzma")
+
+
+class SegmentArchive(object):
+    """
+    Keeps the raw samples of closed report periods, which [aggregate_data_log] would otherwise drop,
+    as one compressed segment file per period plus a small catalog (catalog.json).
+    A segment holds the [PollDataBatch] columns: timestamps as deltas in seconds, values quantized to
+    1/[SCALE] and delta encoded, then compressed with zlib or lzma. A year of one minute samples takes
+    a few MB instead of the hundreds of MB of the text format.
+    Readers pick segments from the catalog by time and host, so only the segments in range are decompressed.
+     Example:
+        archive = SegmentArchive("poll_data/archive", "RPI-B")
+        archive.write_segment(samples)                       # when a period is closed
+        archive.iter_columns(["cpu_temp"], start, end)       -> (unix time, cpu_temp), ...
+        archive.read_batch(start, end)                       -> a [PollDataBatch]
+    """
+    MAGIC = b"WTSEG1"
+    CATALOG = "catalog.json"
+    VERSION = 1
+    SCALE = 100  # values are kept with 2 decimals, like the text format
+    MISSING = -(2 ** 62)  # quantized value of a missing (NaN) value
+
+    def __init__(self, directory: str, host: str = None, codec: str = "zlib", level: int = 6):
+        """
+        :param directory: where segments and the catalog are kept. Created on the first write
+        :param host: host of the segments written, default host of the segments read
+        :param codec: one of [CODECS], used for new segments
+        :param level: compression level (zlib 0-9, lzma preset 0-9)
+        """
+        if codec not in CODECS:
+            raise ValueError("Unknown archive codec '{}'. Choose from {}".format(codec, ", ".join(CODECS)))
+        self.directory = directory
+        self.host = host
+        self.codec = codec
+        self.level = level
+        self._catalog = None
+
+    @property
+    def catalog(self) -> list:
+        """
+        :return: list of segment entries {"file", "host", "start", "end", "count", "codec", "bytes"}, oldest first.
+         [start] and [end] are unix times of the first and last sample
+        """
+        if self._catalog is None:
+            self._catalog = []
+            filename = os.path.join(self.directory, SegmentArchive.CATALOG)
+            if os.path.isfile(filename):
+                try:
+                    with codecs.open(filename, "r", "utf-8") as file:
+                        state = json.load(file)
+                    if state.get("version") == SegmentArchive.VERSION:
+                        self._catalog = state["segments"]
+                except (ValueError, KeyError):
+                    logger.error("Failed to read archive catalog " + filename, exc_info=True)
+        return self._catalog
+
+    def write_segment(self, samples, host: str = None):
+        """
+        Archives the samples of one closed period as a new segment.
+        :param samples: a list of [PollData] or a [PollDataBatch]
+        :param host: None = [self.host]
+        :return: the catalog entry, or None if there were no samples
+        """
+        batch = samples if isinstance(samples, PollDataBatch) else PollDataBatch(samples)
+        if not len(batch):
+            return None
+        host = host or self.host
+        times = [int(round(t)) for t in batch.column("when")]  # unix time
+        columns = self._delta(times)
+        for c in PollDataBatch.COLUMNS[1:]:
+            # NaN (missing) and +-inf (a broken sensor) have no quantized value, both are kept as missing
+            columns += self._delta([int(round(v * SegmentArchive.SCALE)) if math.isfinite(v) else SegmentArchive.MISSING
+                                    for v in batch.column(c)])
+        if sys.byteorder != "little":
+            columns.byteswap()
+        payload = columns.tobytes()  # little endian int64, one column after the other
+        header = json.dumps({"count": len(batch), "columns": list(PollDataBatch.COLUMNS),
+                             "scale": SegmentArchive.SCALE, "codec": self.codec}).encode("utf-8")
+
+        os.makedirs(self.directory, exist_ok=True)
+        name = "{}_{}_{}.seg".format("".join(ch if ch.isalnum() else "-" for ch in host or "local"),
+                                     times[0], times[-1])
+        with open(os.path.join(self.directory, name), "wb") as file:
+            file.write(SegmentArchive.MAGIC + struct.pack("<I", len(header)) + header + self._compress(payload))
+        entry = {"file": name, "host": host, "start": min(times), "end": max(times), "count": len(batch),
+                 "codec": self.codec, "bytes": os.path.getsize(os.path.join(self.directory, name))}
+        self.catalog.append(entry)
+        self.catalog.sort(key=lambda e: e["start"])
+        self._save_catalog()
+        logger.info("Archived {} samples in {} ({} bytes)".format(entry["count"], name, entry["bytes"]))
+        return entry
+
+    def segments(self, start=None, end=None, host: str = None) -> list:
+        """
+        :param start: datetime, None = from the first segment
+        :param end: datetime (exclusive), None = up to the last segment
+        :param host: None = [self.host]. An archive without host keeps every segment
+        :return: the catalog entries of [host] that overlap [start, end), oldest first
+        """
+        host = host or self.host
+        first = start.timestamp() if start is not None else None
+        last = end.timestamp() if end is not None else None
+        return [e for e in self.catalog
+                if (host is None or e["host"] == host) and
+                (first is None or e["end"] >= first) and (last is None or e["start"] < last)]
+
+    def read_segment(self, entry: dict) -> dict:
+        """
+        Decompresses one segment.
+        :return: dict {"time": unix times, column: values (None = missing) for every PollDataBatch column but "when"}
+        """
+        with open(os.path.join(self.directory, entry["file"]), "rb") as file:
+            data = file.read()
+        if not data.startswith(SegmentArchive.MAGIC):
+            raise ValueError("Not an archive segment: " + entry["file"])
+        offset = len(SegmentArchive.MAGIC)
+        size = struct.unpack("<I", data[offset:offset + 4])[0]
+        header = json.loads(data[offset + 4:offset + 4 + size].decode("utf-8"))
+        payload = self._decompress(header["codec"], data[offset + 4 + size:])
+        count = header["count"]
+        columns = array.array("q")
+        columns.frombytes(payload)
+        if sys.byteorder != "little":
+            columns.byteswap()
+        ret = {"time": self._undelta(columns[:count])}
+        scale = float(header["scale"])
+        for i, name in enumerate(header["columns"][1:], 1):
+            ret[name] = [None if v == SegmentArchive.MISSING else v / scale
+                         for v in self._undelta(columns[i * count:(i + 1) * count])]
+        return ret
+
+    def iter_columns(self, metrics: list, start=None, end=None, host: str = None):
+        """
+        Streams [metrics] in [start, end) from the segments in range, oldest first. Same rows as the
+        stores' [iter_columns]: tuples (unix time, one value per metric), missing values are None.
+        """
+        first = start.timestamp() if start is not None else None
+        last = end.timestamp() if end is not None else None
+        for entry in self.segments(start, end, host):
+            try:
+                seg = self.read_segment(entry)
+            except (OSError, ValueError, zlib.error, lzma.LZMAError):
+                logger.error("Skipping unreadable archive segment " + entry["file"], exc_info=True)
+                continue
+            columns = [seg[m] for m in metrics]
+            for i, t in enumerate(seg["time"]):
+                if (first is None or t >= first) and (last is None or t < last):
+                    yield (float(t),) + tuple(c[i] for c in columns)
+
+    def read_batch(self, start=None, end=None, host: str = None) -> PollDataBatch:
+        """
+        :return: the archived samples in [start, end) as a [PollDataBatch] (columns only, no details)
+        """
+        # raw samples, internet was on/off
+        return PollDataBatch.from_rows(self.iter_columns(PollDataBatch.COLUMNS[1:], start, end, host), True)
+
+    def _save_catalog(self):
+        """ Writes the catalog to a temporary file first, so a crash never leaves half a catalog """
+        filename = os.path.join(self.directory, SegmentArchive.CATALOG)
+        with codecs.open(filename + ".tmp", "w", "utf-8") as file:
+            json.dump({"version": SegmentArchive.VERSION, "segments": self.catalog}, file, indent=1)
+        os.replace(filename + ".tmp", filename)
+
+    def _compress(self, payload: bytes) -> bytes:
+        if self.codec == "lzma":
+            return lzma.compress(payload, preset=self.level)
+        return zlib.compress(payload, self.level)
+
+    @staticmethod
+    def _decompress(codec: str, data: bytes) -> bytes:
+        if codec == "lzma":
+            return lzma.decompress(data)
+        return zlib.decompress(data)
+
+    @staticmethod
+    def _delta(values: list) -> array.array:
+        ret = array.array("q")
+        previous = 0
+        for v in values:
+            ret.append(v - previous)
+            previous = v
+        return ret
+
+    @staticmethod
+    def _undelta(deltas) -> list:
+        ret = []
+        v = 0
+        for d in deltas:
+            v += d
+            ret.append(v)
+        return ret
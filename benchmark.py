@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the sampling, storage and reporting pipeline.
+
+Generates synthetic data logs, times the hot functions on them and writes the results as JSON,
+so later changes can be compared against a baseline:
+
+    python3 benchmark.py --rows 10000 100000 1000000 --output bench/baseline.json
+    python3 benchmark.py --rows 10000 100000 1000000 --baseline bench/baseline.json
+
+psutil is replaced by a deterministic stub, so SystemWatcher timings do not depend on the machine load
+and the benchmark runs where psutil is not installed.
+"""
+
+import argparse
+import collections
+import datetime
+import gc
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import time
+import tracemalloc
+import types
+
+from customtypes import DiskIo, Machine, Memory, MountUsage, NetIo, PollData, PollDataBatch
+from datalogger import DataLogger
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROWS = [10000, 100000]
+DEFAULT_DIR = "bench"
+SEED = 1234
+
+
+def stub_psutil():
+    """
+    Installs a deterministic stand-in for psutil in sys.modules. Must run before systemwatcher is imported.
+    """
+    rnd = random.Random(SEED)
+    usage = collections.namedtuple("sdiskusage", ["total", "used", "free", "percent"])
+    part = collections.namedtuple("sdiskpart", ["device", "mountpoint", "fstype", "opts"])
+    vmem = collections.namedtuple("svmem", ["total", "available", "percent"])
+    swap = collections.namedtuple("sswap", ["total", "percent"])
+    m = types.ModuleType("psutil")
+    m.cpu_percent = lambda interval=None: round(rnd.uniform(0, 100), 1)
+    m.disk_usage = lambda path: usage(32000000000, 16000000000, 16000000000, 50.0)
+    m.disk_partitions = lambda all=False: [part("/dev/mmcblk0p2", "/", "ext4", "rw"),
+                                           part("/dev/sda1", "/mnt/usb", "ext4", "rw")]
+    m.virtual_memory = lambda: vmem(1000000000, 600000000, 40.0)
+    m.swap_memory = lambda: swap(100000000, 1.0)
+    m.boot_time = lambda: 1500000000.0
+    sys.modules["psutil"] = m
+
+
+def synthetic_row(rnd: random.Random, when: datetime.datetime) -> PollData:
+    """ A full (10 field) sample with two mounts, one disk, memory and two interfaces """
+    return PollData(when,
+                    round(rnd.uniform(0, 100), 2),
+                    round(rnd.uniform(35, 80), 2),
+                    round(rnd.uniform(40, 60), 2),
+                    rnd.random() > 0.01,
+                    [Machine("RPI-A", "192.168.1.170", 22, "TCP", rnd.random() > 0.05)],
+                    [MountUsage("/", 31000000000, int(rnd.uniform(1e9, 3e10)), round(rnd.uniform(5, 95), 2)),
+                     MountUsage("/mnt/usb", 64000000000, int(rnd.uniform(1e9, 6e10)), round(rnd.uniform(5, 95), 2))],
+                    [DiskIo("mmcblk0", *[rnd.uniform(0, 1e6) for _ in DiskIo.FIELDS])],
+                    Memory(1000000000, int(rnd.uniform(1e8, 9e8)), rnd.uniform(10, 90), 100000000, rnd.uniform(0, 10),
+                           rnd.uniform(0, 5), rnd.uniform(0, 5), rnd.uniform(0, 5)),
+                    [NetIo("eth0", *[rnd.uniform(0, 1e6) for _ in NetIo.FIELDS]),
+                     NetIo("wlan0", *[rnd.uniform(0, 1e5) for _ in NetIo.FIELDS])])
+
+
+def generate_data_log(filename: str, rows: int):
+    """
+    Writes a data log with [rows] samples, one per minute. The same [rows] always gives the same file.
+    """
+    rnd = random.Random(SEED)
+    start = datetime.datetime(2018, 1, 1)
+    DataLogger.create_data_log(filename, True, start, start)
+    with open(filename, "a", encoding="utf-8") as file:
+        for i in range(rows):
+            file.write(str(synthetic_row(rnd, start + datetime.timedelta(minutes=i))) + DataLogger.NEWLINE)
+
+
+def measure(name: str, rows: int, func, repeat: int, setup=None) -> dict:
+    """
+    Runs [func] [repeat] times for timing, then once more under tracemalloc for the peak allocation.
+    :param setup: called before every run, not timed
+    :return: a result row
+    """
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    if setup:
+        setup()
+    gc.collect()
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    result = collections.OrderedDict([("name", name), ("rows", rows), ("repeat", repeat),
+                                      ("min_s", min(times)), ("mean_s", sum(times) / len(times)),
+                                      ("rows_per_s", rows / min(times) if rows and min(times) else None),
+                                      ("peak_bytes", peak)])
+    print("{:<28} {:>10} rows  min {:>9.4f}s  mean {:>9.4f}s  peak {:>8.1f} MB".format(
+        name, rows, result["min_s"], result["mean_s"], peak / 1e6))
+    return result
+
+
+def bench_data_log(filename: str, rows: int, repeat: int) -> list:
+    results = []
+    with open(filename, encoding="utf-8") as f:
+        lines = [line.rstrip() for line in f if line[:1].isdigit()]
+    dl = DataLogger.read_data_log(filename, False)
+
+    results.append(measure("read_data_log", rows, lambda: DataLogger.read_data_log(filename, False), repeat))
+    results.append(measure("read_data_log_header", rows, lambda: DataLogger.read_data_log(filename, True), repeat))
+    results.append(measure("PollData.from_text", rows, lambda: [PollData.from_text(x) for x in lines], repeat))
+    results.append(measure("PollData.__str__", rows, lambda: [str(x) for x in dl[2]], repeat))
+    results.append(measure("PollData.aggregate", rows, lambda: PollData.aggregate(dl[2]), repeat))
+    results.append(measure("PollDataBatch", rows, lambda: PollDataBatch(dl[2]), repeat))
+    batch = PollDataBatch(dl[2])
+    results.append(measure("PollDataBatch.aggregate", rows, batch.aggregate, repeat))
+
+    # aggregate_data() rewrites the log, so every run works on a fresh copy
+    work = filename + ".work"
+    results.append(measure("aggregate_data", rows, lambda: DataLogger.aggregate_data_log(work), repeat,
+                           setup=lambda: shutil.copyfile(filename, work)))
+    os.remove(work)
+
+    try:
+        import gmail
+    except ImportError as e:
+        print("apply_email_template skipped: " + str(e))
+    else:
+        template = os.path.join(os.path.dirname(os.path.realpath(__file__)), "email_templates/default.html")
+        # the report renders the aggregates, so feed it one aggregate per 1000 samples
+        history = (dl[0], dl[1], dl[2], [PollData.aggregate(dl[2][i:i + 1000]) for i in range(0, len(dl[2]), 1000)])
+        results.append(measure("apply_email_template", rows, lambda: gmail.apply_email_template(
+            dl[0], "bench", dl[2][-1], history, template), repeat))
+    return results
+
+
+def bench_system_watcher(ticks: int, repeat: int) -> list:
+    """ Times one scheduler tick (every local collector once) of a [SystemWatcher] on stubbed psutil """
+    stub_psutil()
+    import collectors
+    import systemwatcher as sw
+
+    local = [c for c in collectors.create_collectors() if c.name not in ("internet", "machines")]
+    swo = sw.SystemWatcher(collector_list=local)
+
+    def tick():
+        for _ in range(ticks):
+            for c in swo.collectors:
+                swo._run_collector(c)
+            PollData.from_system_info(swo.system_info)
+
+    try:
+        tick()  # prime the rate based collectors
+        result = measure("SystemWatcher.poll", ticks, tick, repeat)
+        result["latency_ms"] = result["min_s"] / ticks * 1000.0
+        return [result]
+    finally:
+        swo.__exit__(None, None, None)
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL,
+                                         cwd=os.path.dirname(os.path.realpath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return collections.OrderedDict([("date", datetime.datetime.now().isoformat()), ("commit", commit),
+                                    ("python", platform.python_version()), ("platform", platform.platform()),
+                                    ("machine", platform.machine())])
+
+
+def compare(results: list, baseline_file: str):
+    """ Prints the speed of every result relative to the same name/rows in [baseline_file] """
+    with open(baseline_file) as f:
+        baseline = {(r["name"], r["rows"]): r for r in json.load(f)["results"]}
+    print("\nCompared with " + baseline_file)
+    for r in results:
+        b = baseline.get((r["name"], r["rows"]))
+        if b is None:
+            continue
+        print("{:<28} {:>10} rows  {:>6.2f}x time  {:>6.2f}x peak".format(
+            r["name"], r["rows"], r["min_s"] / b["min_s"], r["peak_bytes"] / max(1, b["peak_bytes"])))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Watchtorian pipeline")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS,
+                        help="data log sizes to benchmark (10000 .. 10000000)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark, the fastest counts")
+    parser.add_argument("--ticks", type=int, default=1000, help="SystemWatcher polls per timed run")
+    parser.add_argument("--dir", default=DEFAULT_DIR, help="where the synthetic data logs are kept")
+    parser.add_argument("--regenerate", action="store_true", help="regenerate data logs that already exist")
+    parser.add_argument("--output", default=os.path.join(DEFAULT_DIR, "results.json"), help="JSON result file")
+    parser.add_argument("--baseline", help="JSON result file of an earlier run to compare with")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)  # aggregate_data warns about overwriting on every run
+
+    os.makedirs(args.dir, exist_ok=True)
+    results = []
+    for rows in args.rows:
+        filename = os.path.join(args.dir, "polldata_{}.dat".format(rows))
+        if args.regenerate or not os.path.isfile(filename):
+            start = time.perf_counter()
+            generate_data_log(filename, rows)
+            print("generated {} ({:.1f}s)".format(filename, time.perf_counter() - start))
+        results += bench_data_log(filename, rows, args.repeat)
+    results += bench_system_watcher(args.ticks, args.repeat)
+
+    out_dir = os.path.dirname(args.output)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(collections.OrderedDict([("environment", environment()), ("results", results)]), f, indent=2)
+    print("results written to " + args.output)
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
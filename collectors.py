@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import configparser
+import logging
+import socket
+
+import customtypes
+
+logger = logging.getLogger(__name__)
+
+# name -> Collector class. Filled by the @register decorator
+COLLECTORS = collections.OrderedDict()
+
+CHEAP = "cheap"
+EXPENSIVE = "expensive"
+
+
+def register(cls):
+    """
+    Class decorator that adds a [Collector] to the registry under [cls.name]
+    """
+    COLLECTORS[cls.name] = cls
+    return cls
+
+
+class Collector(object):
+    """
+    Base class for everything [SystemWatcher] polls.
+    A collector declares how often it should run ([interval]), how long it may take ([timeout])
+    and its [cost]. Cheap collectors run inline on the polling thread. Expensive ones split their work
+    into [read] (or [probe]) and [apply]: the read runs on a worker thread and the polling thread applies
+    the result once it is done, so a hanging probe never stalls the cheap ones and only the polling
+    thread writes [system_info]. A read still running when the collector is due again skips its turn.
+    Expensive collectors that implement [probe] (read, no watcher) can run in a supervised worker process
+    instead, see [workers.CollectorWorkers]. Expensive collectors with neither run inline.
+    """
+    name = None
+    interval = 1.0
+    timeout = 1.0
+    cost = CHEAP
+    needs_priming = False  # reports rates, so the first run only reads the counters
+
+    def __init__(self, interval: float = None, timeout: float = None):
+        if interval is not None:
+            self.interval = interval
+        if timeout is not None:
+            self.timeout = timeout
+        self.next_run = 0.0
+
+    def collect(self, watcher):
+        """
+        Reads values and stores them in [watcher.system_info] (see [SystemWatcher.prop_delta])
+        :param watcher: the [SystemWatcher] that runs this collector
+        :return: a list of [FieldUpdates]
+        """
+        return self.apply(watcher, self.read(watcher))
+
+    def read(self, watcher):
+        """
+        Reads values on a worker thread. [watcher] may be read but not written, see [apply].
+        :return: a value for [apply]
+        """
+        return self.probe()
+
+    def probe(self):
+        """
+        Reads values without touching a watcher, so it can run in another process.
+        :return: a picklable value for [apply]
+        """
+        raise NotImplementedError
+
+    def apply(self, watcher, value):
+        """
+        Stores what [probe] read in [watcher.system_info]. Runs on the polling thread.
+        :return: a list of [FieldUpdates]
+        """
+        raise NotImplementedError
+
+    @property
+    def can_probe(self) -> bool:
+        """ True if [probe] is implemented, i.e. the collector can run in a worker process """
+        return type(self).probe is not Collector.probe
+
+    @property
+    def can_read(self) -> bool:
+        """ True if [read] or [probe] is implemented, i.e. the collector can run on a worker thread """
+        return self.can_probe or type(self).read is not Collector.read
+
+
+@register
+class CpuCollector(Collector):
+    name = "cpu"
+    interval = 1.0
+    needs_priming = True
+
+    def collect(self, watcher):
+        return watcher._update_cpu()
+
+
+@register
+class MemoryCollector(Collector):
+    name = "memory"
+    interval = 1.0
+
+    def collect(self, watcher):
+        return watcher._update_memory()
+
+
+@register
+class PressureCollector(Collector):
+    """ Pressure stall information. The kernel reports 10 second averages, so it is read every 10 seconds """
+    name = "pressure"
+    interval = 10.0
+
+    def collect(self, watcher):
+        return watcher._update_pressure()
+
+
+@register
+class NetworkCollector(Collector):
+    name = "network"
+    interval = 1.0
+    needs_priming = True
+
+    def collect(self, watcher):
+        return watcher._update_network()
+
+
+@register
+class DiskIoCollector(Collector):
+    name = "disk_io"
+    interval = 1.0
+    needs_priming = True
+
+    def collect(self, watcher):
+        return watcher._update_disk_io()
+
+
+@register
+class FsCollector(Collector):
+    name = "fs"
+    interval = 10.0
+
+    def collect(self, watcher):
+        return watcher._update_fs()
+
+
+@register
+class MountsCollector(Collector):
+    name = "mounts"
+    interval = 60.0
+    timeout = 10.0
+    cost = EXPENSIVE
+
+    def probe(self):
+        from systemwatcher import SystemWatcher  # systemwatcher imports this module
+        return SystemWatcher.read_mounts()
+
+    def apply(self, watcher, value):
+        return watcher._apply_mounts(value)
+
+
+@register
+class HostCollector(Collector):
+    name = "host"
+    interval = 300.0
+    timeout = 5.0
+    cost = EXPENSIVE
+
+    def probe(self):
+        from systemwatcher import SystemWatcher  # systemwatcher imports this module
+        return SystemWatcher.read_host()
+
+    def apply(self, watcher, value):
+        return watcher._apply_host(value)
+
+
+@register
+class InternetCollector(Collector):
+    name = "internet"
+    interval = 60.0
+    timeout = 5.0
+    cost = EXPENSIVE
+
+    def read(self, watcher):
+        return watcher.read_internet()
+
+    def apply(self, watcher, value):
+        return watcher._apply_internet(value)
+
+
+@register
+class MachinesCollector(Collector):
+    """
+    Checks that remote machines accept TCP connections.
+    Machines are given as "ip" or "ip:port" (default port [DEFAULT_PORT]).
+    """
+    name = "machines"
+    interval = 60.0
+    timeout = 10.0
+    cost = EXPENSIVE
+    DEFAULT_PORT = 22
+
+    def __init__(self, interval: float = None, timeout: float = None, machines: list = None):
+        super(MachinesCollector, self).__init__(interval, timeout)
+        self.machines = []
+        self.set_machines(machines)
+
+    def set_machines(self, machines: list):
+        """
+        :param machines: list of "ip" or "ip:port"
+        """
+        parsed = []
+        for m in machines or []:
+            ip, _, port = m.strip().partition(":")
+            if ip:
+                parsed.append((ip, int(port) if port else MachinesCollector.DEFAULT_PORT))
+        self.machines = parsed
+
+    def probe(self):
+        per_machine = self.timeout / max(1, len(self.machines))
+        return [customtypes.Machine(ip, ip, port, "TCP", self.probe_machine(ip, port, per_machine))
+                for ip, port in self.machines]
+
+    def apply(self, watcher, value):
+        values_updated = []
+        watcher.system_info.machines = watcher.prop_delta(
+            "machines", watcher.system_info.machines, value, values_updated)
+        return values_updated
+
+    @staticmethod
+    def probe_machine(ip: str, port: int, timeout: float):
+        try:
+            with socket.create_connection((ip, port), timeout=timeout):
+                return True
+        except OSError:
+            return False
+
+
+def create_collectors(config: configparser.ConfigParser = None):
+    """
+    Creates one instance of every registered collector.
+    Intervals and timeouts can be overridden in config section [collectors] as "interval, timeout"
+    (interval 0 disables the collector). The machines to check are read from [app] check_machines_online.
+    :param config: the app config. None = registry defaults
+    :return: a list of [Collector]
+    """
+    ret = []
+    for name, cls in COLLECTORS.items():
+        interval, timeout = None, None
+        if config is not None and config.has_option("collectors", name):
+            val = [v.strip() for v in config.get("collectors", name).split(",")]
+            interval = float(val[0])
+            timeout = float(val[1]) if len(val) > 1 and val[1] else None
+            if interval <= 0:
+                logger.info("collector '{}' disabled".format(name))
+                continue
+        if cls is MachinesCollector:
+            machines = config.get("app", "check_machines_online", fallback="").split(",") if config else []
+            ret.append(cls(interval, timeout, machines))
+        else:
+            ret.append(cls(interval, timeout))
+    return ret
@@ -1,7 +1,31 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import collections
 import configparser
+import logging
+import os
+import threading
+
+import alerting
+import archive
+
+logger = logging.getLogger(__name__)
+
+TRUE_VALUES = ["True", "true", "1", "yes", "y"]
+
+# Typed, immutable snapshot of config.ini. See [load_config]
+Thresholds = collections.namedtuple("Thresholds", ["cpu_temp", "cpu_load", "disk_percent", "memory_percent",
+                                                   "disk_full_horizon"])
+Report = collections.namedtuple("Report", ["enabled", "interval"])
+Mqtt = collections.namedtuple("Mqtt", ["broker_ip", "broker_port", "broker_user", "broker_pwd",
+                                       "topic_alive", "topic_cpu_temp", "topic_cpu_load", "topic_internet",
+                                       "topic_disk_percent", "topic_memory_percent", "topic_sample",
+                                       "topic_self_metrics"])
+AppConfig = collections.namedtuple("AppConfig", ["parser", "name", "storage", "machines", "thresholds",
+                                                 "forecast_half_life", "mqtt_report", "email_report", "mqtt",
+                                                 "push_address", "push_port", "instrumentation",
+                                                 "sample_interval", "store_interval"])
 
 
 def config_section_map(config: configparser.ConfigParser, section: str) -> dict:
@@ -23,8 +47,172 @@ def config_section_map(config: configparser.ConfigParser, section: str) -> dict:
 
 
 def get_report(config: configparser.ConfigParser, name: str):
-    val = config.get("reports", name).split(",")
-    return val[0] in ["True", "true", "1", "yes", "y"], int(val[1])
+    return parse_report(config.get("reports", name))
+
+
+def parse_report(text: str) -> Report:
+    """
+    :param text: "[bool], [interval in seconds]". Example: "True, 3600"
+    :return: a [Report]
+    """
+    val = text.split(",")
+    return Report(val[0].strip() in TRUE_VALUES, int(val[1]))
+
+
+def read_config(filename: str) -> configparser.ConfigParser:
+    config = configparser.ConfigParser(inline_comment_prefixes=(";", "#"))
+    if not config.read(filename):
+        raise ValueError("Cannot read config file " + filename)
+    return config
+
+
+def load_config(filename: str) -> AppConfig:
+    """
+    Reads and validates config.ini once into an immutable [AppConfig] snapshot, so the hot paths
+    never parse strings. All problems are collected and raised together.
+    The [parser] field holds the raw ConfigParser for settings that are only read at startup.
+    :param filename: path to config.ini
+    :return: an [AppConfig]
+    :raises ValueError: if the file cannot be read or a value is missing or invalid
+    """
+    config = read_config(filename)
+    errors = []
+
+    def value(convert, section, option, fallback=None, check=None, rule=""):
+        try:
+            if fallback is not None and not config.has_option(section, option):
+                return fallback
+            ret = convert(config.get(section, option))
+        except (configparser.Error, ValueError, IndexError) as e:
+            errors.append("[{}] {}: {}".format(section, option, e))
+            return fallback
+        if check is not None and not check(ret):
+            errors.append("[{}] {}: {} {}".format(section, option, ret, rule))
+        return ret
+
+    def text(section, option):
+        return config.get(section, option, fallback="").strip()
+
+    def positive(v):
+        return v > 0
+
+    machines = tuple(m.strip() for m in text("app", "check_machines_online").split(",") if m.strip())
+    for m in machines:
+        if not m.partition(":")[2].isdigit() and ":" in m:
+            errors.append("[app] check_machines_online: {} is not ip or ip:port".format(m))
+    value(alerting.parse_tiers, "alerts", "tiers", alerting.DEFAULT_TIERS)
+    for option in config.options("alerts") if config.has_section("alerts") else []:
+        if option.startswith("rate_limit"):
+            value(float, "alerts", option, check=lambda v: v >= 0, rule="must be >= 0")
+    value(int, "collectors", "worker_processes", 0, lambda v: v >= 0, "must be >= 0")
+    value(int, "collector", "max_pending", 100000, positive, "must be > 0")
+    value(str.strip, "archive", "codec", "zlib", lambda v: v in archive.CODECS, "must be zlib or lzma")
+    value(int, "archive", "level", 6, lambda v: 0 <= v <= 9, "must be 0-9")
+    storage = value(lambda v: v.strip().lower(), "app", "storage", "text", lambda v: v in ("text", "sqlite"),
+                    "must be text or sqlite")
+    cfg = AppConfig(
+        config,
+        value(str.strip, "app", "name"),
+        storage,
+        machines,
+        Thresholds(value(int, "warning_thresholds", "cpu_temp"),
+                   value(int, "warning_thresholds", "cpu_utilization_percent"),
+                   value(int, "warning_thresholds", "disk_used_percent"),
+                   value(int, "warning_thresholds", "memory_utilization"),
+                   value(int, "warning_thresholds", "disk_full_horizon", check=positive, rule="must be > 0")),
+        value(int, "forecast", "half_life", 0) or None,
+        value(parse_report, "reports", "publish_to_mqtt"),
+        value(parse_report, "reports", "send_emails"),
+        Mqtt(text("MQTT", "broker_ip"),
+             value(int, "MQTT", "broker_port"),
+             text("MQTT", "broker_user"),
+             text("MQTT", "broker_pwd"),
+             text("MQTT", "topic_alive"),
+             text("MQTT", "topic_cpu_temp"),
+             text("MQTT", "topic_cpu_load"),
+             text("MQTT", "topic_cpu_internet"),
+             text("MQTT", "topic_diskusagepercent"),
+             text("MQTT", "topic_memory_percent"),
+             text("MQTT", "topic_sample"),
+             text("MQTT", "topic_self_metrics")),
+        text("collector", "push_address"),
+        value(int, "collector", "push_port", 0),
+        value(lambda v: v.strip() in TRUE_VALUES, "instrumentation", "enabled", False),
+        value(float, "daemon", "sample_interval", 1.0, positive, "must be > 0"),
+        value(int, "daemon", "store_interval", 3600, positive, "must be > 0"))
+    if errors:
+        raise ValueError("Invalid config file {}:\n  {}".format(filename, "\n  ".join(errors)))
+    return cfg
+
+
+class ConfigWatcher(object):
+    """
+    Keeps an [AppConfig] snapshot of config.ini up to date without a restart.
+    A background thread checks the file's modification time every [interval] seconds; when it changed,
+    the file is loaded and validated and [current] is swapped in one assignment. Readers just take
+    [current] once per run and never see a half updated config. An invalid file is logged and ignored,
+    the previous snapshot stays in use.
+    """
+
+    def __init__(self, filename: str, interval: float = 5.0, on_change=None):
+        """
+        :param filename: path to config.ini
+        :param interval: seconds between modification time checks
+        :param on_change: callable(old AppConfig, new AppConfig), called on the watcher thread after a swap
+        :raises ValueError: if the initial config is invalid
+        """
+        self.filename = filename
+        self.interval = interval
+        self.on_change = on_change
+        self._stamp = self._file_stamp()
+        self.current = load_config(filename)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        :return: self
+        """
+        self._thread = threading.Thread(target=self._watch, daemon=True, name="config-watcher")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def reload(self):
+        """
+        Loads the file if it changed since the last load.
+        :return: True if a new snapshot was swapped in
+        """
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        try:
+            cfg = load_config(self.filename)
+        except ValueError as e:
+            logger.error("{}. Keeping the previous configuration.".format(e))
+            return False
+        old, self.current = self.current, cfg
+        logger.info("Reloaded " + self.filename)
+        if self.on_change is not None:
+            try:
+                self.on_change(old, cfg)
+            except Exception:
+                logger.error("Applying the new configuration failed", exc_info=True)
+        return True
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            self.reload()
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.filename)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
 
 
 def get_email_conf(config: configparser.ConfigParser) -> dict:
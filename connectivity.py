@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import configparser
+import http.client
+import logging
+import random
+import socket
+import struct
+import threading
+import time
+from concurrent import futures
+
+from anomaly import Ewma
+
+logger = logging.getLogger(__name__)
+Target = collections.namedtuple("Target", ["kind", "host", "port", "path"])
+
+DEFAULT_PORTS = {"tcp": 53, "dns": 53, "http": 80}
+DEFAULT_TARGETS = "tcp://8.8.8.8:53"
+
+
+def parse_target(text: str) -> Target:
+    """
+    Parses a probe target.
+     Example: tcp://8.8.8.8:53       TCP connect
+     Example: dns://1.1.1.1          DNS query over UDP (port 53)
+     Example: http://example.com/    HTTP HEAD request, any answer below 500 counts as online
+    :param text: the target as [kind]://[host]:[port]/[path]
+    :return: a [Target]
+    """
+    kind, sep, rest = text.strip().partition("://")
+    if not sep or kind not in DEFAULT_PORTS:
+        raise ValueError("Unknown probe target '{}'. Expected tcp://, dns:// or http://".format(text))
+    hostport, _, path = rest.partition("/")
+    host, _, port = hostport.partition(":")
+    return Target(kind, host, int(port) if port else DEFAULT_PORTS[kind], "/" + path)
+
+
+class ConnectivityChecker(object):
+    """
+    Decides whether the host is online by probing several targets in parallel.
+    Online means at least [quorum] targets answered. Besides the current state it keeps
+    a smoothed online ratio and round-trip-time statistics.
+    While the state stays the same, the time between probes doubles up to [max_interval];
+    any change brings it back to [min_interval]. Calling [check] in between returns the last result.
+    Every socket has its own timeout and is always closed; the process wide default timeout is not touched.
+    """
+
+    def __init__(self, targets: list = None, timeout: float = 1.0, min_interval: float = 10.0,
+                 max_interval: float = 300.0, quorum: int = 1, alpha: float = 0.1):
+        """
+        :param targets: list of [Target] (or target strings, see [parse_target])
+        :param timeout: per probe timeout in seconds
+        :param min_interval: seconds between probes after a state change
+        :param max_interval: longest time between probes while the state is stable
+        :param quorum: number of targets that must answer
+        :param alpha: EWMA weight for online ratio and rtt
+        """
+        targets = targets or [DEFAULT_TARGETS]
+        self.targets = [t if isinstance(t, Target) else parse_target(t) for t in targets]
+        self.timeout = timeout
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.quorum = max(1, min(quorum, len(self.targets)))
+        self.interval = min_interval
+        self.online = None
+        self.online_ratio = Ewma(alpha)
+        self.rtt = Ewma(alpha)  # milliseconds
+        self.rtt_min = None
+        self.rtt_max = None
+        self.probes = 0
+        self.failures = 0
+        self._next_probe = 0.0
+        self._lock = threading.Lock()
+        self._http = {}  # Target -> kept-alive HTTPConnection
+        self._executor = futures.ThreadPoolExecutor(max_workers=len(self.targets))
+
+    @classmethod
+    def from_config(cls, config: configparser.ConfigParser):
+        """
+        Reads section [internet] in config.ini
+        :return: a [ConnectivityChecker]
+        """
+        return cls([t for t in config.get("internet", "targets", fallback=DEFAULT_TARGETS).split(",") if t.strip()],
+                   config.getfloat("internet", "timeout", fallback=1.0),
+                   config.getfloat("internet", "min_interval", fallback=10.0),
+                   config.getfloat("internet", "max_interval", fallback=300.0),
+                   config.getint("internet", "quorum", fallback=1))
+
+    def check(self, force: bool = False):
+        """
+        Probes the targets if a probe is due (or [force] is set), otherwise returns the last result.
+        :return: True if online
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not force and self.online is not None and now < self._next_probe:
+                return self.online
+            results = list(self._executor.map(self._probe, self.targets))
+            online = sum(1 for r in results if r is not None) >= self.quorum
+            self._update_stats(online, [r for r in results if r is not None])
+
+            if online == self.online:
+                self.interval = min(self.interval * 2, self.max_interval)
+            else:
+                if self.online is not None or not online:
+                    log = logger.info if online else logger.warning
+                    log("Internet is {} ({} of {} targets answered)".format(
+                        "ONLINE" if online else "OFFLINE", len(self.targets) - results.count(None), len(self.targets)))
+                self.interval = self.min_interval
+            self.online = online
+            self._next_probe = now + self.interval
+            return online
+
+    def close(self):
+        """ Closes kept-alive connections and the probe threads """
+        self._executor.shutdown(wait=False)
+        for con in self._http.values():
+            con.close()
+        self._http.clear()
+
+    def _update_stats(self, online: bool, rtts: list):
+        self.probes += 1
+        if not online:
+            self.failures += 1
+        self.online_ratio.update(100.0 if online else 0.0)
+        if rtts:
+            best = min(rtts)
+            self.rtt.update(best)
+            self.rtt_min = best if self.rtt_min is None else min(self.rtt_min, best)
+            self.rtt_max = best if self.rtt_max is None else max(self.rtt_max, best)
+
+    def _probe(self, target: Target):
+        """
+        :return: round trip time in ms, or None if [target] did not answer
+        """
+        start = time.perf_counter()
+        try:
+            if target.kind == "tcp":
+                with socket.create_connection((target.host, target.port), timeout=self.timeout):
+                    pass
+            elif target.kind == "dns":
+                self._probe_dns(target)
+            else:
+                self._probe_http(target)
+            return (time.perf_counter() - start) * 1000.0
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            logger.debug("probe {}://{}:{} failed: {}".format(target.kind, target.host, target.port, e))
+            return None
+
+    def _probe_dns(self, target: Target):
+        """ Sends a DNS query for the root NS records over UDP and waits for the matching answer """
+        query_id = random.randint(0, 0xFFFF)
+        # header: id, flags (recursion desired), 1 question. Question: root name, type NS, class IN
+        packet = struct.pack(">HHHHHH", query_id, 0x0100, 1, 0, 0, 0) + b"\x00" + struct.pack(">HH", 2, 1)
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.settimeout(self.timeout)
+            s.sendto(packet, (target.host, target.port))
+            deadline = time.monotonic() + self.timeout
+            while True:
+                data = s.recv(512)
+                if len(data) >= 2 and struct.unpack(">H", data[:2])[0] == query_id:
+                    return
+                if time.monotonic() > deadline:
+                    raise socket.timeout("no matching dns answer")
+
+    def _probe_http(self, target: Target):
+        """ HEAD request on a kept-alive connection. Reconnects once if the server closed it. """
+        for attempt in range(2):
+            con = self._http.get(target)
+            if con is None:
+                con = self._http[target] = http.client.HTTPConnection(target.host, target.port, timeout=self.timeout)
+            try:
+                con.request("HEAD", target.path, headers={"Connection": "keep-alive"})
+                resp = con.getresponse()
+                resp.read()
+                if resp.status >= 500:
+                    raise http.client.HTTPException("HTTP status {}".format(resp.status))
+                return
+            except (OSError, http.client.HTTPException):
+                con.close()
+                del self._http[target]
+                if attempt:
+                    raise
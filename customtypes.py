@@ -1,9 +1,11 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import array
 import collections
 import datetime
 import logging
+import math
 import re
 
 logger = logging.getLogger(__name__)
@@ -11,31 +13,38 @@ FieldUpdates = collections.namedtuple("FieldUpdates", ["field", "old_value", "ne
 
 
 class SystemInfo(object):
+    __slots__ = ("host", "cpu", "fs", "memory", "interfaces", "machines")
+
     def __init__(self):
         self.host = Host()
         self.cpu = Cpu()
         self.fs = FsSystem()
+        self.memory = Memory()
+        self.interfaces = {}  # network interface name -> NetIo
+        self.machines = []  # remote machines, see collectors.MachinesCollector
 
 
 class Host(object):
+    __slots__ = ("ip", "os", "hostname", "mac_address", "_boot_time", "internet", "internet_ratio", "internet_rtt")
+
     def __init__(self, ip=None, os=None, hostname=None, mac_address=None, boot_time=None, internet=None):
         self.ip = ip
         self.os = os
         self.hostname = hostname
         self.mac_address = mac_address
-        self._boot_time = boot_time
+        self._boot_time = None
+        self.boot_time = boot_time
         self.internet = internet
+        self.internet_ratio = None  # smoothed percentage of successful probes
+        self.internet_rtt = None  # smoothed round trip time in ms
 
     @property
     def boot_time(self):
         """
-        Returns the boot_time as a datetime object
+        Returns the boot_time as a datetime object (converted once, when it is set)
         :return: datetime object
         """
-        if isinstance(self._boot_time, float):
-            return datetime.datetime.fromtimestamp(self._boot_time)
-        elif isinstance(self._boot_time, datetime.datetime):
-            return self._boot_time
+        return self._boot_time
 
     @boot_time.setter
     def boot_time(self, value):
@@ -44,9 +53,9 @@ class Host(object):
         :param value: a timestamp or datetime object representing the boot_time.
         :return:
         """
-        if isinstance(value, float):
+        if isinstance(value, (int, float)):
             self._boot_time = datetime.datetime.fromtimestamp(value)
-        elif isinstance(value, datetime.datetime):
+        elif isinstance(value, datetime.datetime) or value is None:
             self._boot_time = value
 
     @property
@@ -104,17 +113,23 @@ class Host(object):
 
 
 class Cpu(object):
+    __slots__ = ("temp", "load")
+
     def __init__(self, load=None, temp=None):
         self.temp = temp
         self.load = load
 
 
 class FsSystem(object):
+    __slots__ = ("total", "used", "free", "percent", "mounts", "devices")
+
     def __init__(self, _total=None, used=None, free=None, percent=None):
         self.total = _total
         self.used = used
         self.free = free
         self.percent = percent
+        self.mounts = {}  # mount point -> MountUsage
+        self.devices = {}  # block device name -> DiskIo
 
     def friendly_fs_size(self):
         """
@@ -143,19 +158,175 @@ class FsSystem(object):
         return "%.1f%s%s" % (num, 'Yi', suffix)
 
 
+class MountUsage(object):
+    __slots__ = ("mount", "total", "used", "percent", "device")
+    SEP = "¤"
+
+    def __init__(self, mount: str, total: int = None, used: int = None, percent: float = None, device: str = None):
+        self.mount = mount
+        self.total = total
+        self.used = used
+        self.percent = percent
+        self.device = device
+
+    def __eq__(self, other):
+        return isinstance(other, MountUsage) and \
+            (self.mount, self.total, self.used, self.percent) == (other.mount, other.total, other.used, other.percent)
+
+    # compared by value but mutable, so deliberately unhashable: never use them as dict keys or in sets
+    __hash__ = None
+
+    def __str__(self):
+        return "{0}{4}{1}{4}{2}{4}{3:.2f}".format(self.mount, self.total, self.used, self.percent or 0, MountUsage.SEP)
+
+    @classmethod
+    def from_text(cls, text: str):
+        try:
+            lst = text.split(MountUsage.SEP)
+            return cls(lst[0], int(lst[1]), int(lst[2]), float(lst[3]))
+        except (ValueError, IndexError):
+            logger.error("Failed to convert text string to [MountUsage] object", exc_info=True)
+            return None
+
+
+class DiskIo(object):
+    """
+    I/O of one block device since the previous poll.
+    Throughput in bytes/s, IOPS in operations/s, latency in ms per operation.
+    """
+    __slots__ = ("device", "read_bps", "write_bps", "read_iops", "write_iops", "read_latency", "write_latency",
+                 "busy_percent")
+    SEP = "¤"
+    FIELDS = ["read_bps", "write_bps", "read_iops", "write_iops", "read_latency", "write_latency", "busy_percent"]
+
+    def __init__(self, device: str, read_bps: float = 0.0, write_bps: float = 0.0, read_iops: float = 0.0,
+                 write_iops: float = 0.0, read_latency: float = 0.0, write_latency: float = 0.0,
+                 busy_percent: float = 0.0):
+        self.device = device
+        self.read_bps = read_bps
+        self.write_bps = write_bps
+        self.read_iops = read_iops
+        self.write_iops = write_iops
+        self.read_latency = read_latency
+        self.write_latency = write_latency
+        self.busy_percent = busy_percent
+
+    def __eq__(self, other):
+        return isinstance(other, DiskIo) and self.device == other.device and \
+            all(getattr(self, f) == getattr(other, f) for f in DiskIo.FIELDS)
+
+    __hash__ = None  # see MountUsage
+
+    def __str__(self):
+        return DiskIo.SEP.join([self.device] + ["{0:.2f}".format(getattr(self, f)) for f in DiskIo.FIELDS])
+
+    @classmethod
+    def from_text(cls, text: str):
+        try:
+            lst = text.split(DiskIo.SEP)
+            return cls(lst[0], *[float(v) for v in lst[1:len(DiskIo.FIELDS) + 1]])
+        except (ValueError, IndexError):
+            logger.error("Failed to convert text string to [DiskIo] object", exc_info=True)
+            return None
+
+
+class Memory(object):
+    """
+    Memory and swap usage (bytes and percent) plus pressure stall information:
+    the percentage of time (avg10) some task was stalled waiting for cpu, memory or io.
+    """
+    __slots__ = ("total", "available", "percent", "swap_total", "swap_percent", "psi_cpu", "psi_memory", "psi_io")
+    SEP = "¤"
+    FIELDS = ["total", "available", "percent", "swap_total", "swap_percent", "psi_cpu", "psi_memory", "psi_io"]
+    BYTE_FIELDS = ("total", "available", "swap_total")
+
+    def __init__(self, total: int = None, available: int = None, percent: float = None, swap_total: int = None,
+                 swap_percent: float = None, psi_cpu: float = None, psi_memory: float = None, psi_io: float = None):
+        self.total = total
+        self.available = available
+        self.percent = percent
+        self.swap_total = swap_total
+        self.swap_percent = swap_percent
+        self.psi_cpu = psi_cpu
+        self.psi_memory = psi_memory
+        self.psi_io = psi_io
+
+    def __eq__(self, other):
+        return isinstance(other, Memory) and all(getattr(self, f) == getattr(other, f) for f in Memory.FIELDS)
+
+    __hash__ = None  # see MountUsage
+
+    def __str__(self):
+        return Memory.SEP.join("" if getattr(self, f) is None else
+                               ("{0:.0f}" if f in Memory.BYTE_FIELDS else "{0:.2f}").format(getattr(self, f))
+                               for f in Memory.FIELDS)
+
+    @classmethod
+    def from_text(cls, text: str):
+        try:
+            return cls(*[float(v) if v else None for v in text.split(Memory.SEP)[:len(Memory.FIELDS)]])
+        except ValueError:
+            logger.error("Failed to convert text string to [Memory] object", exc_info=True)
+            return None
+
+
+class NetIo(object):
+    """
+    Traffic of one network interface since the previous poll.
+    Bytes/s, packets/s and errors+drops/s.
+    """
+    __slots__ = ("interface", "rx_bps", "tx_bps", "rx_pps", "tx_pps", "errors")
+    SEP = "¤"
+    FIELDS = ["rx_bps", "tx_bps", "rx_pps", "tx_pps", "errors"]
+
+    def __init__(self, interface: str, rx_bps: float = 0.0, tx_bps: float = 0.0, rx_pps: float = 0.0,
+                 tx_pps: float = 0.0, errors: float = 0.0):
+        self.interface = interface
+        self.rx_bps = rx_bps
+        self.tx_bps = tx_bps
+        self.rx_pps = rx_pps
+        self.tx_pps = tx_pps
+        self.errors = errors
+
+    def __eq__(self, other):
+        return isinstance(other, NetIo) and self.interface == other.interface and \
+            all(getattr(self, f) == getattr(other, f) for f in NetIo.FIELDS)
+
+    __hash__ = None  # see MountUsage
+
+    def __str__(self):
+        return NetIo.SEP.join([self.interface] + ["{0:.2f}".format(getattr(self, f)) for f in NetIo.FIELDS])
+
+    @classmethod
+    def from_text(cls, text: str):
+        try:
+            lst = text.split(NetIo.SEP)
+            return cls(lst[0], *[float(v) for v in lst[1:len(NetIo.FIELDS) + 1]])
+        except (ValueError, IndexError):
+            logger.error("Failed to convert text string to [NetIo] object", exc_info=True)
+            return None
+
+
 class PollData(object):
+    __slots__ = ("when", "cpu_load", "cpu_temp", "disk_usage_percent", "internet", "machines", "mounts", "devices",
+                 "memory", "interfaces")
     DATETIME_FORMAT = "%Y%m%dT%H%M"
     FIELD_PART = ","
     PERCENT_PATTERN = re.compile("^\d{1,3}\.\d{1,2}$")
 
     def __init__(self, when: datetime = None, load: float = None, temp: float = None,
-                 disk: float = None, internet: bool = None, machines=None):
+                 disk: float = None, internet: bool = None, machines=None, mounts=None, devices=None,
+                 memory=None, interfaces=None):
         self.when = when
         self.cpu_load = load
         self.cpu_temp = temp
         self.disk_usage_percent = disk
         self.internet = internet
         self.machines = machines
+        self.mounts = mounts
+        self.devices = devices
+        self.memory = memory
+        self.interfaces = interfaces
 
     @classmethod
     def from_system_info(cls, o: SystemInfo):
@@ -165,36 +336,48 @@ class PollData(object):
         c.cpu_load = o.cpu.load
         c.when = datetime.datetime.now()
         c.disk_usage_percent = o.fs.percent
-        c.machines = []
+        c.machines = list(o.machines)
+        c.mounts = list(o.fs.mounts.values())
+        c.devices = list(o.fs.devices.values())
+        c.memory = o.memory
+        c.interfaces = list(o.interfaces.values())
         return c
 
     @classmethod
     def from_text(cls, text: str):
         """
         Parses a string and converts the text to a PollData object
-         Expects this input format: {datetime;cpuload;cputemp;disk;internet;[{machines,}]}
+         Expects this input format:
+          {datetime;cpuload;cputemp;disk;internet;[{machines,}];[{mounts,}];[{devices,}];memory;[{interfaces,}]}
+         The trailing fields are optional (lines written by older versions have 6 or 8 values).
          Example: 20181010T1644;4.3;44.8;5.2;1;RPI-A¤192.168.1.170¤443¤TCP/ping¤True
+         Example: 20181010T1644;4.3;44.8;5.2;1;;/¤31000000000¤2000000000¤6.45;mmcblk0¤0.00¤4096.00¤...
         :param text:
         :return: a [PollData] object
         """
         try:
             lst = text.split(";")
-            if len(lst) != 6:
-                raise IndexError("Input was not in expected format. Expected 6 values. Got " + str(len(lst)))
+            if len(lst) not in (6, 8, 10):
+                raise IndexError("Input was not in expected format. Expected 6, 8 or 10 values. Got " + str(len(lst)))
             c = cls(
                 PollData.string_to_date(lst[0]),
                 float(lst[1]),
                 float(lst[2]),
                 float(lst[3]),
-                float(lst[4]) if PollData.PERCENT_PATTERN.match(lst[4]) else
-                lst[4] in ["1", "True", "true", "y", "yes", "yup"],
+                PollData.internet_from_text(lst[4]),
                 None)
             if len(lst[5]) > 0:
                 tmp = lst[5].split(PollData.FIELD_PART)
                 c.machines = []
                 for m in tmp:
                     c.machines.append(Machine.from_text(m))
-                c.machines = filter(None, c.machines)
+                c.machines = [m for m in c.machines if m is not None]
+            if len(lst) >= 8:
+                c.mounts = [m for m in map(MountUsage.from_text, filter(None, lst[6].split(PollData.FIELD_PART))) if m]
+                c.devices = [d for d in map(DiskIo.from_text, filter(None, lst[7].split(PollData.FIELD_PART))) if d]
+            if len(lst) >= 10:
+                c.memory = Memory.from_text(lst[8]) if lst[8] else None
+                c.interfaces = [n for n in map(NetIo.from_text, filter(None, lst[9].split(PollData.FIELD_PART))) if n]
             return c
         except ValueError as e:
             print("fuck!")
@@ -217,16 +400,56 @@ class PollData(object):
         c.cpu_load = sum(log_row.cpu_load for log_row in data) / float(len(data))
         c.cpu_temp = sum(log_row.cpu_temp for log_row in data) / float(len(data))
         c.disk_usage_percent = sum(log_row.disk_usage_percent for log_row in data) / float(len(data))
-        c.internet = sum(float(log_row.internet) for log_row in data) / float(len(data)) * 100
+        internet = PollData._mean([float(log_row.internet) for log_row in data if log_row.internet is not None])
+        c.internet = internet * 100 if internet is not None else None
+
+        # per mount and per device averages. Sizes are taken from the latest sample
+        mounts = collections.OrderedDict()
+        devices = collections.OrderedDict()
+        for log_row in data:
+            for m in log_row.mounts or []:
+                mounts.setdefault(m.mount, []).append(m)
+            for d in log_row.devices or []:
+                devices.setdefault(d.device, []).append(d)
+        c.mounts = [MountUsage(k, v[-1].total, v[-1].used, sum(m.percent for m in v) / float(len(v)))
+                    for k, v in mounts.items()]
+        c.devices = [DiskIo(k, *[sum(getattr(d, f) for d in v) / float(len(v)) for f in DiskIo.FIELDS])
+                     for k, v in devices.items()]
+
+        memory = [log_row.memory for log_row in data if log_row.memory is not None]
+        if memory:
+            c.memory = Memory(*[PollData._mean([getattr(m, f) for m in memory]) for f in Memory.FIELDS])
+        interfaces = collections.OrderedDict()
+        for log_row in data:
+            for n in log_row.interfaces or []:
+                interfaces.setdefault(n.interface, []).append(n)
+        c.interfaces = [NetIo(k, *[sum(getattr(n, f) for n in v) / float(len(v)) for f in NetIo.FIELDS])
+                        for k, v in interfaces.items()]
         return c
 
+    @staticmethod
+    def internet_from_text(s: str):
+        """
+        :return: a percentage (float) for aggregates, on/off (bool) for samples
+        """
+        return float(s) if PollData.PERCENT_PATTERN.match(s) else s in ["1", "True", "true", "y", "yes", "yup"]
+
+    @staticmethod
+    def _mean(values: list):
+        values = [v for v in values if v is not None]
+        return sum(values) / float(len(values)) if values else None
+
+    @property
+    def memory_percent(self):
+        return self.memory.percent if self.memory is not None else None
+
     def __str__(self):
         """
         Converts [self] to a text representation.
         To do the reverse, see class method PollData.from_text(...)
         :return: text string
         """
-        if self.machines is None or self.machines is not list:
+        if not self.machines:
             machines = ""
         else:
             machines = PollData.FIELD_PART.join(map(str, self.machines))
@@ -236,13 +459,17 @@ class PollData(object):
         else:
             internet = self.internet
 
-        return "{};{};{};{};{};{}".format(
+        return "{};{};{};{};{};{};{};{};{};{}".format(
             PollData.date_formatter(self.when),
             "{0:.2f}".format(self.cpu_load) if self.cpu_load is not None else 0,
             "{0:.2f}".format(self.cpu_temp) if self.cpu_temp is not None else 0,
             "{0:.2f}".format(self.disk_usage_percent) if self.disk_usage_percent is not None else 0,
             str(internet) if self.internet is not None else 0,
-            machines
+            machines,
+            PollData.FIELD_PART.join(map(str, self.mounts or [])),
+            PollData.FIELD_PART.join(map(str, self.devices or [])),
+            str(self.memory) if self.memory is not None else "",
+            PollData.FIELD_PART.join(map(str, self.interfaces or []))
         )
 
     @staticmethod
@@ -259,7 +486,153 @@ class PollData(object):
         return datetime.datetime.strptime(s, PollData.DATETIME_FORMAT)
 
 
+class PollDataBatch(object):
+    """
+    Many [PollData] samples kept as parallel typed arrays (8 bytes per value) instead of one object per sample.
+    The columns hold what rollups and charts use: when, cpu load/temp, disk usage, internet and memory usage.
+    Machines, mounts, devices, memory details and interfaces are only kept if [details] is set.
+    Missing values are stored as NaN, [when] as unix time.
+     Example:
+        batch = PollDataBatch(DataLogger.read_data_log(filename, False)[2])
+        batch.column("cpu_load")    -> array('d', [...])
+        batch[-1]                   -> a [PollData]
+        batch.aggregate()           -> the averages as a [PollData], see [aggregate]
+    """
+    __slots__ = ("details", "_columns", "_bool_internet", "_details")
+    COLUMNS = ("when", "cpu_load", "cpu_temp", "disk_usage_percent", "internet", "memory_percent")
+
+    def __init__(self, data=None, details: bool = False):
+        """
+        :param data: an iterable of [PollData]
+        :param details: also keep machines, mounts, devices, memory and interfaces of every sample
+        """
+        self.details = details
+        self._columns = {c: array.array("d") for c in PollDataBatch.COLUMNS}
+        self._bool_internet = array.array("b")  # 1 if internet was on/off, 0 if it is a percentage (aggregates)
+        self._details = [] if details else None
+        if data:
+            self.extend(data)
+
+    @classmethod
+    def from_rows(cls, rows, bool_internet: bool = True):
+        """
+        :param rows: iterable of tuples (unix time, one value per [COLUMNS] after "when"), as returned by the
+            stores' iter_columns. None = missing
+        :param bool_internet: True if [internet] holds on/off samples, False for percentages (aggregates)
+        :return: a [PollDataBatch]
+        """
+        c = cls()
+        columns = [c._columns[name] for name in PollDataBatch.COLUMNS]
+        nan = math.nan
+        for row in rows:
+            columns[0].append(row[0])
+            for column, v in zip(columns[1:], row[1:]):
+                column.append(nan if v is None else v)
+        c._bool_internet = array.array("b", [bool_internet]) * len(columns[0])
+        return c
+
+    def append(self, p: PollData):
+        c = self._columns
+        nan = math.nan
+        c["when"].append(p.when.timestamp() if p.when is not None else nan)
+        c["cpu_load"].append(p.cpu_load if p.cpu_load is not None else nan)
+        c["cpu_temp"].append(p.cpu_temp if p.cpu_temp is not None else nan)
+        c["disk_usage_percent"].append(p.disk_usage_percent if p.disk_usage_percent is not None else nan)
+        c["internet"].append(float(p.internet) if p.internet is not None else nan)
+        c["memory_percent"].append(p.memory_percent if p.memory_percent is not None else nan)
+        self._bool_internet.append(isinstance(p.internet, bool))
+        if self._details is not None:
+            self._details.append((p.machines, p.mounts, p.devices, p.memory, p.interfaces))
+
+    def extend(self, data):
+        for p in data:
+            self.append(p)
+
+    def column(self, name: str) -> array.array:
+        """
+        :param name: one of [COLUMNS]
+        :return: the values of [name] for every sample. [when] is unix time
+        """
+        return self._columns[name]
+
+    def to_list(self) -> list:
+        """
+        :return: the samples as a list of [PollData]
+        """
+        return [self._poll_data(i) for i in range(len(self))]
+
+    def aggregate(self) -> PollData:
+        """
+        With [details], the same as PollData.aggregate(self.to_list()).
+        Without, the averages are computed on the columns: mounts, devices and interfaces are not kept, so they
+        are empty, and memory only carries the average percentage. Missing values are left out of the averages,
+        and internet on/off samples count as 0 or 100 percent while percentages (aggregates) are kept as they are.
+        :return: a [PollData]. Its values are None if the batch is empty
+        """
+        if self.details:
+            return PollData.aggregate(self.to_list())
+        c = self._columns
+        internet = array.array("d", (v * 100 if on_off else v for v, on_off in zip(c["internet"], self._bool_internet)))
+        memory = PollDataBatch._nanmean(c["memory_percent"])
+        return PollData(datetime.datetime.now(),
+                        PollDataBatch._nanmean(c["cpu_load"]),
+                        PollDataBatch._nanmean(c["cpu_temp"]),
+                        PollDataBatch._nanmean(c["disk_usage_percent"]),
+                        PollDataBatch._nanmean(internet),
+                        None, [], [],
+                        Memory(percent=memory) if memory is not None else None,
+                        [])
+
+    @property
+    def nbytes(self) -> int:
+        """ memory used by the columns """
+        return sum(a.itemsize * len(a) for a in self._columns.values()) + len(self._bool_internet)
+
+    def _poll_data(self, i: int) -> PollData:
+        c = self._columns
+        when, load, temp, disk, internet, memory = [c[name][i] for name in PollDataBatch.COLUMNS]
+        p = PollData(datetime.datetime.fromtimestamp(when) if not math.isnan(when) else None,
+                     load if not math.isnan(load) else None,
+                     temp if not math.isnan(temp) else None,
+                     disk if not math.isnan(disk) else None,
+                     None if math.isnan(internet) else bool(internet) if self._bool_internet[i] else internet)
+        if self._details is not None:
+            p.machines, p.mounts, p.devices, p.memory, p.interfaces = self._details[i]
+        elif not math.isnan(memory):
+            p.memory = Memory(percent=memory)
+        return p
+
+    @staticmethod
+    def _nanmean(values):
+        values = [v for v in values if not math.isnan(v)]
+        return sum(values) / float(len(values)) if values else None
+
+    def __len__(self):
+        return len(self._bool_internet)
+
+    def __iter__(self):
+        return (self._poll_data(i) for i in range(len(self)))
+
+    def __getitem__(self, index):
+        """
+        :return: a [PollData] for an int index, a new [PollDataBatch] for a slice
+        """
+        if isinstance(index, slice):
+            ret = PollDataBatch(details=self.details)
+            ret._columns = {name: a[index] for name, a in self._columns.items()}
+            ret._bool_internet = self._bool_internet[index]
+            if self._details is not None:
+                ret._details = self._details[index]
+            return ret
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("PollDataBatch index out of range")
+        return self._poll_data(index)
+
+
 class Machine(object):
+    __slots__ = ("name", "ip", "port", "poll_method", "result")
     SEP = "¤"
 
     def __init__(self, name, ip, port: int = None, method: str = None, result: bool = False):
@@ -269,6 +642,12 @@ class Machine(object):
         self.poll_method = method
         self.result = result
 
+    def __eq__(self, other):
+        return isinstance(other, Machine) and (self.name, self.ip, self.port, self.poll_method, self.result) == \
+            (other.name, other.ip, other.port, other.poll_method, other.result)
+
+    __hash__ = None  # see MountUsage
+
     def __str__(self):
         return "{0}{5}{1}{5}{2}{5}{3}{5}{4}".format(
             self.name,
@@ -6,13 +6,14 @@ import datetime
 import logging
 import os.path
 
-from customtypes import PollData
+from customtypes import Memory, PollData
 
 logger = logging.getLogger(__name__)
 
 
 class DataLogger(object):
     NEWLINE = "\n"
+    COLUMN_INDEX = {"cpu_load": 1, "cpu_temp": 2, "disk_usage_percent": 3, "internet": 4}  # field in a data line
 
     @staticmethod
     def writeline_to_data_log(filename, data):
@@ -21,6 +22,17 @@ class DataLogger(object):
             # with open(filename, "a") as file:
             file.write(str(data) + DataLogger.NEWLINE)
 
+    @staticmethod
+    def write_self_metrics(filename, when: datetime.datetime, metrics: dict):
+        """
+        Appends Watchtorian's own timings/resource usage to the data file as one line
+         Format: {self:datetime;name=value,name=value,...}
+        [read_data_log] skips these lines and [aggregate_data_log] drops them with the raw data.
+        """
+        with codecs.open(filename, "a", "utf-8") as file:
+            file.write("self:" + when.strftime(PollData.DATETIME_FORMAT) + ";" +
+                       ",".join("{}={:.3f}".format(k, v) for k, v in metrics.items()) + DataLogger.NEWLINE)
+
     @staticmethod
     def create_data_log(filename,
                         overwrite: bool = False,
@@ -58,8 +70,8 @@ class DataLogger(object):
             file.write("#" + DataLogger.NEWLINE)
             file.write("#" + DataLogger.NEWLINE)
 
-            file.write("# data aggregate format {aggregate:datetime;cpu_load%;cpu_temp;disk%;internet%;notUsed" +
-                       DataLogger.NEWLINE)
+            file.write("# data aggregate format {aggregate:datetime;cpu_load%;cpu_temp;disk%;internet%;notUsed;"
+                       "[{mounts}];[{devices}];memory;[{interfaces}]" + DataLogger.NEWLINE)
 
             # if isinstance(x,(list,)):
             if aggregate_data is not None and isinstance(aggregate_data, (list,)):
@@ -70,7 +82,8 @@ class DataLogger(object):
             file.write("#" + DataLogger.NEWLINE)
             file.write("#" + DataLogger.NEWLINE)
 
-            file.write("# data format {datetime;cpuload;cputemp;disk;internet;[{machines}]}" + DataLogger.NEWLINE)
+            file.write("# data format {datetime;cpuload;cputemp;disk;internet;[{machines}];[{mounts}];[{devices}];"
+                       "memory;[{interfaces}]}" + DataLogger.NEWLINE)
             if data is not None and isinstance(data, (list,)):
                 for d in data:
                     file.write(str(d) + DataLogger.NEWLINE)
@@ -118,6 +131,134 @@ class DataLogger(object):
             raise ValueError("mqtt last sent date was not found in file " + filename)
         return email_sent, mqtt, data, aggregate_data
 
+    @staticmethod
+    def read_aggregates(filename, start: datetime = None):
+        """
+        Reads the aggregate rows from [start] on, without parsing the samples.
+        Only the aggregate lines at or after [start] are parsed; reading stops where the samples begin.
+        Will throw ValueError() exception if the data log is missing.
+
+        :param filename: path and filename to data log
+        :param start: first period to read. None = all of them
+        :return: a list of [PollData] objects, oldest first
+        """
+        if not os.path.isfile(filename):
+            raise ValueError("Data log {} was not found".format(filename))
+        first = start.strftime(PollData.DATETIME_FORMAT) if start is not None else None
+        ret = []
+        with open(filename, "r", encoding="utf-8") as file:
+            for line in file:
+                if line[:1].isdigit():
+                    break  # the samples follow the aggregates
+                if not line.startswith("aggregate:"):
+                    continue
+                line = line[len("aggregate:"):].strip()
+                if first is not None and line[:len("YYYYmmddTHHMM")] < first:
+                    continue
+                ret.append(PollData.from_text(line))
+        return sorted((a for a in ret if a is not None), key=lambda x: x.when)
+
+    @staticmethod
+    def iter_columns(filename, metrics: list, resolution: str = "raw", start: datetime = None,
+                     end: datetime = None, host: str = None):
+        """
+        Streams [metrics] of the samples ("raw") or the aggregates ("rollup") in [start, end), oldest first.
+        The file is read one line at a time. It has no index, but every line starts with a fixed width
+        timestamp: lines outside the range are skipped without being parsed. The samples are written
+        in time order, so reading stops at the first sample at or after [end]. The aggregates of logs written
+        by older versions are not always in time order: all of them are checked and the matches are sorted.
+
+        :param filename: path and filename to data log
+        :param metrics: names from PollDataBatch.COLUMNS, except "when"
+        :param resolution: "raw" or "rollup"
+        :param host: not used, a text data log only holds one host
+        :return: a generator of tuples (unix time, one value per metric). Missing values are None
+        """
+        unknown = [m for m in metrics if m not in DataLogger.COLUMN_INDEX and m != "memory_percent"]
+        if unknown:
+            raise ValueError("Unknown metric(s) " + ", ".join(unknown))
+        first = start.strftime(PollData.DATETIME_FORMAT) if start is not None else None
+        last = end.strftime(PollData.DATETIME_FORMAT) if end is not None else None
+        if resolution == "rollup":
+            # a few rows per report period, sorting them is cheap
+            yield from sorted(DataLogger._iter_rows(filename, metrics, True, first, last), key=lambda r: r[0])
+        else:
+            yield from DataLogger._iter_rows(filename, metrics, False, first, last)
+
+    @staticmethod
+    def _iter_rows(filename, metrics: list, rollup: bool, first: str, last: str):
+        """
+        The rows of [iter_columns] in file order.
+        :param first: timestamp text of [start], or None
+        :param last: timestamp text of [end], or None
+        """
+        # io's line iteration and a fixed width date parse, codecs and strptime take most of the time otherwise
+        with open(filename, "r", encoding="utf-8") as file:
+            for line in file:
+                if rollup:
+                    if line[:1].isdigit():
+                        break  # the samples follow the aggregates
+                    if not line.startswith("aggregate:"):
+                        continue
+                    line = line[len("aggregate:"):]
+                elif not line[:1].isdigit():
+                    continue
+                stamp = line[:len("YYYYmmddTHHMM")]
+                if first is not None and stamp < first:
+                    continue
+                if last is not None and stamp >= last:
+                    if rollup:
+                        continue  # the aggregates may be out of order
+                    break
+                lst = line.rstrip().split(";")
+                try:
+                    if len(lst[0]) != len(stamp) or stamp[8] != "T":
+                        raise ValueError("Unexpected date " + stamp)
+                    row = (datetime.datetime(int(stamp[:4]), int(stamp[4:6]), int(stamp[6:8]),
+                                             int(stamp[9:11]), int(stamp[11:13])).timestamp(),) + \
+                        tuple(DataLogger._column(lst, m) for m in metrics)
+                except (ValueError, IndexError):
+                    logger.error("Failed to parse data line: " + line.rstrip())
+                    continue
+                yield row
+
+    @staticmethod
+    def _column(lst: list, metric: str):
+        if metric == "memory_percent":
+            memory = Memory.from_text(lst[8]) if len(lst) >= 10 and lst[8] else None
+            return memory.percent if memory is not None else None
+        if metric == "internet":
+            return float(PollData.internet_from_text(lst[4]))
+        return float(lst[DataLogger.COLUMN_INDEX[metric]])
+
+    @staticmethod
+    def aggregate_data_log(filename, archive=None):
+        """
+        Compute data aggregate for whole period (since last email report)
+        and save a new file that ONLY holds the aggregate data.
+        The report history is reset to now as a side effect.
+
+        :param filename: path and filename to data log
+        :param archive: a [SegmentArchive] that keeps the samples of the period. None = drop them
+        :return: the aggregate as a [PollData] object
+        """
+        # Load the entire data file
+        df = DataLogger.read_data_log(filename, False)
+        if archive is not None:
+            try:
+                archive.write_segment(df[2])
+            except (OSError, ValueError, OverflowError):
+                logger.error("Failed to archive the samples of the period", exc_info=True)
+
+        # compute the average for all existing data
+        aggregate = PollData.aggregate(df[2])
+        df[3].append(aggregate)
+
+        # save a new file with ONLY the aggregate data
+        now = datetime.datetime.now()
+        DataLogger.create_data_log(filename, True, now, now, None, df[3])
+        return aggregate
+
     @staticmethod
     def _parse_history_line(line: str):
         email_sent = None
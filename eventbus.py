@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import logging
+import threading
+
+from customtypes import FieldUpdates
+
+logger = logging.getLogger(__name__)
+
+# What a subscription does when its queue is full
+DROP_OLDEST = "drop_oldest"  # discard the oldest queued notification
+COALESCE = "coalesce"  # merge the new notification into the newest queued one
+BLOCK = "block"  # make the publisher wait (up to [block_timeout]) for room
+POLICIES = (DROP_OLDEST, COALESCE, BLOCK)
+
+
+class Subscription(object):
+    """
+    One subscriber of an [EventBus]. Owns a bounded queue and a worker thread that calls
+    [handler], so a slow handler only ever delays itself.
+    """
+
+    def __init__(self, handler, fields=None, policy: str = DROP_OLDEST, maxsize: int = 100,
+                 block_timeout: float = None):
+        """
+        :param handler: callable, gets the same arguments that were published
+        :param fields: only deliver [FieldUpdates] for these field names. None = everything
+        :param policy: DROP_OLDEST, COALESCE or BLOCK
+        :param maxsize: number of queued notifications before [policy] kicks in
+        :param block_timeout: longest time (seconds) a BLOCK subscription holds up the publisher. None = forever
+        """
+        if policy not in POLICIES:
+            raise ValueError("Unknown backpressure policy '{}'. Expected one of {}".format(policy, POLICIES))
+        self.handler = handler
+        self.fields = frozenset(fields) if fields is not None else None
+        self.policy = policy
+        self.maxsize = max(1, maxsize)
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._run = True
+        self._thread = threading.Thread(target=self._dispatch, daemon=True,
+                                        name="event-" + getattr(handler, "__name__", "handler"))
+        self._thread.start()
+
+    def offer(self, args: tuple, kwargs: dict):
+        """
+        Queues one notification according to [fields] and [policy]. Never calls [handler] directly.
+        :return: None
+        """
+        if self.fields is not None:
+            args = self._filter(args)
+            if args is None:
+                return
+        with self._cond:
+            if len(self._queue) >= self.maxsize:
+                if self.policy == COALESCE:
+                    self._queue[-1] = self._merge(self._queue[-1], (args, kwargs))
+                    self._cond.notify()
+                    return
+                if self.policy == BLOCK:
+                    if not self._cond.wait_for(lambda: len(self._queue) < self.maxsize or not self._run,
+                                               self.block_timeout):
+                        self.dropped += 1
+                        return
+                else:
+                    self._queue.popleft()
+                    self.dropped += 1
+            self._queue.append((args, kwargs))
+            self._cond.notify_all()
+
+    def close(self, wait: bool = False):
+        """
+        Stops the worker thread. Queued notifications are delivered first if [wait] is set.
+        """
+        with self._cond:
+            if not wait:
+                self._queue.clear()
+            self._run = False
+            self._cond.notify_all()
+        if wait and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or not self._run)
+                if not self._queue:
+                    return
+                args, kwargs = self._queue.popleft()
+                self._cond.notify_all()  # room for a blocked publisher
+            try:
+                self.handler(*args, **kwargs)
+            except Exception:
+                logger.error("Event handler {} failed".format(self.handler), exc_info=True)
+
+    def _filter(self, args: tuple):
+        """
+        Keeps only the [FieldUpdates] in [fields].
+        :return: the filtered args, or None if nothing is left for this subscriber
+        """
+        if not args or not isinstance(args[0], list):
+            return args
+        updates = [u for u in args[0] if not isinstance(u, FieldUpdates) or u.field in self.fields]
+        if not updates:
+            return None
+        return (updates,) + args[1:]
+
+    @staticmethod
+    def _merge(older, newer):
+        """
+        Merges two notifications. Lists of [FieldUpdates] are merged per field (first old value,
+        last new value); anything else is simply replaced by the newer notification.
+        """
+        (o_args, o_kwargs), (n_args, n_kwargs) = older, newer
+        if o_args and n_args and isinstance(o_args[0], list) and isinstance(n_args[0], list):
+            merged = collections.OrderedDict((u.field, u) for u in o_args[0] if isinstance(u, FieldUpdates))
+            for u in n_args[0]:
+                if isinstance(u, FieldUpdates) and u.field in merged:
+                    merged[u.field] = FieldUpdates(u.field, merged[u.field].old_value, u.new_value)
+                elif isinstance(u, FieldUpdates):
+                    merged[u.field] = u
+            return (list(merged.values()),) + n_args[1:], n_kwargs
+        return newer
+
+
+class EventBus(object):
+    """
+    Publishes notifications to subscribers asynchronously. [publish] only queues,
+    each [Subscription] delivers on its own thread with its own backpressure policy.
+    Operators: bus += handler (subscribe), bus -= handler (unsubscribe), bus(...) (publish), len(bus) (subscribers)
+    """
+
+    def __init__(self, maxsize: int = 100, policy: str = DROP_OLDEST):
+        """
+        :param maxsize: default queue size of new subscriptions
+        :param policy: default backpressure policy of new subscriptions
+        """
+        self.maxsize = maxsize
+        self.policy = policy
+        self._subscriptions = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, handler, fields=None, policy: str = None, maxsize: int = None, block_timeout: float = None):
+        """
+        :param handler: callable, gets the published arguments
+        :param fields: only deliver changes of these fields (see [Subscription])
+        :param policy: DROP_OLDEST, COALESCE or BLOCK. None = the bus default
+        :param maxsize: queue size. None = the bus default
+        :param block_timeout: see [Subscription]
+        :return: the [Subscription]
+        """
+        sub = Subscription(handler, fields, policy or self.policy, maxsize or self.maxsize, block_timeout)
+        with self._lock:
+            self._subscriptions = self._subscriptions + [sub]
+        return sub
+
+    def unsubscribe(self, handler):
+        """
+        :param handler: a handler or a [Subscription]
+        :return: self
+        """
+        with self._lock:
+            found = [s for s in self._subscriptions if s is handler or s.handler == handler]
+            if not found:
+                raise ValueError("Handler is not handling this event, so cannot unhandle it.")
+            self._subscriptions = [s for s in self._subscriptions if s not in found]
+        for s in found:
+            s.close()
+        return self
+
+    def publish(self, *args, **kwargs):
+        """ Queues a notification for every subscriber. Returns immediately unless a BLOCK subscriber is full. """
+        for sub in self._subscriptions:  # copy-on-write list, safe to iterate without the lock
+            sub.offer(args, kwargs)
+
+    def close(self, wait: bool = False):
+        """ Stops all subscriptions """
+        with self._lock:
+            subs, self._subscriptions = self._subscriptions, []
+        for s in subs:
+            s.close(wait)
+
+    def handle(self, handler):
+        self.subscribe(handler)
+        return self
+
+    def get_handler_count(self):
+        return len(self._subscriptions)
+
+    __iadd__ = handle
+    __isub__ = unsubscribe
+    __call__ = publish
+    __len__ = get_handler_count
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from customtypes import SystemInfo
+from eventbus import COALESCE
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+PREFIX = "watchtorian_"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class _Family(object):
+    """ Lines of one metric family: # HELP, # TYPE and one sample per label set """
+
+    def __init__(self, name: str, help_text: str, kind: str = "gauge"):
+        self.name = PREFIX + name
+        self.lines = ["# HELP {} {}".format(self.name, help_text), "# TYPE {} {}".format(self.name, kind)]
+        self.empty = True
+
+    def add(self, value, **labels):
+        """ Adds a sample. None values (not measured yet) are skipped. """
+        if value is None:
+            return self
+        if isinstance(value, bool):
+            value = 1 if value else 0
+        label_text = ",".join("{}=\"{}\"".format(k, _escape(v)) for k, v in sorted(labels.items()))
+        self.lines.append("{}{} {}".format(self.name, "{" + label_text + "}" if label_text else "", repr(float(value))))
+        self.empty = False
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, a scraper reuses its connection
+    disable_nagle_algorithm = True  # headers and body are separate writes
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.server.exporter.body
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # one line per scrape would flood the log
+
+
+class MetricsExporter(object):
+    """
+    Serves the latest [SystemInfo] and rollups of a running [SystemWatcher] in Prometheus text format.
+    The page is rendered once per [ValueChanged] notification (on the event bus thread, coalesced) and kept
+    as bytes, so a scrape only copies a buffer: it never runs a collector or touches the polling thread.
+     Example:
+        exporter = MetricsExporter(swo, "RPI-B", "0.0.0.0", 9101).start()
+        curl http://localhost:9101/metrics
+    """
+
+    def __init__(self, watcher, host: str, address: str = "0.0.0.0", port: int = 9101):
+        """
+        :param watcher: the [SystemWatcher] to export
+        :param host: value of the host label
+        :param address: address to listen on
+        :param port: TCP port to listen on
+        """
+        self.watcher = watcher
+        self.host = host
+        self.address = address
+        self.port = port
+        self.body = b""  # the pre-rendered page, replaced as a whole
+        self._rollups = []
+        self._server = None
+        self._subscription = None
+
+    def start(self):
+        """
+        Renders the first page, subscribes to [ValueChanged] and starts the HTTP server thread.
+        :return: self
+        """
+        self.refresh()
+        self._subscription = self.watcher.ValueChanged.subscribe(self.refresh, policy=COALESCE, maxsize=1)
+        self._server = ThreadingHTTPServer((self.address, self.port), _Handler)
+        self._server.daemon_threads = True
+        self._server.exporter = self
+        threading.Thread(target=self._server.serve_forever, daemon=True, name="exporter").start()
+        logger.info("Serving metrics on http://{}:{}/metrics".format(self.address, self._server.server_port))
+        return self
+
+    def stop(self):
+        if self._subscription is not None:
+            self.watcher.ValueChanged.unsubscribe(self._subscription)
+            self._subscription = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def set_rollups(self, rollups: list):
+        """
+        Replaces the exported rollups and renders the page again.
+        :param rollups: aggregate [PollData] rows oldest first, as returned by the stores' [read_aggregates]
+        """
+        self._rollups = list(rollups or [])
+        self.refresh()
+
+    def refresh(self, *args):
+        """ Renders the page. Called by [ValueChanged], arguments are ignored. """
+        try:
+            self.body = self.render(self.watcher.system_info, self._rollups).encode("utf-8")
+        except Exception:
+            logger.error("Rendering metrics failed", exc_info=True)
+
+    def render(self, si: SystemInfo, rollups: list) -> str:
+        """
+        :return: [si] and the newest of [rollups] in Prometheus text exposition format
+        """
+        h = self.host
+        families = [
+            _Family("up", "1 while the watcher is running").add(1, host=h),
+            _Family("last_update_timestamp_seconds", "Time the page was rendered").add(time.time(), host=h),
+            _Family("cpu_load_percent", "CPU utilization").add(si.cpu.load, host=h),
+            _Family("cpu_temp_celsius", "CPU temperature").add(si.cpu.temp, host=h),
+            _Family("boot_time_seconds", "Boot time of the host").add(
+                si.host.boot_time.timestamp() if si.host.boot_time else None, host=h),
+            _Family("internet_up", "1 if the connectivity check passed").add(si.host.internet, host=h),
+            _Family("internet_online_ratio_percent", "Smoothed share of passed connectivity checks").add(
+                si.host.internet_ratio, host=h),
+            _Family("internet_rtt_milliseconds", "Smoothed round trip time of the connectivity probes").add(
+                si.host.internet_rtt, host=h),
+            _Family("disk_used_percent", "Disk usage of the working directory").add(si.fs.percent, host=h),
+            _Family("disk_used_bytes", "Disk usage of the working directory").add(si.fs.used, host=h),
+            _Family("disk_size_bytes", "Disk size of the working directory").add(si.fs.total, host=h),
+        ]
+
+        mount_pct = _Family("mount_used_percent", "Usage of a mount")
+        mount_used = _Family("mount_used_bytes", "Usage of a mount")
+        mount_size = _Family("mount_size_bytes", "Size of a mount")
+        for m in (si.fs.mounts or {}).values():
+            mount_pct.add(m.percent, host=h, mount=m.mount, device=m.device)
+            mount_used.add(m.used, host=h, mount=m.mount, device=m.device)
+            mount_size.add(m.total, host=h, mount=m.mount, device=m.device)
+        families += [mount_pct, mount_used, mount_size]
+
+        dev_fields = [("read_bps", "device_read_bytes_per_second", "Bytes read per second"),
+                      ("write_bps", "device_write_bytes_per_second", "Bytes written per second"),
+                      ("read_iops", "device_reads_per_second", "Read operations per second"),
+                      ("write_iops", "device_writes_per_second", "Write operations per second"),
+                      ("read_latency", "device_read_latency_milliseconds", "Average time per read"),
+                      ("write_latency", "device_write_latency_milliseconds", "Average time per write"),
+                      ("busy_percent", "device_busy_percent", "Share of time the device was busy")]
+        for attr, name, help_text in dev_fields:
+            f = _Family(name, help_text)
+            for d in (si.fs.devices or {}).values():
+                f.add(getattr(d, attr), host=h, device=d.device)
+            families.append(f)
+
+        mem = si.memory
+        families += [
+            _Family("memory_size_bytes", "Total memory").add(mem.total, host=h),
+            _Family("memory_available_bytes", "Available memory").add(mem.available, host=h),
+            _Family("memory_used_percent", "Memory usage").add(mem.percent, host=h),
+            _Family("swap_size_bytes", "Total swap").add(mem.swap_total, host=h),
+            _Family("swap_used_percent", "Swap usage").add(mem.swap_percent, host=h),
+            _Family("pressure_some_percent", "Share of the last 10s some task was stalled (PSI)")
+                .add(mem.psi_cpu, host=h, resource="cpu")
+                .add(mem.psi_memory, host=h, resource="memory")
+                .add(mem.psi_io, host=h, resource="io"),
+        ]
+
+        net_fields = [("rx_bps", "network_receive_bytes_per_second", "Bytes received per second"),
+                      ("tx_bps", "network_transmit_bytes_per_second", "Bytes sent per second"),
+                      ("rx_pps", "network_receive_packets_per_second", "Packets received per second"),
+                      ("tx_pps", "network_transmit_packets_per_second", "Packets sent per second"),
+                      ("errors", "network_errors_per_second", "Errors and drops per second")]
+        for attr, name, help_text in net_fields:
+            f = _Family(name, help_text)
+            for n in (si.interfaces or {}).values():
+                f.add(getattr(n, attr), host=h, interface=n.interface)
+            families.append(f)
+
+        machines = _Family("machine_up", "1 if the remote machine accepted a connection")
+        for m in si.machines or []:
+            machines.add(m.result, host=h, machine=m.name, ip=m.ip, port=m.port)
+        families.append(machines)
+
+        if rollups:
+            r = rollups[-1]
+            families += [
+                _Family("rollup_period_end_timestamp_seconds", "End of the last report period (unix time)")
+                    .add(r.when.timestamp() if r.when is not None else None, host=h),
+                _Family("rollup_cpu_load_percent", "Average CPU utilization of the last report period")
+                    .add(r.cpu_load, host=h),
+                _Family("rollup_cpu_temp_celsius", "Average CPU temperature of the last report period")
+                    .add(r.cpu_temp, host=h),
+                _Family("rollup_disk_used_percent", "Average disk usage of the last report period")
+                    .add(r.disk_usage_percent, host=h),
+                _Family("rollup_internet_up_percent", "Internet uptime of the last report period")
+                    .add(r.internet, host=h),
+                _Family("rollup_memory_used_percent", "Average memory usage of the last report period")
+                    .add(r.memory_percent, host=h),
+            ]
+
+        return "\n".join(line for f in families if not f.empty for line in f.lines) + "\n"
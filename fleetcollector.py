@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import logging
+import socket
+import socketserver
+import threading
+
+from customtypes import PollData
+from mqtthelper import mqtt_subscribe
+
+logger = logging.getLogger(__name__)
+
+
+class FleetCollector(object):
+    """
+    Ingests [PollData] samples from many Watchtorian agents and stores them per host
+    in a shared [SqliteDataLogger]. Samples can arrive over MQTT ([subscribe_mqtt])
+    and/or as lines pushed to a local TCP socket ([listen]).
+    Incoming samples are queued and written in batches by a background thread,
+    so ingesting never waits on the database. At most [max_pending] samples are queued: if the writer
+    falls behind (e.g. the database is locked), new samples are dropped and counted in [dropped].
+    """
+    HOST_SEP = ";"
+
+    def __init__(self, store, filename, batch_size: int = 1000, flush_interval: float = 1.0,
+                 max_pending: int = 100000):
+        """
+        :param store: a [SqliteDataLogger]. Its host name is used for the fleet report history.
+        :param filename: path and filename to the database
+        :param batch_size: flush as soon as this many samples are waiting
+        :param flush_interval: flush at least this often (seconds)
+        :param max_pending: most samples kept waiting for the writer, more are dropped
+        """
+        self._store = store
+        self._filename = filename
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max(batch_size, max_pending)
+        self._pending = collections.deque()
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._run = False
+        self._mqtt_client = None
+        self._server = None
+        self.received = 0
+        self.rejected = 0
+        self.dropped = 0
+
+    def start(self):
+        """
+        Starts the background writer.
+        :return: self
+        """
+        self._store.create_data_log(self._filename)
+        self._run = True
+        self._thread = threading.Thread(target=self._writer, name="fleet-writer", daemon=True)
+        self._thread.start()
+        logger.info("FleetCollector started (batch_size={}, flush_interval={})".format(
+            self.batch_size, self.flush_interval))
+        return self
+
+    def stop(self):
+        """
+        Stops MQTT and socket ingest, then writes whatever is still queued.
+        :return: self
+        """
+        if self._mqtt_client is not None:
+            self._mqtt_client.loop_stop()
+            self._mqtt_client.disconnect()
+            self._mqtt_client = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._thread is not None:
+            self._run = False
+            self._wakeup.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        logger.info("FleetCollector stopped. received={}, rejected={}, dropped={}".format(
+            self.received, self.rejected, self.dropped))
+        return self
+
+    def ingest(self, host: str, text: str):
+        """
+        Queues one sample for [host].
+        :param host: name of the agent that sent the sample
+        :param text: a sample in [PollData] text format
+        :return: True if the sample was accepted
+        """
+        if len(self._pending) >= self.max_pending:
+            if not self.dropped % 1000:
+                logger.warning("{} samples queued, the writer is behind. Dropping samples ({} so far)".format(
+                    len(self._pending), self.dropped + 1))
+            self.dropped += 1
+            self._wakeup.set()
+            return False
+        try:
+            data = PollData.from_text(text.strip()) if host else None
+        except IndexError:
+            data = None  # wrong number of fields
+        if data is None:
+            self.rejected += 1
+            return False
+        self._pending.append((host, data))
+        self.received += 1
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def ingest_line(self, line: str):
+        """
+        Queues one pushed line. Expected format: {host;PollData text}
+         Example: RPI-B;20181010T1644;4.3;44.8;5.2;1;
+        :return: True if the sample was accepted
+        """
+        host, _, text = line.partition(FleetCollector.HOST_SEP)
+        return self.ingest(host.strip(), text)
+
+    def flush(self):
+        """
+        Writes all queued samples in a single transaction.
+        :return: number of samples written
+        """
+        with self._flush_lock:
+            batches = collections.OrderedDict()
+            count = 0
+            try:
+                while True:
+                    host, data = self._pending.popleft()
+                    batches.setdefault(host, []).append(data)
+                    count += 1
+            except IndexError:
+                pass  # queue drained
+            if count:
+                self._store.write_host_batches(self._filename, batches)
+                logger.debug("wrote {} samples from {} hosts".format(count, len(batches)))
+            return count
+
+    def subscribe_mqtt(self, topic: str, broker_address: str, port=1883, user=None, pwd=None, client_id=None):
+        """
+        Ingests samples published by agents. The host name is taken from the
+        topic level where [topic] has its single level wildcard.
+         Example: topic "watchtorian/+/sample" accepts "watchtorian/RPI-B/sample" as host RPI-B
+        :return: self
+        """
+        levels = topic.split("/")
+        host_level = levels.index("+") if "+" in levels else None
+
+        def on_message(msg_topic, payload):
+            if host_level is None:
+                self.ingest_line(payload.decode("utf-8", "replace"))
+            else:
+                self.ingest(msg_topic.split("/")[host_level], payload.decode("utf-8", "replace"))
+
+        self._mqtt_client = mqtt_subscribe([topic], on_message, broker_address, port, user, pwd, client_id)
+        return self
+
+    def listen(self, address: str, port: int):
+        """
+        Accepts pushed samples on a TCP socket, one {host;PollData text} line per sample.
+        See [push_samples] for the sending side.
+        :return: self
+        """
+        collector = self
+
+        class _Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for raw in self.rfile:
+                    line = raw.decode("utf-8", "replace").strip()
+                    if line:
+                        collector.ingest_line(line)
+
+        self._server = socketserver.ThreadingTCPServer((address, port), _Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fleet-listener", daemon=True).start()
+        logger.info("FleetCollector listening on {}:{}".format(address, port))
+        return self
+
+    def build_fleet_report(self, archive=None):
+        """
+        Flushes queued samples and rolls up the period for every host.
+        :param archive: a [SegmentArchive] that keeps the samples of the period. None = drop them
+        :return: a list of (host, aggregate [PollData], sample count)
+        """
+        self.flush()
+        return self._store.aggregate_fleet_log(self._filename, archive)
+
+    def _writer(self):
+        while self._run:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.error("Failed to write samples", exc_info=True)
+
+
+def push_samples(address: str, port: int, host: str, data: list, timeout: float = 5):
+    """
+    Pushes samples to a [FleetCollector] listening on [address]:[port].
+
+    :param address: IP or address of the collector
+    :param port: TCP port of the collector
+    :param host: name of this host
+    :param data: a list of [PollData] objects
+    :param timeout: socket timeout in seconds
+    :return: True on success
+    """
+    payload = "".join(host + FleetCollector.HOST_SEP + str(d) + "\n" for d in data)
+    try:
+        with socket.create_connection((address, port), timeout=timeout) as s:
+            s.sendall(payload.encode("utf-8"))
+        return True
+    except OSError:
+        logger.error("Failed to push samples to collector {}:{}".format(address, port), exc_info=True)
+        return False
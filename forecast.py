@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import codecs
+import datetime
+import json
+import logging
+import math
+import os.path
+
+logger = logging.getLogger(__name__)
+
+
+class LinearTrend(object):
+    """
+    Incremental weighted least-squares line fit, updated in O(1) per sample.
+    Old samples fade out with [half_life] (seconds), so the trend follows the recent fill rate.
+    Samples far away from the current fit are down-weighted (Huber weights) so that a single
+    cleanup or a burst of temporary files does not swing the forecast.
+    """
+    MIN_SAMPLES = 3
+    HUBER_K = 3.0
+
+    def __init__(self, half_life: float = None):
+        self.half_life = half_life
+        self.t0 = None
+        self.last_t = None
+        self.count = 0
+        self.weight = 0.0
+        self.mean_x = 0.0
+        self.mean_y = 0.0
+        self.cxx = 0.0
+        self.cxy = 0.0
+        self.res_var = 0.0
+
+    def update(self, t: float, y: float):
+        """
+        Adds one sample
+        :param t: timestamp in seconds
+        :param y: value
+        :return: None
+        """
+        if self.t0 is None:
+            self.t0 = self.last_t = t
+        if self.half_life and t > self.last_t:
+            f = 0.5 ** ((t - self.last_t) / self.half_life)
+            self.weight *= f
+            self.cxx *= f
+            self.cxy *= f
+        self.last_t = max(self.last_t, t)
+
+        w = 1.0
+        if self.ready:
+            r = y - self.value_at(t)
+            s = math.sqrt(self.res_var)
+            if s > 0 and abs(r) > LinearTrend.HUBER_K * s:
+                w = LinearTrend.HUBER_K * s / abs(r)
+            self.res_var += 0.1 * (r * r * w - self.res_var)
+
+        x = t - self.t0
+        self.count += 1
+        self.weight += w
+        dx = x - self.mean_x
+        self.mean_x += w * dx / self.weight
+        dy = y - self.mean_y
+        self.mean_y += w * dy / self.weight
+        self.cxx += w * dx * (x - self.mean_x)
+        self.cxy += w * dx * (y - self.mean_y)
+
+    @property
+    def ready(self):
+        return self.count >= LinearTrend.MIN_SAMPLES and self.cxx > 0
+
+    @property
+    def slope(self):
+        """ change of value per second """
+        return self.cxy / self.cxx if self.ready else None
+
+    def value_at(self, t: float):
+        return self.mean_y + self.slope * (t - self.t0 - self.mean_x)
+
+    def time_to(self, target: float, t: float):
+        """
+        :param target: the value to reach
+        :param t: timestamp to count from (seconds)
+        :return: seconds until the trend reaches [target], or None if it never will
+        """
+        if not self.ready or self.slope <= 0:
+            return None
+        return max(0.0, (target - self.value_at(t)) / self.slope)
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, d: dict):
+        c = cls()
+        c.__dict__.update(d)
+        return c
+
+
+class DiskForecaster(object):
+    """
+    Keeps one [LinearTrend] of disk usage (percent) per mount and estimates when each mount will be full.
+    The state is a handful of numbers per mount and can be saved between runs,
+    so cron runs update the forecast with one sample instead of rescanning history.
+    """
+    DEFAULT_MOUNT = "."
+    FULL_PERCENT = 100.0
+
+    def __init__(self, horizon: float, half_life: float = None):
+        """
+        :param horizon: warn when a mount is projected to be full within this many seconds
+        :param half_life: seconds until a sample counts half as much in the fit. None = never forget
+        """
+        self.horizon = horizon
+        self.half_life = half_life
+        self.trends = {}
+
+    def update(self, when: datetime.datetime, percent: float, mount: str = DEFAULT_MOUNT):
+        """
+        Adds one disk usage sample for [mount]
+        :return: None
+        """
+        if percent is None or when is None:
+            return
+        trend = self.trends.get(mount)
+        if trend is None:
+            trend = self.trends[mount] = LinearTrend(self.half_life)
+        trend.update(when.timestamp(), percent)
+
+    def seed(self, history: list):
+        """
+        Feeds a list of [PollData] (e.g. the aggregate rows) into the trends, oldest first.
+        [disk_usage_percent] goes to [DEFAULT_MOUNT], per mount usage to the trend of each mount.
+        :return: self
+        """
+        for d in sorted((d for d in history if d is not None), key=lambda x: x.when):
+            self.update(d.when, d.disk_usage_percent)
+            for m in d.mounts or []:
+                self.update(d.when, m.percent, m.mount)
+        return self
+
+    def time_to_full(self, mount: str = DEFAULT_MOUNT, now: datetime.datetime = None):
+        """
+        :return: seconds until [mount] is projected to be full, or None if usage is not growing
+        """
+        trend = self.trends.get(mount)
+        if trend is None:
+            return None
+        now = now or datetime.datetime.now()
+        return trend.time_to(DiskForecaster.FULL_PERCENT, now.timestamp())
+
+    def warnings(self, now: datetime.datetime = None):
+        """
+        :return: a list of (mount, seconds to full) for every mount projected to be full within [horizon]
+        """
+        ret = []
+        for mount in sorted(self.trends):
+            ttf = self.time_to_full(mount, now)
+            if ttf is not None and ttf < self.horizon:
+                ret.append((mount, ttf))
+        return ret
+
+    def save(self, filename):
+        """ Writes the trend state to [filename] (json) """
+        with codecs.open(filename, "w", "utf-8") as file:
+            json.dump({m: t.to_dict() for m, t in self.trends.items()}, file)
+
+    @classmethod
+    def load(cls, filename, horizon: float, half_life: float = None):
+        """
+        Reads trend state written by [save].
+        :return: a [DiskForecaster], or None if [filename] does not exist or cannot be parsed
+        """
+        if not os.path.isfile(filename):
+            return None
+        try:
+            with codecs.open(filename, "r", "utf-8") as file:
+                state = json.load(file)
+        except ValueError:
+            logger.error("Failed to read forecast state " + filename, exc_info=True)
+            return None
+        c = cls(horizon, half_life)
+        for mount, d in state.items():
+            c.trends[mount] = LinearTrend.from_dict(d)
+            c.trends[mount].half_life = half_life
+        return c
+
+    @classmethod
+    def load_or_seed(cls, filename, horizon: float, half_life: float, store, store_file, archive=None):
+        """
+        Reads the trend state written by [save]. Without one (the first run), the trends are seeded from
+        the history: the archived segments, the aggregate rows and the samples in the data log.
+        A data log that does not exist yet counts as an empty history.
+
+        :param store: a [DataLogger] or [SqliteDataLogger]
+        :param store_file: path and filename the store reads from
+        :param archive: a [SegmentArchive], or None
+        :return: a [DiskForecaster]
+        """
+        c = cls.load(filename, horizon, half_life)
+        if c is not None:
+            return c
+        try:
+            dl = store.read_data_log(store_file, False)
+        except ValueError:
+            logger.info("No data log yet, the disk forecast starts without history")
+            dl = (None, None, [], [])
+        c = cls(horizon, half_life)
+        segments = archive.segments() if archive is not None else []
+        if segments:
+            # archived samples are finer than the aggregates of their periods, only older aggregates are used
+            older = [a for a in dl[3] if a.when.timestamp() < segments[0]["start"]]
+            return c.seed(older).seed(archive.read_batch()).seed(dl[2])
+        return c.seed(dl[3]).seed(dl[2])
@@ -4,6 +4,7 @@
 import base64
 import codecs
 import datetime as dt
+import html
 import logging
 import os
 from email.mime.text import MIMEText
@@ -17,13 +18,15 @@ from oauth2client import tools
 SCOPES = 'https://www.googleapis.com/auth/gmail.compose'
 CLIENT_SECRET_FILE = 'client_secret.json'
 APPLICATION_NAME = 'Watchtorian'
+HISTORY_KEY_FORMAT = "%Y%m%dT%H%M%S"  # key of a history row in the [ReportCache]
 
 logger = logging.getLogger(__name__)
 
 try:
     import argparse
 
-    flags = argparse.ArgumentParser(parents=[tools.argparser]).parse_args()
+    # parse_known_args() so that the oauth flags can live next to the watchtorian sub commands
+    flags = argparse.ArgumentParser(parents=[tools.argparser], add_help=False).parse_known_args()[0]
 except ImportError:
     flags = None
 
@@ -98,55 +101,129 @@ def get_email_credentials():
     return credentials
 
 
-def apply_email_template(last_email, host: str, data, datalog, filename: str):
+def apply_email_template(last_email, host: str, data, datalog, filename: str, self_metrics: list = None,
+                         cache=None):
     """
 
     :param last_email: date of last email
     :param host: name of the host this script in running on
     :param data: latest system info
-    :param datalog: Aggregated history data
+    :param datalog: Aggregated history data. With a [cache], the periods from cache.newest("history") on are enough
     :param filename: Path (absolute or relative) and filename to the email template
+    :param self_metrics: Watchtorian's own stage timings, see [Instrumentation.summary]
+    :param cache: a [ReportCache] holding the rendered rows of earlier periods. None = render everything
     :rtype: str
     :return: email body html code
     """
     datetime_format = "%Y%m%d %H:%M"
     src = get_email_template(filename)
-    cl = get_n_last_value("cpu_load", datalog[3])
-    clc = get_n_last_value("cpu_load", datalog[3], 1)
-    ct = get_n_last_value("cpu_temp", datalog[3])
-    ctc = get_n_last_value("cpu_temp", datalog[3], 1)
-    dl = get_n_last_value("disk_usage_percent", datalog[3])
-    dlc = get_n_last_value("disk_usage_percent", datalog[3], 1)
-    il = get_n_last_value("internet", datalog[3])
-    ilc = get_n_last_value("internet", datalog[3], 1)
+    if not datalog[3]:
+        raise ValueError("No aggregated data to report")
+    # newest first. The log is written in order, so this is a linear pass rather than a real sort
+    history = sorted(datalog[3], key=lambda x: x.when, reverse=True)
+    latest = history[0]
+    previous = history[1] if len(history) > 1 else None
+
+    def prev(what):
+        return getattr(previous, what) if previous is not None else None
 
     src = src.replace("{host}", host)
     src = src.replace("{report_date}", dt.datetime.now().strftime(datetime_format))
     src = src.replace("{last_report_date}", last_email.strftime(datetime_format))
-    src = src.replace("{cpu_load}", "{0:.2f}".format(cl))
-    src = src.replace("{cpu_load_change}", delta_rep(cl, clc, False))
-    src = src.replace("{cpu_temp}", "{0:.2f}".format(ct))
-    src = src.replace("{cpu_temp_change}", delta_rep(ct, ctc, False))
-    src = src.replace("{disk}", "{0:.2f}".format(dl))
-    src = src.replace("{disk_change}", delta_rep(dl, dlc, False))
-    src = src.replace("{internet}", "{0:.2f}".format(il))
-    src = src.replace("{internet_change}", delta_rep(il, ilc, True))
+    src = src.replace("{cpu_load}", "{0:.2f}".format(latest.cpu_load))
+    src = src.replace("{cpu_load_change}", delta_rep(latest.cpu_load, prev("cpu_load"), False))
+    src = src.replace("{cpu_temp}", "{0:.2f}".format(latest.cpu_temp))
+    src = src.replace("{cpu_temp_change}", delta_rep(latest.cpu_temp, prev("cpu_temp"), False))
+    src = src.replace("{disk}", "{0:.2f}".format(latest.disk_usage_percent))
+    src = src.replace("{disk_change}", delta_rep(latest.disk_usage_percent, prev("disk_usage_percent"), False))
+    src = src.replace("{internet}", "{0:.2f}".format(latest.internet))
+    src = src.replace("{internet_change}", delta_rep(latest.internet, prev("internet"), True))
+
+    def history_row(x):
+        rows = "<tr>"
+        rows += "<td>" + x.when.strftime(datetime_format) + "</td>"
+        rows += "<td>" + "{0:.2f}".format(x.cpu_load) + "</td>"
+        rows += "<td>" + "{0:.2f}".format(x.cpu_temp) + "</td>"
+        rows += "<td>" + "{0:.2f}".format(x.disk_usage_percent) + "</td>"
+        rows += "<td>" + "{0:.2f}".format(x.internet) + "</td>"
+        rows += "</tr>"
+        return rows
 
+    # only the snapshot row is new in every report, the aggregate rows are closed periods
     rows = ""
     rows += "<tr><td>Snapshot right now</td>"
     rows += "<td>" + "{0:.2f}".format(data.cpu_load) + "</td>"
     rows += "<td>" + "{0:.2f}".format(data.cpu_temp) + "</td>"
     rows += "<td>" + "{0:.2f}".format(data.disk_usage_percent) + "</td>"
-    rows += "<td>" + "Online" if data.internet else "Offline" + "</td></tr>"
-    for x in datalog[3]:
+    rows += "<td>" + ("Online" if data.internet else "Offline") + "</td></tr>"
+    if cache is None:
+        rows += "".join(map(history_row, history))
+    else:
+        rows += cache.rows("history", history, lambda x: x.when.strftime(HISTORY_KEY_FORMAT), history_row)
+    src = src.replace("{hist_table_rows}", rows)
+
+    rows = ""
+    for stage, count, total_ms, max_ms in self_metrics or []:
         rows += "<tr>"
-        rows += "<td>" + x.when.strftime(datetime_format) + "</td>"
+        rows += "<td>" + stage + "</td>"
+        rows += "<td>" + str(count) + "</td>"
+        rows += "<td>" + "{0:.1f}".format(total_ms) + "</td>"
+        rows += "<td>" + "{0:.1f}".format(max_ms) + "</td>"
+        rows += "</tr>"
+    return src.replace("{self_metrics_rows}", rows)
+
+
+def apply_fleet_email_template(last_email, collector: str, rollups: list, filename: str):
+    """
+
+    :param last_email: date of last fleet email
+    :param collector: name of the collector that gathered the data
+    :param rollups: a list of (host, aggregate [PollData], sample count)
+    :param filename: Path (absolute or relative) and filename to the email template
+    :rtype: str
+    :return: email body html code
+    """
+    datetime_format = "%Y%m%d %H:%M"
+    src = get_email_template(filename)
+    src = src.replace("{host}", collector)
+    src = src.replace("{host_count}", str(len(rollups)))
+    src = src.replace("{sample_count}", str(sum(r[2] for r in rollups)))
+    src = src.replace("{report_date}", dt.datetime.now().strftime(datetime_format))
+    src = src.replace("{last_report_date}", last_email.strftime(datetime_format))
+
+    rows = ""
+    for host, x, count in rollups:
+        rows += "<tr>"
+        rows += "<td>" + html.escape(host) + "</td>"
+        rows += "<td>" + str(count) + "</td>"
         rows += "<td>" + "{0:.2f}".format(x.cpu_load) + "</td>"
         rows += "<td>" + "{0:.2f}".format(x.cpu_temp) + "</td>"
         rows += "<td>" + "{0:.2f}".format(x.disk_usage_percent) + "</td>"
         rows += "<td>" + "{0:.2f}".format(x.internet) + "</td>"
         rows += "</tr>"
-    return src.replace("{hist_table_rows}", rows)
+    return src.replace("{fleet_table_rows}", rows)
+
+
+def apply_alert_email_template(notification, filename: str):
+    """
+
+    :param notification: an [alerting.Notification]
+    :param filename: Path (absolute or relative) and filename to the email template
+    :rtype: str
+    :return: email body html code
+    """
+    datetime_format = "%Y%m%d %H:%M"
+    a = notification.alert
+    src = get_email_template(filename)
+    src = src.replace("{color}", "#3c9a5f" if notification.state == "cleared" else "#c0392b")
+    src = src.replace("{host}", html.escape(notification.host))
+    src = src.replace("{condition}", html.escape(notification.condition))
+    src = src.replace("{state}", notification.state)
+    src = src.replace("{value}", "{0:.2f}".format(a.value) if isinstance(a.value, (int, float)) else str(a.value))
+    src = src.replace("{limit}", "{0:.2f}".format(a.limit) if isinstance(a.limit, (int, float)) else str(a.limit))
+    src = src.replace("{since}", dt.datetime.fromtimestamp(notification.since).strftime(datetime_format))
+    src = src.replace("{tier}", str(notification.tier + 1))
+    return src.replace("{report_date}", dt.datetime.now().strftime(datetime_format))
 
 
 def get_email_template(filename: str, encoding: str = "utf-8") -> str:
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import logging
+import resource
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class _Timer(object):
+    """ Context manager returned by [Instrumentation.timer]. Plain class, cheaper than @contextmanager. """
+    __slots__ = ("_ins", "_name", "_start")
+
+    def __init__(self, ins, name):
+        self._ins = ins
+        self._name = name
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._ins.record(self._name, time.perf_counter() - self._start)
+        if exc_type is not None:
+            self._ins.count(self._name + ".errors")
+
+
+class _NullTimer(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return None
+
+
+class Instrumentation(object):
+    """
+    Timers and counters for Watchtorian's own hot path, plus its RSS and CPU time.
+    A timing costs two perf_counter() calls and a dict update, so it can stay enabled in production.
+     Example:
+        with INSTRUMENTS.timer("write"):
+            store.writeline_to_data_log(store_file, data)
+    """
+    _NULL = _NullTimer()
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._timings = collections.OrderedDict()  # name -> [count, total seconds, max seconds]
+        self._counters = collections.OrderedDict()  # name -> int
+
+    def timer(self, name: str):
+        """
+        :param name: name of the stage being timed
+        :return: a context manager that records the time spent inside it
+        """
+        return _Timer(self, name) if self.enabled else Instrumentation._NULL
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            t = self._timings.get(name)
+            if t is None:
+                self._timings[name] = [1, seconds, seconds]
+            else:
+                t[0] += 1
+                t[1] += seconds
+                if seconds > t[2]:
+                    t[2] = seconds
+
+    def count(self, name: str, n: int = 1):
+        if self.enabled:
+            with self._lock:
+                self._counters[name] = self._counters.get(name, 0) + n
+
+    def reset(self):
+        with self._lock:
+            self._timings.clear()
+            self._counters.clear()
+
+    @staticmethod
+    def resources() -> dict:
+        """
+        :return: the process' current RSS (bytes) and user/system CPU time (seconds)
+        """
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        try:
+            with open("/proc/self/statm") as f:
+                rss = int(f.read().split()[1]) * resource.getpagesize()
+        except (IOError, OSError, ValueError, IndexError):
+            rss = usage.ru_maxrss * 1024  # peak, in kB on Linux
+        return collections.OrderedDict([("rss_bytes", float(rss)),
+                                        ("cpu_user_s", usage.ru_utime),
+                                        ("cpu_system_s", usage.ru_stime)])
+
+    def snapshot(self) -> dict:
+        """
+        :return: a flat dict {metric name: value}. Per timer: [name].count, [name].total_ms and [name].max_ms
+        """
+        ret = collections.OrderedDict()
+        with self._lock:
+            for name, (count, total, longest) in self._timings.items():
+                ret[name + ".count"] = float(count)
+                ret[name + ".total_ms"] = total * 1000.0
+                ret[name + ".max_ms"] = longest * 1000.0
+            for name, value in self._counters.items():
+                ret[name] = float(value)
+        ret.update(self.resources())
+        return ret
+
+    def summary(self) -> list:
+        """
+        :return: a list of (stage, count, total ms, max ms) ordered by total time, longest first
+        """
+        with self._lock:
+            rows = [(name, count, total * 1000.0, longest * 1000.0)
+                    for name, (count, total, longest) in self._timings.items()]
+        return sorted(rows, key=lambda r: r[2], reverse=True)
+
+
+# process wide instance used by watchtorian and the SystemWatcher collectors
+INSTRUMENTS = Instrumentation()
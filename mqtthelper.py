@@ -33,3 +33,39 @@ def mqtt_publish(topic_data: dict, broker_address: str, port=1883, user=None, pw
         logger.info("Published to MQTT")
     except socket.timeout:
         logger.error("Failed to publish to MQTT", exc_info=True)
+
+
+def mqtt_subscribe(topics: list, on_message, broker_address: str, port=1883, user=None, pwd=None,
+                   client_id: str = None):
+    """
+    Subscribes to [topics] and calls [on_message(topic, payload)] for every message received.
+    The network loop runs in a background thread, so this function returns immediately.
+
+    :param topics: list of topics (wildcards allowed) to subscribe to
+    :param on_message: callable(topic: str, payload: bytes)
+    :param broker_address: IP or address to MQTT broker
+    :param port: Port of MQTT broker. Default = 1883
+    :param user:
+    :param pwd:
+    :param client_id:
+    :return: the connected client. Call [loop_stop()] and [disconnect()] on it when done.
+    """
+    if client_id is None:
+        client = mqtt.Client(clean_session=True)
+    else:
+        client = mqtt.Client(client_id=client_id, clean_session=True)
+
+    if user is not None and pwd is not None:
+        client.username_pw_set(user, pwd)
+
+    def _on_connect(c, userdata, flags, rc):
+        # (re)subscribe on every connect so that subscriptions survive a broker restart
+        for topic in topics:
+            c.subscribe(topic)
+        logger.info("Subscribed to MQTT topics " + ", ".join(topics))
+
+    client.on_connect = _on_connect
+    client.on_message = lambda c, userdata, msg: on_message(msg.topic, msg.payload)
+    client.connect(broker_address, port)
+    client.loop_start()
+    return client
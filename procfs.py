@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import time
+
+from customtypes import DiskIo, Memory, NetIo
+
+logger = logging.getLogger(__name__)
+
+DISKSTATS = "/proc/diskstats"
+MEMINFO = "/proc/meminfo"
+NET_DEV = "/proc/net/dev"
+PRESSURE = "/proc/pressure/"
+SYS_BLOCK = "/sys/block"
+SECTOR_SIZE = 512
+IGNORED_DEVICE_PREFIXES = ("loop", "ram", "zram")
+IGNORED_INTERFACES = ("lo",)
+
+
+def read_diskstats(path: str = DISKSTATS, devices: set = None) -> dict:
+    """
+    Reads /proc/diskstats in one go.
+    :param path: path to diskstats. Default = /proc/diskstats
+    :param devices: only return these device names. None = all
+    :return: dict of {device: (reads, sectors_read, ms_reading, writes, sectors_written, ms_writing, ms_doing_io)}
+    """
+    ret = {}
+    try:
+        with open(path, "r") as file:
+            for line in file:
+                f = line.split()
+                if len(f) < 14 or (devices is not None and f[2] not in devices):
+                    continue
+                ret[f[2]] = (int(f[3]), int(f[5]), int(f[6]), int(f[7]), int(f[9]), int(f[10]), int(f[12]))
+    except (IOError, OSError):
+        logger.debug("cannot read " + path)
+    return ret
+
+
+def block_devices(path: str = SYS_BLOCK) -> set:
+    """
+    :return: names of whole-disk block devices (partitions, loop and ram devices excluded)
+    """
+    try:
+        return set(d for d in os.listdir(path) if not d.startswith(IGNORED_DEVICE_PREFIXES))
+    except (IOError, OSError):
+        return set()
+
+
+class DiskIoMeter(object):
+    """
+    Turns the cumulative counters in /proc/diskstats into per-second [DiskIo] rates.
+    Every [poll] reads the file once and compares it with the previous poll.
+    """
+
+    def __init__(self, path: str = DISKSTATS, devices: set = None):
+        """
+        :param path: path to diskstats
+        :param devices: device names to report. None = all whole-disk devices (looked up once)
+        """
+        self._path = path
+        self._devices = devices if devices is not None else block_devices()
+        self._prev = None
+        self._prev_t = None
+
+    def poll(self) -> dict:
+        """
+        :return: dict of {device: DiskIo}. Empty on the first call, since rates need two readings.
+        """
+        now = time.monotonic()
+        cur = read_diskstats(self._path, self._devices or None)
+        ret = {}
+        if self._prev is not None and now > self._prev_t:
+            elapsed = now - self._prev_t
+            for dev, c in cur.items():
+                p = self._prev.get(dev)
+                if p is None:
+                    continue
+                # counters may wrap or reset, never report negative rates
+                reads, sect_r, ms_r, writes, sect_w, ms_w, ms_io = [max(0, a - b) for a, b in zip(c, p)]
+                ret[dev] = DiskIo(dev,
+                                  sect_r * SECTOR_SIZE / elapsed,
+                                  sect_w * SECTOR_SIZE / elapsed,
+                                  reads / elapsed,
+                                  writes / elapsed,
+                                  float(ms_r) / reads if reads else 0.0,
+                                  float(ms_w) / writes if writes else 0.0,
+                                  min(100.0, ms_io / (elapsed * 10.0)))
+        self._prev = cur
+        self._prev_t = now
+        return ret
+
+
+def read_meminfo(path: str = MEMINFO) -> Memory:
+    """
+    Reads memory and swap usage from /proc/meminfo in one go.
+    :return: a [Memory] object (pressure fields not set), or None if the file cannot be read
+    """
+    values = {}
+    try:
+        with open(path, "r") as file:
+            for line in file:
+                key, _, rest = line.partition(":")
+                if key in ("MemTotal", "MemAvailable", "MemFree", "SwapTotal", "SwapFree"):
+                    values[key] = int(rest.split()[0]) * 1024  # kB
+    except (IOError, OSError, ValueError):
+        logger.debug("cannot read " + path)
+        return None
+    total = values.get("MemTotal", 0)
+    available = values.get("MemAvailable", values.get("MemFree", 0))  # MemAvailable exists since Linux 3.14
+    swap_total = values.get("SwapTotal", 0)
+    swap_used = swap_total - values.get("SwapFree", 0)
+    return Memory(total,
+                  available,
+                  100.0 * (total - available) / total if total else 0.0,
+                  swap_total,
+                  100.0 * swap_used / swap_total if swap_total else 0.0)
+
+
+def read_pressure(resource: str, path: str = PRESSURE):
+    """
+    Reads the "some avg10" value of /proc/pressure/[resource] (Linux 4.20+ with PSI enabled).
+    :param resource: cpu, memory or io
+    :return: percent of the last 10 seconds some task was stalled on [resource], or None if unavailable
+    """
+    try:
+        with open(path + resource, "r") as file:
+            for line in file:
+                if line.startswith("some"):
+                    return float(line.split()[1].split("=")[1])
+    except (IOError, OSError, IndexError, ValueError):
+        pass
+    return None
+
+
+def read_net_dev(path: str = NET_DEV) -> dict:
+    """
+    Reads /proc/net/dev in one go. The loopback interface is skipped.
+    :return: dict of {interface: (rx_bytes, rx_packets, rx_errs+drops, tx_bytes, tx_packets, tx_errs+drops)}
+    """
+    ret = {}
+    try:
+        with open(path, "r") as file:
+            for line in file:
+                name, sep, rest = line.partition(":")
+                name = name.strip()
+                if not sep or name in IGNORED_INTERFACES:
+                    continue
+                f = rest.split()
+                if len(f) < 12:
+                    continue
+                ret[name] = (int(f[0]), int(f[1]), int(f[2]) + int(f[3]), int(f[8]), int(f[9]), int(f[10]) + int(f[11]))
+    except (IOError, OSError, ValueError):
+        logger.debug("cannot read " + path)
+    return ret
+
+
+class NetIoMeter(object):
+    """
+    Turns the cumulative counters in /proc/net/dev into per-second [NetIo] rates.
+    Every [poll] reads the file once and compares it with the previous poll.
+    """
+
+    def __init__(self, path: str = NET_DEV):
+        self._path = path
+        self._prev = None
+        self._prev_t = None
+
+    def poll(self) -> dict:
+        """
+        :return: dict of {interface: NetIo}. Empty on the first call, since rates need two readings.
+        """
+        now = time.monotonic()
+        cur = read_net_dev(self._path)
+        ret = {}
+        if self._prev is not None and now > self._prev_t:
+            elapsed = now - self._prev_t
+            for name, c in cur.items():
+                p = self._prev.get(name)
+                if p is None:
+                    continue
+                # counters may wrap or reset, never report negative rates
+                rx_b, rx_p, rx_e, tx_b, tx_p, tx_e = [max(0, a - b) / elapsed for a, b in zip(c, p)]
+                ret[name] = NetIo(name, rx_b, tx_b, rx_p, tx_p, rx_e + tx_e)
+        self._prev = cur
+        self._prev_t = now
+        return ret
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import array
+import csv
+import datetime
+import itertools
+import json
+import logging
+import math
+import re
+import struct
+import sys
+
+from customtypes import PollData, PollDataBatch
+
+logger = logging.getLogger(__name__)
+
+METRICS = PollDataBatch.COLUMNS[1:]  # every column except "when"
+RESOLUTIONS = ("raw", "rollup")  # the stored samples, or one aggregate per report period
+FORMATS = ("csv", "jsonl", "columns")
+
+COLUMNS_MAGIC = b"WTCOL1\n"
+BLOCK_ROWS = 65536
+_RELATIVE = re.compile(r"^(\d+)([mhd])$")
+_UNITS = {"m": 60, "h": 3600, "d": 86400}
+_TIME_FORMATS = (PollData.DATETIME_FORMAT, "%Y%m%d", "%Y-%m-%d", "%Y-%m-%dT%H:%M", "%Y-%m-%d %H:%M",
+                 "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S")
+
+
+def parse_time(text: str, now: datetime.datetime = None) -> datetime.datetime:
+    """
+    Parses a point in time given on the command line.
+     Example: 20181010T1644, 2018-10-10, 2018-10-10 16:44, or relative to now: 90d, 12h, 30m
+    :return: a (local, naive) datetime
+    """
+    m = _RELATIVE.match(text.strip())
+    if m:
+        return (now or datetime.datetime.now()) - datetime.timedelta(seconds=int(m.group(1)) * _UNITS[m.group(2)])
+    for f in _TIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(text.strip(), f)
+        except ValueError:
+            pass
+    raise ValueError("Unknown time '{}'. Use e.g. 20181010T1644, 2018-10-10, 2018-10-10 16:44 or 90d".format(text))
+
+
+def parse_metrics(text: str) -> list:
+    """
+    :param text: comma separated metric names. Empty = all [METRICS]
+    :return: a list of metric names
+    """
+    metrics = [m.strip() for m in (text or "").split(",") if m.strip()]
+    unknown = [m for m in metrics if m not in METRICS]
+    if unknown:
+        raise ValueError("Unknown metric(s) {}. Choose from {}".format(", ".join(unknown), ", ".join(METRICS)))
+    return metrics or list(METRICS)
+
+
+def run_query(store, store_file, out, metrics: list, resolution: str = "raw", start: datetime.datetime = None,
+              end: datetime.datetime = None, host: str = None, fmt: str = "csv", archive=None) -> int:
+    """
+    Streams [metrics] in [start, end) from the store to [out], oldest first. Rows go from the store cursor
+    straight to the writer, so memory use does not grow with the time range.
+    :param store: [DataLogger] or [SqliteDataLogger]
+    :param store_file: path and filename the store reads from
+    :param out: a text file for csv/jsonl, a binary file for columns
+    :param metrics: names from [METRICS]
+    :param resolution: one of [RESOLUTIONS]
+    :param host: None = the store's own host
+    :param fmt: one of [FORMATS]
+    :param archive: a [SegmentArchive] holding the samples of closed periods. Raw rows are read from its
+        segments in range first, then from the store (which only holds the current period)
+    :return: number of rows written
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError("Unknown resolution '{}'. Choose from {}".format(resolution, ", ".join(RESOLUTIONS)))
+    if fmt not in FORMATS:
+        raise ValueError("Unknown format '{}'. Choose from {}".format(fmt, ", ".join(FORMATS)))
+    rows = store.iter_columns(store_file, metrics, resolution, start, end, host)
+    if archive is not None and resolution == "raw":
+        rows = itertools.chain(archive.iter_columns(metrics, start, end, host), rows)
+    return WRITERS[fmt](rows, metrics, out)
+
+
+def _iso(ts: float) -> str:
+    return datetime.datetime.fromtimestamp(ts).isoformat()
+
+
+def write_csv(rows, metrics: list, out) -> int:
+    """
+    One header line (time and [metrics]), then one line per row. Times are local ISO 8601, missing values empty.
+    :return: number of rows written
+    """
+    w = csv.writer(out, lineterminator="\n")
+    w.writerow(["time"] + list(metrics))
+    n = 0
+    for r in rows:
+        w.writerow((_iso(r[0]),) + tuple("" if v is None else v for v in r[1:]))
+        n += 1
+    return n
+
+
+def write_jsonl(rows, metrics: list, out) -> int:
+    """
+    One JSON object per line: {"time": local ISO 8601, metric: value or null, ...}
+    :return: number of rows written
+    """
+    n = 0
+    for r in rows:
+        o = {"time": _iso(r[0])}
+        o.update(zip(metrics, r[1:]))
+        out.write(json.dumps(o) + "\n")
+        n += 1
+    return n
+
+
+def write_columns(rows, metrics: list, out, block_rows: int = BLOCK_ROWS) -> int:
+    """
+    Columnar binary output, for loading large ranges without parsing text.
+     Format: [COLUMNS_MAGIC], one JSON header line {"columns": [...], "dtype": "<f8"}, then blocks of
+     a little endian uint32 row count followed by every column as row count little endian float64.
+     A block with row count 0 ends the stream. "time" is unix time, missing values are NaN.
+     Example (numpy): np.frombuffer(block, "<f8", count=n, offset=column_index * n * 8)
+    :return: number of rows written
+    """
+    names = ["time"] + list(metrics)
+    out.write(COLUMNS_MAGIC)
+    out.write((json.dumps({"columns": names, "dtype": "<f8"}) + "\n").encode("utf-8"))
+    columns = [array.array("d") for _ in names]
+    n = 0
+    for r in rows:
+        for c, v in zip(columns, r):
+            c.append(math.nan if v is None else v)
+        if len(columns[0]) >= block_rows:
+            n += _write_block(out, columns)
+            columns = [array.array("d") for _ in names]
+    n += _write_block(out, columns)
+    out.write(struct.pack("<I", 0))
+    return n
+
+
+def _write_block(out, columns: list) -> int:
+    count = len(columns[0])
+    if not count:
+        return 0
+    out.write(struct.pack("<I", count))
+    for c in columns:
+        if sys.byteorder != "little":
+            c.byteswap()
+        c.tofile(out)
+    return count
+
+
+def read_columns(inp):
+    """
+    Reads what [write_columns] wrote.
+    :param inp: a binary file
+    :return: a generator of dicts {column name: array('d')}, one per block
+    """
+    if inp.read(len(COLUMNS_MAGIC)) != COLUMNS_MAGIC:
+        raise ValueError("Not a Watchtorian columns stream")
+    names = json.loads(inp.readline().decode("utf-8"))["columns"]
+    while True:
+        count = struct.unpack("<I", inp.read(4))[0]
+        if not count:
+            return
+        block = {}
+        for name in names:
+            c = array.array("d")
+            c.frombytes(inp.read(count * 8))
+            if sys.byteorder != "little":
+                c.byteswap()
+            block[name] = c
+        yield block
+
+
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl, "columns": write_columns}
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import codecs
+import json
+import logging
+import os.path
+
+logger = logging.getLogger(__name__)
+
+
+class ReportCache(object):
+    """
+    Rendered html of closed report periods, kept between reports.
+    A closed period (an aggregate row) never changes, so every report only renders the periods that
+    were closed since the previous one and reuses the html of the rest. Rendering then costs the same
+    whether the history covers a year or a decade.
+     Example:
+        cache = ReportCache.load("poll_data/report_cache.json")
+        html = cache.rows("history", aggregates_newest_first, period_key, render_row)  # from cache.newest() on
+        cache.save()
+    """
+    VERSION = 1  # bump when the html of a cached section changes, old caches are then ignored
+
+    def __init__(self, filename: str = None):
+        """
+        :param filename: json file used by [save]. None = keep in memory only
+        """
+        self.filename = filename
+        self.hits = 0
+        self.misses = 0
+        self._sections = {}  # section -> {"first": key, "last": key, "count": n, "html": str}
+        self._dirty = False
+
+    @classmethod
+    def load(cls, filename: str):
+        """
+        :return: a [ReportCache] with the sections saved in [filename]. Empty if the file is missing or stale.
+        """
+        c = cls(filename)
+        if not os.path.isfile(filename):
+            return c
+        try:
+            with codecs.open(filename, "r", "utf-8") as file:
+                state = json.load(file)
+            if state.get("version") == ReportCache.VERSION:
+                c._sections = state["sections"]
+        except (ValueError, KeyError):
+            logger.warning("Ignoring broken report cache " + filename)
+        return c
+
+    def save(self):
+        """ Writes the cache to [filename] if anything changed """
+        if self.filename is None or not self._dirty:
+            return
+        with codecs.open(self.filename, "w", "utf-8") as file:
+            json.dump({"version": ReportCache.VERSION, "sections": self._sections}, file)
+        self._dirty = False
+
+    def newest(self, section: str):
+        """
+        :return: the key of the newest cached period of [section], or None if nothing is cached.
+        Reading the periods from this one on is enough for [rows].
+        """
+        cached = self._sections.get(section)
+        return cached["last"] if cached and cached["count"] else None
+
+    def rows(self, section: str, periods: list, key, render) -> str:
+        """
+        Joins the html of all periods, rendering only the periods that are not in the cache yet.
+        New periods are expected at the front (newest first). [periods] is either the whole history or
+        only the periods from [newest] on. If the older part of [periods] is not what was cached,
+        the whole section is rendered again.
+        :param section: name of the cached section
+        :param periods: closed periods, newest first
+        :param key: callable(period) -> str, unique per period
+        :param render: callable(period) -> html of one period
+        :return: html
+        """
+        n = len(periods)
+        cached = self._sections.get(section)
+        first, count = key(periods[-1]) if periods else None, n
+        if cached and 0 < cached["count"] <= n and key(periods[-1]) == cached["first"] and \
+                key(periods[n - cached["count"]]) == cached["last"]:
+            new = periods[:n - cached["count"]]
+            html = "".join(render(p) for p in new) + cached["html"]
+        elif cached and cached["count"] and n and key(periods[-1]) == cached["last"]:
+            # only the periods from the newest cached one on were read
+            new = periods[:-1]
+            first, count = cached["first"], cached["count"] + len(new)
+            html = "".join(render(p) for p in new) + cached["html"]
+        else:
+            new = periods
+            html = "".join(render(p) for p in periods)
+        self.hits += count - len(new)
+        self.misses += len(new)
+        if new or cached is None:
+            self._sections[section] = {"first": first, "last": key(periods[0]) if periods else None,
+                                       "count": count, "html": html}
+            self._dirty = True
+        return html
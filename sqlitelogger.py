@@ -0,0 +1,526 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+import logging
+import os.path
+import sqlite3
+import threading
+
+from customtypes import PollData, PollDataBatch, Machine, MountUsage, DiskIo, Memory, NetIo
+
+logger = logging.getLogger(__name__)
+
+
+class SqliteDataLogger(object):
+    """
+    SQLite alternative to the text based [DataLogger].
+    Exposes the same calls (writeline_to_data_log, read_data_log, create_data_log, aggregate_data_log)
+    so the two can be swapped by config. The database is opened in WAL mode, which lets
+    readers (dashboards, the reporter) run while the sampler writes.
+    Every row is tagged with [host] so several hosts can share one database.
+    """
+    DEFAULT_HOST = "localhost"
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS samples (
+            id INTEGER PRIMARY KEY,
+            host TEXT NOT NULL,
+            ts REAL NOT NULL,
+            cpu_load REAL,
+            cpu_temp REAL,
+            disk_usage_percent REAL,
+            internet REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_samples_host_ts ON samples (host, ts);
+        CREATE INDEX IF NOT EXISTS idx_samples_ts ON samples (ts);
+
+        CREATE TABLE IF NOT EXISTS rollups (
+            id INTEGER PRIMARY KEY,
+            host TEXT NOT NULL,
+            ts REAL NOT NULL,
+            period_start REAL,
+            sample_count INTEGER,
+            cpu_load REAL,
+            cpu_temp REAL,
+            disk_usage_percent REAL,
+            internet REAL,
+            memory_percent REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_rollups_host_ts ON rollups (host, ts);
+
+        CREATE TABLE IF NOT EXISTS rollup_mounts (
+            rollup_id INTEGER NOT NULL REFERENCES rollups (id) ON DELETE CASCADE,
+            mount TEXT,
+            total INTEGER,
+            used INTEGER,
+            percent REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_rollup_mounts_rollup ON rollup_mounts (rollup_id);
+
+        CREATE TABLE IF NOT EXISTS report_history (
+            host TEXT PRIMARY KEY,
+            last_email REAL,
+            last_mqtt REAL
+        );
+
+        CREATE TABLE IF NOT EXISTS machine_results (
+            sample_id INTEGER NOT NULL REFERENCES samples (id) ON DELETE CASCADE,
+            name TEXT,
+            ip TEXT,
+            port INTEGER,
+            method TEXT,
+            result INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_machine_results_sample ON machine_results (sample_id);
+
+        CREATE TABLE IF NOT EXISTS mount_samples (
+            sample_id INTEGER NOT NULL REFERENCES samples (id) ON DELETE CASCADE,
+            mount TEXT,
+            total INTEGER,
+            used INTEGER,
+            percent REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_mount_samples_sample ON mount_samples (sample_id);
+
+        CREATE TABLE IF NOT EXISTS device_samples (
+            sample_id INTEGER NOT NULL REFERENCES samples (id) ON DELETE CASCADE,
+            device TEXT,
+            read_bps REAL,
+            write_bps REAL,
+            read_iops REAL,
+            write_iops REAL,
+            read_latency REAL,
+            write_latency REAL,
+            busy_percent REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_device_samples_sample ON device_samples (sample_id);
+
+        CREATE TABLE IF NOT EXISTS memory_samples (
+            sample_id INTEGER NOT NULL REFERENCES samples (id) ON DELETE CASCADE,
+            total INTEGER,
+            available INTEGER,
+            percent REAL,
+            swap_total INTEGER,
+            swap_percent REAL,
+            psi_cpu REAL,
+            psi_memory REAL,
+            psi_io REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_memory_samples_sample ON memory_samples (sample_id);
+
+        CREATE TABLE IF NOT EXISTS net_samples (
+            sample_id INTEGER NOT NULL REFERENCES samples (id) ON DELETE CASCADE,
+            interface TEXT,
+            rx_bps REAL,
+            tx_bps REAL,
+            rx_pps REAL,
+            tx_pps REAL,
+            errors REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_net_samples_sample ON net_samples (sample_id);
+
+        CREATE TABLE IF NOT EXISTS self_metrics (
+            host TEXT NOT NULL,
+            ts REAL NOT NULL,
+            name TEXT NOT NULL,
+            value REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_self_metrics_host_ts ON self_metrics (host, ts);
+    """
+    INSERT_SAMPLE = "INSERT INTO samples (id, host, ts, cpu_load, cpu_temp, disk_usage_percent, internet) " \
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+    INSERT_ROLLUP = "INSERT INTO rollups (host, ts, period_start, sample_count, cpu_load, cpu_temp, " \
+                    "disk_usage_percent, internet, memory_percent) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    # averages of the samples, memory_samples holds at most one row per sample
+    AGGREGATE = "SELECT {} COUNT(*), MIN(s.ts), AVG(s.cpu_load), AVG(s.cpu_temp), AVG(s.disk_usage_percent), " \
+                "AVG(s.internet) * 100, AVG(m.percent) FROM samples s LEFT JOIN memory_samples m ON m.sample_id = s.id"
+    INSERT_ROLLUP_MOUNT = "INSERT INTO rollup_mounts (rollup_id, mount, total, used, percent) VALUES (?, ?, ?, ?, ?)"
+    # average usage per mount of a host's samples. Sizes come from the latest sample (the row MAX(ts) picks)
+    ROLLUP_MOUNTS = "INSERT INTO rollup_mounts (rollup_id, mount, total, used, percent) " \
+                    "SELECT ?, mount, total, used, percent FROM (" \
+                    "SELECT m.mount, MAX(s.ts), m.total, m.used, AVG(m.percent) AS percent " \
+                    "FROM mount_samples m JOIN samples s ON s.id = m.sample_id WHERE s.host = ? GROUP BY m.mount)"
+    INSERT_MACHINE = "INSERT INTO machine_results (sample_id, name, ip, port, method, result) " \
+                     "VALUES (?, ?, ?, ?, ?, ?)"
+    INSERT_MOUNT = "INSERT INTO mount_samples (sample_id, mount, total, used, percent) VALUES (?, ?, ?, ?, ?)"
+    INSERT_DEVICE = "INSERT INTO device_samples (sample_id, device, read_bps, write_bps, read_iops, write_iops, " \
+                    "read_latency, write_latency, busy_percent) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    INSERT_MEMORY = "INSERT INTO memory_samples (sample_id, total, available, percent, swap_total, swap_percent, " \
+                    "psi_cpu, psi_memory, psi_io) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    INSERT_NET = "INSERT INTO net_samples (sample_id, interface, rx_bps, tx_bps, rx_pps, tx_pps, errors) " \
+                 "VALUES (?, ?, ?, ?, ?, ?, ?)"
+    INSERT_HISTORY = "INSERT OR IGNORE INTO report_history (host, last_email, last_mqtt) VALUES (?, NULL, NULL)"
+    UPSERT_HISTORY = "INSERT OR REPLACE INTO report_history (host, last_email, last_mqtt) VALUES (?, ?, ?)"
+    COLUMN_SQL = {"cpu_load": "s.cpu_load", "cpu_temp": "s.cpu_temp", "disk_usage_percent": "s.disk_usage_percent",
+                  "internet": "s.internet", "memory_percent": "m.percent"}
+    STREAM_BATCH = 1000  # rows fetched at a time by [iter_columns]
+
+    def __init__(self, host: str = None):
+        """
+        :param host: name of the host whose data is read/written. Default = [DEFAULT_HOST]
+        """
+        self.host = host or SqliteDataLogger.DEFAULT_HOST
+        self._connections = {}
+        self._lock = threading.RLock()
+
+    def _connect(self, filename) -> sqlite3.Connection:
+        """
+        Returns a cached connection to [filename], creating the file and schema if needed.
+        Statements executed on a cached connection are prepared only once by sqlite3.
+        """
+        with self._lock:
+            con = self._connections.get(filename)
+            if con is None:
+                con = sqlite3.connect(filename, check_same_thread=False)
+                con.execute("PRAGMA journal_mode=WAL")
+                con.execute("PRAGMA synchronous=NORMAL")
+                con.execute("PRAGMA foreign_keys=ON")
+                con.executescript(SqliteDataLogger.SCHEMA)
+                self._migrate(con)
+                self._connections[filename] = con
+            return con
+
+    @staticmethod
+    def _migrate(con: sqlite3.Connection):
+        """ Adds the columns that databases created by older versions lack """
+        if "memory_percent" not in [r[1] for r in con.execute("PRAGMA table_info(rollups)")]:
+            with con:
+                con.execute("ALTER TABLE rollups ADD COLUMN memory_percent REAL")
+
+    def close(self):
+        """ Closes all cached connections """
+        with self._lock:
+            for con in self._connections.values():
+                con.close()
+            self._connections.clear()
+
+    def writeline_to_data_log(self, filename, data):
+        """ Appends one sample to the data log """
+        self.writelines_to_data_log(filename, [data])
+
+    def writelines_to_data_log(self, filename, data: list, host: str = None):
+        """
+        Appends many samples in a single transaction.
+
+        :param filename: path and filename to the database
+        :param data: a list of [PollData] objects
+        :param host: overrides [self.host] for this batch
+        :return: None
+        """
+        self.write_host_batches(filename, {host or self.host: data})
+
+    def write_host_batches(self, filename, batches: dict):
+        """
+        Appends samples from several hosts in a single transaction.
+        Sample ids are handed out up front, so samples and each of their child tables
+        (machine results, mounts, devices, memory, interfaces) are inserted with one batched [executemany].
+
+        :param filename: path and filename to the database
+        :param batches: a dict of {host: [PollData, ...]}
+        :return: None
+        """
+        con = self._connect(filename)
+        with self._lock, con:
+            con.execute("BEGIN IMMEDIATE")  # take the write lock before reading the next id
+            next_id = con.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM samples").fetchone()[0]
+            samples, machines, mounts, devices, memory, interfaces = [], [], [], [], [], []
+            for host, data in batches.items():
+                for d in data:
+                    samples.append((next_id,) + self._sample_row(host, d))
+                    machines += [self._machine_row(next_id, m) for m in d.machines or [] if m is not None]
+                    mounts += [(next_id, m.mount, m.total, m.used, m.percent) for m in d.mounts or []]
+                    devices += [(next_id, x.device) + tuple(getattr(x, f) for f in DiskIo.FIELDS)
+                                for x in d.devices or []]
+                    if d.memory is not None:
+                        memory.append((next_id,) + tuple(getattr(d.memory, f) for f in Memory.FIELDS))
+                    interfaces += [(next_id, n.interface) + tuple(getattr(n, f) for f in NetIo.FIELDS)
+                                   for n in d.interfaces or []]
+                    next_id += 1
+            con.executemany(SqliteDataLogger.INSERT_SAMPLE, samples)
+            for sql, rows in ((SqliteDataLogger.INSERT_MACHINE, machines),
+                              (SqliteDataLogger.INSERT_MOUNT, mounts),
+                              (SqliteDataLogger.INSERT_DEVICE, devices),
+                              (SqliteDataLogger.INSERT_MEMORY, memory),
+                              (SqliteDataLogger.INSERT_NET, interfaces)):
+                if rows:
+                    con.executemany(sql, rows)
+            con.executemany(SqliteDataLogger.INSERT_HISTORY, [(host,) for host in batches])
+
+    def write_self_metrics(self, filename, when: datetime.datetime, metrics: dict):
+        """
+        Stores Watchtorian's own timings/resource usage, one row per metric
+        :param metrics: a dict {name: value}, see [Instrumentation.snapshot]
+        """
+        con = self._connect(filename)
+        with self._lock, con:
+            ts = self._to_ts(when)
+            con.executemany("INSERT INTO self_metrics (host, ts, name, value) VALUES (?, ?, ?, ?)",
+                            [(self.host, ts, k, v) for k, v in metrics.items()])
+
+    def create_data_log(self, filename,
+                        overwrite: bool = False,
+                        email_date: datetime = None,
+                        mqtt_date: datetime = None,
+                        data: list = None,
+                        aggregate_data: list = None):
+        """
+        Creates a new data log for [self.host]. Other hosts sharing the database are left untouched.
+
+        :param filename: path and filename to the database
+        :param overwrite: [Bool]. If data already exists for this host, should it be overwritten?
+        :param email_date: date when last email was sent
+        :param mqtt_date: date when last mqtt message was published
+        :param data: a list
+        :param aggregate_data: a list
+        :return: None
+        """
+        con = self._connect(filename)
+        with self._lock, con:
+            exists = con.execute("SELECT 1 FROM report_history WHERE host = ?", (self.host,)).fetchone()
+            if exists and not overwrite:
+                return
+            if exists:
+                logger.warning("data log for host '{}' already exists. It will be overwritten.".format(self.host))
+            con.execute("DELETE FROM samples WHERE host = ?", (self.host,))
+            con.execute("DELETE FROM rollups WHERE host = ?", (self.host,))
+            con.execute(SqliteDataLogger.UPSERT_HISTORY,
+                        (self.host, self._to_ts(email_date), self._to_ts(mqtt_date)))
+            if aggregate_data is not None and isinstance(aggregate_data, (list,)):
+                for a in aggregate_data:
+                    rollup_id = con.execute(SqliteDataLogger.INSERT_ROLLUP,
+                                            (self.host, self._to_ts(a.when), None, None, a.cpu_load, a.cpu_temp,
+                                             a.disk_usage_percent, a.internet, a.memory_percent)).lastrowid
+                    con.executemany(SqliteDataLogger.INSERT_ROLLUP_MOUNT,
+                                    [(rollup_id, m.mount, m.total, m.used, m.percent) for m in a.mounts or []])
+        if data is not None and isinstance(data, (list,)):
+            self.writelines_to_data_log(filename, data)
+
+    def clear_data_log(self, filename):
+        """ Erase all the stored data for [self.host]."""
+        con = self._connect(filename)
+        with self._lock, con:
+            con.execute("DELETE FROM samples WHERE host = ?", (self.host,))
+            con.execute("DELETE FROM rollups WHERE host = ?", (self.host,))
+            con.execute("DELETE FROM self_metrics WHERE host = ?", (self.host,))
+            con.execute("DELETE FROM report_history WHERE host = ?", (self.host,))
+
+    def read_data_log(self, filename, skip_data):
+        """
+        Reads the data log.
+        Will throw ValueError() exception if data is missing, just like [DataLogger.read_data_log].
+
+        :param filename: path and filename to the database
+        :param skip_data: Only read the report history. Will not read the samples.
+        :return: (email_sent, mqtt, data, aggregate_data) or (email_sent, mqtt, None) if [skip_data]
+        """
+        if not os.path.isfile(filename):
+            raise ValueError("Email last sent date was not found in file " + filename)
+        con = self._connect(filename)
+        row = con.execute("SELECT last_email, last_mqtt FROM report_history WHERE host = ?",
+                          (self.host,)).fetchone()
+        if row is None:
+            raise ValueError("Email last sent date was not found in file " + filename)
+        email_sent, mqtt = self._from_ts(row[0]), self._from_ts(row[1])
+        if skip_data:
+            return email_sent, mqtt, None
+
+        return email_sent, mqtt, self.read_samples(filename), self.read_aggregates(filename)
+
+    def read_aggregates(self, filename, start: datetime = None, host: str = None):
+        """
+        Reads the rollups (with their mounts) from [start] on. Uses the (host, ts) index.
+        Will throw ValueError() exception if the database is missing.
+
+        :param filename: path and filename to the database
+        :param start: first period to read. None = all of them
+        :param host: None = [self.host]
+        :return: a list of [PollData] objects, oldest first
+        """
+        if not os.path.isfile(filename):
+            raise ValueError("Database {} was not found".format(filename))
+        con = self._connect(filename)
+        where = "r.host = ?"
+        args = [host or self.host]
+        if start is not None:
+            where += " AND r.ts >= ?"
+            args.append(self._to_ts(start))
+        mounts = {}
+        for r in con.execute("SELECT m.rollup_id, m.mount, m.total, m.used, m.percent FROM rollup_mounts m "
+                             "JOIN rollups r ON r.id = m.rollup_id WHERE " + where, args):
+            mounts.setdefault(r[0], []).append(MountUsage(*r[1:]))
+        return [PollData(self._from_ts(r[1]), r[2], r[3], r[4], r[5], mounts=mounts.get(r[0], []),
+                         memory=Memory(percent=r[6]) if r[6] is not None else None)
+                for r in con.execute("SELECT r.id, r.ts, r.cpu_load, r.cpu_temp, r.disk_usage_percent, r.internet, "
+                                     "r.memory_percent FROM rollups r WHERE " + where + " ORDER BY r.ts", args)]
+
+    def read_samples(self, filename, start: datetime = None, end: datetime = None, host: str = None):
+        """
+        Reads raw samples, optionally limited to [start, end). Uses the (host, ts) index.
+
+        :return: a list of [PollData] objects ordered by time
+        """
+        con = self._connect(filename)
+        where = "s.host = ?"
+        args = [host or self.host]
+        if start is not None:
+            where += " AND s.ts >= ?"
+            args.append(self._to_ts(start))
+        if end is not None:
+            where += " AND s.ts < ?"
+            args.append(self._to_ts(end))
+
+        def children(sql):
+            ret = {}
+            for r in con.execute(sql.format(where), args):
+                ret.setdefault(r[0], []).append(r[1:])
+            return ret
+
+        machines = children("SELECT m.sample_id, m.name, m.ip, m.port, m.method, m.result "
+                            "FROM machine_results m JOIN samples s ON s.id = m.sample_id WHERE {}")
+        mounts = children("SELECT m.sample_id, m.mount, m.total, m.used, m.percent "
+                          "FROM mount_samples m JOIN samples s ON s.id = m.sample_id WHERE {}")
+        devices = children("SELECT d.sample_id, d.device, " + ", ".join("d." + f for f in DiskIo.FIELDS) +
+                           " FROM device_samples d JOIN samples s ON s.id = d.sample_id WHERE {}")
+        memory = children("SELECT m.sample_id, " + ", ".join("m." + f for f in Memory.FIELDS) +
+                          " FROM memory_samples m JOIN samples s ON s.id = m.sample_id WHERE {}")
+        interfaces = children("SELECT n.sample_id, n.interface, " + ", ".join("n." + f for f in NetIo.FIELDS) +
+                              " FROM net_samples n JOIN samples s ON s.id = n.sample_id WHERE {}")
+
+        ret = []
+        for r in con.execute("SELECT s.id, s.ts, s.cpu_load, s.cpu_temp, s.disk_usage_percent, s.internet "
+                             "FROM samples s WHERE {} ORDER BY s.ts".format(where), args):
+            m = machines.get(r[0])
+            ret.append(PollData(self._from_ts(r[1]), r[2], r[3], r[4], bool(r[5]) if r[5] is not None else None,
+                                [Machine(x[0], x[1], x[2], x[3], bool(x[4])) for x in m] if m else None,
+                                [MountUsage(*x) for x in mounts.get(r[0], [])],
+                                [DiskIo(*x) for x in devices.get(r[0], [])],
+                                Memory(*memory[r[0]][0]) if r[0] in memory else None,
+                                [NetIo(*x) for x in interfaces.get(r[0], [])]))
+        return ret
+
+    def iter_columns(self, filename, metrics: list, resolution: str = "raw", start: datetime = None,
+                     end: datetime = None, host: str = None):
+        """
+        Streams [metrics] of the samples ("raw") or the rollups ("rollup") in [start, end), oldest first.
+        Uses the (host, ts) index and fetches [STREAM_BATCH] rows at a time, never the whole range.
+
+        :param filename: path and filename to the database
+        :param metrics: names from PollDataBatch.COLUMNS, except "when"
+        :param resolution: "raw" or "rollup"
+        :param host: None = [self.host]
+        :return: a generator of tuples (unix time, one value per metric). Missing values are None
+        """
+        unknown = [m for m in metrics if m not in SqliteDataLogger.COLUMN_SQL]
+        if unknown:
+            raise ValueError("Unknown metric(s) " + ", ".join(unknown))
+        raw = resolution != "rollup"
+        columns = ["s.ts"] + [SqliteDataLogger.COLUMN_SQL[m] if raw or m != "memory_percent" else "s.memory_percent"
+                              for m in metrics]
+        sql = "SELECT {} FROM {} s".format(", ".join(columns), "samples" if raw else "rollups")
+        if raw and "memory_percent" in metrics:
+            sql += " LEFT JOIN memory_samples m ON m.sample_id = s.id"
+        sql += " WHERE s.host = ?"
+        args = [host or self.host]
+        if start is not None:
+            sql += " AND s.ts >= ?"
+            args.append(self._to_ts(start))
+        if end is not None:
+            sql += " AND s.ts < ?"
+            args.append(self._to_ts(end))
+        cursor = self._connect(filename).execute(sql + " ORDER BY s.ts", args)
+        while True:
+            rows = cursor.fetchmany(SqliteDataLogger.STREAM_BATCH)
+            if not rows:
+                return
+            yield from rows
+
+    def aggregate_data_log(self, filename, archive=None):
+        """
+        Computes the average of all samples since the last report, stores it as a rollup (with the average
+        usage of every mount) and removes the samples and self metrics. Resets the report history to now.
+        Same outcome as [DataLogger.aggregate_data_log], but runs as SQL inside one transaction.
+
+        :param filename: path and filename to the database
+        :param archive: a [SegmentArchive] that keeps the samples of the period. None = drop them
+        :return: the aggregate as a [PollData] object, or None if there were no samples
+        """
+        now = datetime.datetime.now()
+        con = self._connect(filename)
+        with self._lock, con:
+            count, start, cpu_load, cpu_temp, disk, internet, memory = con.execute(
+                SqliteDataLogger.AGGREGATE.format("") + " WHERE s.host = ?", (self.host,)).fetchone()
+            aggregate = None
+            if count and archive is not None:
+                try:
+                    archive.write_segment(PollDataBatch.from_rows(
+                        self.iter_columns(filename, PollDataBatch.COLUMNS[1:]), True), self.host)
+                except (OSError, ValueError, OverflowError):
+                    logger.error("Failed to archive the samples of the period", exc_info=True)
+            if count:
+                rollup_id = con.execute(SqliteDataLogger.INSERT_ROLLUP, (self.host, self._to_ts(now), start, count,
+                                                                         cpu_load, cpu_temp, disk, internet,
+                                                                         memory)).lastrowid
+                con.execute(SqliteDataLogger.ROLLUP_MOUNTS, (rollup_id, self.host))
+                aggregate = PollData(now, cpu_load, cpu_temp, disk, internet, mounts=[
+                    MountUsage(*r) for r in con.execute("SELECT mount, total, used, percent FROM rollup_mounts "
+                                                        "WHERE rollup_id = ?", (rollup_id,))],
+                                     memory=Memory(percent=memory) if memory is not None else None)
+            con.execute("DELETE FROM samples WHERE host = ?", (self.host,))
+            con.execute("DELETE FROM self_metrics WHERE host = ?", (self.host,))  # the text store drops them too
+            con.execute(SqliteDataLogger.UPSERT_HISTORY, (self.host, self._to_ts(now), self._to_ts(now)))
+        return aggregate
+
+    def aggregate_fleet_log(self, filename, archive=None):
+        """
+        Fleet-wide version of [aggregate_data_log]. Computes one rollup per host for every host
+        that has samples, archives and removes the samples of those hosts, removes the self metrics
+        and resets the report history of each host and of [self.host] (the collector itself) to now.
+        Samples of other hosts are left untouched.
+
+        :param filename: path and filename to the database
+        :param archive: a [SegmentArchive] that keeps the samples of the period, one segment per host. None = drop them
+        :return: a list of (host, aggregate [PollData], sample count) ordered by host
+        """
+        now = datetime.datetime.now()
+        con = self._connect(filename)
+        with self._lock, con:
+            rows = con.execute(SqliteDataLogger.AGGREGATE.format("s.host,") +
+                               " GROUP BY s.host ORDER BY s.host").fetchall()
+            hosts = [(r[0],) for r in rows]
+            for r in rows:
+                if archive is not None:
+                    try:
+                        archive.write_segment(PollDataBatch.from_rows(
+                            self.iter_columns(filename, PollDataBatch.COLUMNS[1:], host=r[0]), True), r[0])
+                    except (OSError, ValueError, OverflowError):
+                        logger.error("Failed to archive the samples of host '{}'".format(r[0]), exc_info=True)
+                rollup_id = con.execute(SqliteDataLogger.INSERT_ROLLUP,
+                                        (r[0], self._to_ts(now), r[2], r[1], r[3], r[4], r[5], r[6], r[7])).lastrowid
+                con.execute(SqliteDataLogger.ROLLUP_MOUNTS, (rollup_id, r[0]))
+            con.executemany("DELETE FROM samples WHERE host = ?", hosts)
+            con.executemany("DELETE FROM self_metrics WHERE host = ?", set(hosts + [(self.host,)]))
+            con.executemany(SqliteDataLogger.UPSERT_HISTORY,
+                            [(host, self._to_ts(now), self._to_ts(now)) for host in
+                             set([r[0] for r in rows] + [self.host])])
+        return [(r[0], PollData(now, r[3], r[4], r[5], r[6]), r[1]) for r in rows]
+
+    @staticmethod
+    def _sample_row(host, d: PollData):
+        return (host, SqliteDataLogger._to_ts(d.when), d.cpu_load, d.cpu_temp, d.disk_usage_percent,
+                float(d.internet) if d.internet is not None else None)
+
+    @staticmethod
+    def _machine_row(sample_id, m: Machine):
+        return sample_id, m.name, m.ip, m.port, m.poll_method, int(bool(m.result))
+
+    @staticmethod
+    def _to_ts(d: datetime.datetime):
+        if d is None or d == datetime.datetime.min:
+            return None
+        return d.timestamp()
+
+    @staticmethod
+    def _from_ts(ts):
+        if ts is None:
+            return datetime.datetime.min
+        return datetime.datetime.fromtimestamp(ts)
@@ -1,64 +1,65 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import datetime
 import logging
-import os
 import platform
 import socket
+import subprocess
 import threading
 import time
+from concurrent import futures
 
 import psutil
 
+import collectors
 import customtypes
+import procfs
+from eventbus import EventBus
+from instrumentation import INSTRUMENTS
+from workers import CollectorWorkers
 
 logger = logging.getLogger(__name__)
 
 
-class Event(object):
-    def __init__(self):
-        self.handlers = set()
-
-    def handle(self, handler):
-        self.handlers.add(handler)
-        return self
-
-    def unhandle(self, handler):
-        try:
-            self.handlers.remove(handler)
-        except:
-            raise ValueError("Handler is not handling this event, so cannot unhandle it.")
-        return self
-
-    def fire(self, *args, **kargs):
-        for handler in self.handlers:
-            handler(*args, **kargs)
-
-    def get_handler_count(self):
-        return len(self.handlers)
-
-    __iadd__ = handle
-    __isub__ = unhandle
-    __call__ = fire
-    __len__ = get_handler_count
-
-
 class SystemWatcher(object):
-    def __init__(self, _update_delay=2, start_monitor=False):
+    VCGENCMD_TIMEOUT = 0.5  # seconds
+
+    def __init__(self, _update_delay=2, start_monitor=False, collector_list: list = None, connectivity=None,
+                 worker_processes: int = 0):
         """
         Reads information from the system at regular intervals.
+        What is read, and how often, is decided by the registered [collectors]: each one
+        runs at its own interval and all of them update the same [this.system_info].
         Can be started/stopped by using [start_monitoring] and [stop_monitoring].
-        By subscribing to the [ValueChanged] Event, you can be notified when a value is updated.
+        By subscribing to the [ValueChanged] EventBus, you can be notified when a value is updated.
         Note: [ValueChanged] is only triggered once per interval even if more then one value is updated.
+        The [Sampled] EventBus is triggered after every poll that ran a collector, changed or not,
+        with a [PollData] snapshot of [this.system_info] as argument.
+        Both deliver asynchronously (see [eventbus]), so a slow subscriber never delays the next poll.
+        Use [ValueChanged.subscribe(handler, fields=[...], policy=...)] to filter fields or pick a backpressure policy.
         All the gathered data can be read/retrieved from property [this.system_info].
         :param _update_delay (int): Sleep duration in seconds while checking for updates
         :param start_monitor (bool): Sleep duration in seconds while checking for updates
+        :param collector_list (list): the [Collector] objects to run. None = every registered collector
+        :param connectivity (ConnectivityChecker): decides if internet is up. None = [internet_connected]
+        :param worker_processes (int): if > 0, expensive collectors that can [probe] run in this many
+            supervised worker processes instead of threads (see [workers.CollectorWorkers])
         """
         self._update_delay = _update_delay
         self.system_info = customtypes.SystemInfo()
-        self.ValueChanged = Event()
+        self.ValueChanged = EventBus()
+        self.Sampled = EventBus()
         self._delay_lock = threading.Lock()
         self._thread = None
+        self._disk_io = procfs.DiskIoMeter()
+        self._net_io = procfs.NetIoMeter()
+        self.collectors = collector_list if collector_list is not None else collectors.create_collectors()
+        self._executor = None
+        self._reads = {}  # collector -> (future of its [read] on a worker thread, deadline or None once timed out)
+        self.worker_processes = worker_processes
+        self._workers = None
+        self.connectivity = connectivity
         logger.info("SystemWatcher Init(delay={}, start_monitor={})".format(_update_delay, start_monitor))
         if start_monitor:
             self.start_monitoring()
@@ -89,11 +90,18 @@ class SystemWatcher(object):
 
         :return: self
         """
-        if self._thread is not None and self._thread.isAlive():  # is_alive() in Python 2.6+
+        if self._thread is not None and self._thread.is_alive():
             logger.info("polling stopped")
             self._thread.do_run = False
             self._thread.join()
             self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+            self._reads.clear()
+        if self._workers is not None:
+            self._workers.close()
+            self._workers = None
         return self
 
     @staticmethod
@@ -103,19 +111,30 @@ class SystemWatcher(object):
             return new_value
         return old_value
 
-    def _update_host_fs(self):
+    @staticmethod
+    def read_host():
         """
-        Reads information about HOST and DISK usage
-        :return: None
+        :return: tuple (os, hostname, ip, mac address)
         """
+        return platform.system(), platform.node(), SystemWatcher._get_ip(), SystemWatcher.get_mac_address()
+
+    def _apply_host(self, host: tuple):
         values_updated = []
-        self.system_info.host.os = self.prop_delta("os", self.system_info.host.os, platform.system(), values_updated)
+        os_name, hostname, ip, mac_address = host
+        self.system_info.host.os = self.prop_delta("os", self.system_info.host.os, os_name, values_updated)
         self.system_info.host.hostname = self.prop_delta(
-            "hostname", self.system_info.host.hostname, platform.node(), values_updated)
-        self.system_info.host.ip = self.prop_delta("ip", self.system_info.host.ip, self._get_ip(), values_updated)
+            "hostname", self.system_info.host.hostname, hostname, values_updated)
+        self.system_info.host.ip = self.prop_delta("ip", self.system_info.host.ip, ip, values_updated)
         self.system_info.host.mac_address = self.prop_delta(
-            "mac_address", self.system_info.host.mac_address, self.get_mac_address(), values_updated)
+            "mac_address", self.system_info.host.mac_address, mac_address, values_updated)
+        return values_updated
 
+    def _update_fs(self):
+        """
+        Reads DISK usage of the working directory
+        :return: None
+        """
+        values_updated = []
         t, u, f, p = psutil.disk_usage(".")
         self.system_info.fs.free = self.prop_delta("free", self.system_info.fs.free, f, values_updated)
         self.system_info.fs.used = self.prop_delta("used", self.system_info.fs.used, u, values_updated)
@@ -123,51 +142,292 @@ class SystemWatcher(object):
         self.system_info.fs.percent = self.prop_delta("percent", self.system_info.fs.percent, p, values_updated)
         return values_updated
 
-    def _update_cpu_internet_uptime(self):
+    @staticmethod
+    def read_mounts():
+        """
+        :return: dict {mount point: [MountUsage]}
+        """
+        mounts = {}
+        seen_devices = set()
+        for part in psutil.disk_partitions(all=False):
+            if part.device in seen_devices:
+                continue  # bind mount of a device we already report
+            seen_devices.add(part.device)
+            try:
+                t, u, f, p = psutil.disk_usage(part.mountpoint)
+            except OSError:
+                continue
+            mounts[part.mountpoint] = customtypes.MountUsage(part.mountpoint, t, u, p, part.device)
+        return mounts
+
+    def _apply_mounts(self, mounts: dict):
+        values_updated = []
+        self.system_info.fs.mounts = self.prop_delta("mounts", self.system_info.fs.mounts, mounts, values_updated)
+        return values_updated
+
+    def _update_disk_io(self):
+        """
+        Reads the I/O rates of every block device. One read of /proc/diskstats per call, no subprocesses.
+        :return: None
+        """
+        values_updated = []
+        self.system_info.fs.devices = self.prop_delta(
+            "devices", self.system_info.fs.devices, self._disk_io.poll(), values_updated)
+        return values_updated
+
+    def _update_memory(self):
+        """
+        Reads memory/swap usage from one read of /proc/meminfo. Pressure is kept from [_update_pressure]
+        :return: None
+        """
+        values_updated = []
+        old = self.system_info.memory
+        memory = procfs.read_meminfo()
+        if memory is None:
+            vm, sw = psutil.virtual_memory(), psutil.swap_memory()
+            memory = customtypes.Memory(vm.total, vm.available, vm.percent, sw.total, sw.percent)
+        memory.psi_cpu, memory.psi_memory, memory.psi_io = old.psi_cpu, old.psi_memory, old.psi_io
+        self.system_info.memory = self.prop_delta("memory", old, memory, values_updated)
+        return values_updated
+
+    def _update_pressure(self):
+        """
+        Reads pressure stall information (/proc/pressure/cpu, memory and io) into [system_info.memory]
+        :return: None
+        """
+        values_updated = []
+        old = self.system_info.memory
+        memory = customtypes.Memory(*[getattr(old, f) for f in customtypes.Memory.FIELDS])
+        memory.psi_cpu = procfs.read_pressure("cpu")
+        memory.psi_memory = procfs.read_pressure("memory")
+        memory.psi_io = procfs.read_pressure("io")
+        self.system_info.memory = self.prop_delta("memory", old, memory, values_updated)
+        return values_updated
+
+    def _update_network(self):
         """
-        Reads information about CPU, UP TIME and INTERNET
+        Reads rx/tx rates of every network interface from one read of /proc/net/dev
+        :return: None
+        """
+        values_updated = []
+        self.system_info.interfaces = self.prop_delta(
+            "interfaces", self.system_info.interfaces, self._net_io.poll(), values_updated)
+        return values_updated
+
+    def _update_cpu(self):
+        """
+        Reads information about CPU and UP TIME.
+        CPU load is measured since the previous call, so it does not block.
         :return: None
         """
         values_updated = []
-        psutil.cpu_percent()
-        time.sleep(.2)
         self.system_info.cpu.load = self.prop_delta(
             "load", self.system_info.cpu.load, psutil.cpu_percent(), values_updated)
         self.system_info.cpu.temp = self.prop_delta(
             "temp", self.system_info.cpu.temp, self.get_cpu_temp(), values_updated)
         self.system_info.host.boot_time = self.prop_delta(
-            "boot_time", self.system_info.host.boot_time, psutil.boot_time(), values_updated)
+            "boot_time", self.system_info.host.boot_time, datetime.datetime.fromtimestamp(psutil.boot_time()),
+            values_updated)
+        return values_updated
+
+    def read_internet(self):
+        """
+        :return: tuple (online, online ratio, rtt). Ratio and rtt are None without [self.connectivity]
+        """
+        if self.connectivity is None:
+            return self.internet_connected(), None, None
+        online = self.connectivity.check()
+        return online, self.connectivity.online_ratio.mean, self.connectivity.rtt.mean
+
+    def _apply_internet(self, internet: tuple):
+        values_updated = []
+        online, ratio, rtt = internet
+        if self.connectivity is not None:
+            # statistics only, these change on every probe so they do not trigger [ValueChanged]
+            self.system_info.host.internet_ratio = ratio
+            self.system_info.host.internet_rtt = rtt
         self.system_info.host.internet = self.prop_delta(
-            "internet", self.system_info.host.internet, self.internet_connected(), values_updated)
+            "internet", self.system_info.host.internet, online, values_updated)
         return values_updated
 
+    def _run_collector(self, c):
+        """
+        Runs one collector inline, on the calling thread.
+        :return: a list of [FieldUpdates]
+        """
+        try:
+            with INSTRUMENTS.timer("collector." + c.name):
+                return c.collect(self) or []
+        except Exception:
+            logger.error("collector '{}' failed".format(c.name), exc_info=True)
+        return []
+
+    def _threaded(self, c) -> bool:
+        """ True if [c] reads on a worker thread """
+        return c.cost == collectors.EXPENSIVE and c.can_read and not self._isolated(c)
+
+    def _start_read(self, c):
+        """
+        Starts [c.read] on a worker thread without waiting for it, the result is applied by [_apply_reads].
+        A collector whose previous read has not returned yet (even past its timeout) skips its turn,
+        so a hanging probe holds one thread at most.
+        """
+        if c in self._reads:
+            logger.debug("collector '{}' is still running, skipped".format(c.name))
+            return
+        if self._executor is None:
+            threads = sum(1 for x in self.collectors if x.cost == collectors.EXPENSIVE)
+            self._executor = futures.ThreadPoolExecutor(max_workers=max(1, threads),
+                                                        thread_name_prefix="collector")
+        self._reads[c] = (self._executor.submit(self._timed_read, c), time.monotonic() + c.timeout)
+
+    def _timed_read(self, c):
+        start = time.perf_counter()
+        return c.read(self), time.perf_counter() - start
+
+    def _apply_reads(self):
+        """
+        Applies the results of finished worker thread reads on the polling thread.
+        A read past its timeout is logged once and its result, when it finally returns, is dropped.
+        :return: a list of [FieldUpdates]
+        """
+        updates = []
+        now = time.monotonic()
+        for c, (future, deadline) in list(self._reads.items()):
+            name = "collector." + c.name
+            if not future.done():
+                if deadline is not None and now >= deadline:
+                    INSTRUMENTS.count(name + ".timeouts")
+                    logger.warning("collector '{}' timed out after {}s".format(c.name, c.timeout))
+                    self._reads[c] = (future, None)
+                continue
+            del self._reads[c]
+            if deadline is None:
+                continue
+            try:
+                value, seconds = future.result()
+                INSTRUMENTS.record(name, seconds)
+                updates += c.apply(self, value) or []
+            except Exception:
+                INSTRUMENTS.count(name + ".errors")
+                logger.error("collector '{}' failed".format(c.name), exc_info=True)
+        return updates
+
+    def _reading(self) -> list:
+        """ :return: the futures of the reads that are running and not yet timed out """
+        return [future for future, deadline in self._reads.values() if deadline is not None]
+
+    def _isolated(self, c) -> bool:
+        """ True if [c] runs in a worker process """
+        return self.worker_processes > 0 and c.cost == collectors.EXPENSIVE and c.can_probe
+
+    def _submit(self, c):
+        """ Hands [c] to a worker process, the result is applied by [_apply_results] """
+        if self._workers is None:
+            self._workers = CollectorWorkers(self.worker_processes)
+        if not self._workers.submit(c, c.timeout):
+            logger.debug("collector '{}' is still running, skipped".format(c.name))
+
+    def _apply_results(self):
+        """
+        Applies the results of finished worker process probes. Probes that timed out were killed.
+        :return: a list of [FieldUpdates]
+        """
+        updates = []
+        for r in self._workers.collect() if self._workers is not None else []:
+            name = "collector." + r.collector.name
+            if r.timed_out:
+                INSTRUMENTS.count(name + ".timeouts")
+                logger.warning("collector '{}' timed out after {}s, its worker was killed".format(
+                    r.collector.name, r.collector.timeout))
+                continue
+            if r.error is not None:
+                logger.error("collector '{}' failed in its worker: {}".format(r.collector.name, r.error))
+                continue
+            INSTRUMENTS.record(name, r.seconds)
+            try:
+                updates += r.collector.apply(self, r.value) or []
+            except Exception:
+                logger.error("collector '{}' failed".format(r.collector.name), exc_info=True)
+        return updates
+
+    def poll_once(self):
+        """
+        Runs every collector once, ignoring their intervals.
+        Rate based collectors (cpu load, disk and network I/O) are primed first.
+        :return: a list of [FieldUpdates]
+        """
+        primed = [c for c in self.collectors if c.needs_priming]
+        for c in primed:
+            self._run_collector(c)
+        if primed:
+            time.sleep(.2)
+        updates = []
+        for c in self.collectors:
+            if self._isolated(c):
+                self._submit(c)
+            elif self._threaded(c):
+                self._start_read(c)
+        for c in self.collectors:
+            if not self._isolated(c) and not self._threaded(c):
+                updates += self._run_collector(c)
+        while (self._workers is not None and self._workers.busy) or self._reading():
+            self._wait(1.0)
+            updates += self._apply_results() + self._apply_reads()
+        return updates
+
     def _poll_values(self):
         """
-        At a interval defined by [self._update_delay], this function calls
-        :func:`~systemwatcher.SystemWatcher._update_host_fs` and
-        :func:`~systemwatcher.SystemWatcher._update_cpu_internet_uptime`.
+        Runs each collector in [self.collectors] when its interval has passed.
+        The thread sleeps until the next collector is due, but never longer than [self._update_delay].
+        It also wakes up when an expensive collector's read (worker thread or process) returns, and applies it.
 
         :return: None
         """
         t = threading.currentThread()
         while getattr(t, "do_run", True):
             logger.debug("polling  values from system")
-            updates = self._update_host_fs() + self._update_cpu_internet_uptime()  # merge two lists
-            filter(None, updates)  # remove empty entries
+            now = time.monotonic()
+            updates = []
+            ran = False
+            for c in self.collectors:
+                if now >= c.next_run:
+                    c.next_run = now + c.interval
+                    if self._isolated(c):
+                        self._submit(c)
+                    elif self._threaded(c):
+                        self._start_read(c)
+                    else:
+                        updates += self._run_collector(c)
+                        ran = True
+            if self._workers is not None or self._reads:
+                applied = self._apply_results() + self._apply_reads()
+                ran = ran or len(applied) > 0
+                updates += applied
             with self._delay_lock:
                 tmp_delay = self._update_delay
 
-            # if values_updated:
-            #     kwargs = {"old": self.system_info.host.ip, "new": "a new IP"}
-            #     self.ValueChanged(**kwargs)
-
             if len(updates) > 0:
                 logger.debug("values changed, triggering event!")
                 self.ValueChanged(updates)
-                del updates[:]
-            time.sleep(tmp_delay)
+            if ran and len(self.Sampled) > 0:
+                self.Sampled(customtypes.PollData.from_system_info(self.system_info))
+            next_run = min([c.next_run for c in self.collectors] or [now + tmp_delay])
+            self._wait(max(0.0, min(tmp_delay, next_run - time.monotonic())))
         logger.debug("polling thread stopped")
 
+    def _wait(self, timeout: float):
+        """ Sleeps up to [timeout] seconds, less if a worker process or thread returns a result or times out """
+        reading = self._reading()
+        if self._workers is not None and self._workers.busy:
+            self._workers.wait(timeout)
+        elif reading:
+            now = time.monotonic()
+            timeout = min([timeout] + [max(0.0, d - now) for _, d in self._reads.values() if d is not None])
+            futures.wait(reading, timeout, futures.FIRST_COMPLETED)
+        else:
+            time.sleep(timeout)
+
     @staticmethod
     def _get_ip():
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -192,27 +452,41 @@ class SystemWatcher(object):
     @staticmethod
     def get_cpu_temp():
         try:
-            res = os.popen('vcgencmd measure_temp').readline()
-            res = res.replace("temp=", "").replace("'C\n", "")
-            t = float(res)
-        except:
+            # no subprocess needed where the kernel exposes the SoC temperature (millidegrees)
+            with open('/sys/class/thermal/thermal_zone0/temp') as f:
+                return int(f.read()) / 1000.0
+        except (IOError, OSError, ValueError):
+            pass
+        try:
+            # runs on the polling thread with the cpu collector, so it must never hang
+            res = subprocess.run(["vcgencmd", "measure_temp"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                 universal_newlines=True, timeout=SystemWatcher.VCGENCMD_TIMEOUT).stdout
+            t = float(res.strip().replace("temp=", "").replace("'C", ""))
+        except (OSError, ValueError, subprocess.SubprocessError):
             t = float(0)
         return t
 
     @staticmethod
-    def internet_connected(host="8.8.8.8", port=53):
+    def internet_connected(host="8.8.8.8", port=53, timeout=1):
         """
         Host: 8.8.8.8 (google-public-dns-a.google.com)
         OpenPort: 53/tcp
         Service: domain (DNS/TCP)
+        Single probe, see [connectivity.ConnectivityChecker] for parallel, smoothed probing.
         """
         try:
-            socket.setdefaulttimeout(1)
-            socket.socket(socket.AF_INET, socket.SOCK_STREAM).connect((host, port))
-            return True
-        except Exception:
-            logger.error('Exception occurred', exc_info=True)
+            with socket.create_connection((host, port), timeout=timeout):
+                return True
+        except OSError as e:
+            logger.debug("internet probe {}:{} failed: {}".format(host, port, e))
             return False
 
+    def __enter__(self):
+        return self
+
     def __exit__(self, exc_type, exc_value, traceback):
         self.stop_monitoring()
+        self.ValueChanged.close()
+        self.Sampled.close()
+        if self.connectivity is not None:
+            self.connectivity.close()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import configparser
+import os
+import shutil
+import tempfile
+import unittest
+
+from alerting import AlertManager, CLEARED, ESCALATED, RAISED, Tier, parse_tiers
+from anomaly import Alert
+
+T0 = 1782900000.0  # unix time
+
+
+def _hot(value: float = 71.2) -> Alert:
+    return Alert("cpu_temp", "threshold", value, 65.0, None)
+
+
+class ParseTiersTest(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(parse_tiers("3600 email, 0 mqtt, 900 mqtt email"),
+                         [Tier(0.0, ("mqtt",)), Tier(900.0, ("mqtt", "email")), Tier(3600.0, ("email",))])
+
+    def test_invalid(self):
+        for text in ("", "900", "soon mqtt"):
+            with self.assertRaises(ValueError):
+                parse_tiers(text)
+
+
+class AlertManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.sent = {"mqtt": [], "email": []}
+        self.manager = AlertManager("RPI-B", {c: self.sent[c].append for c in self.sent},
+                                    parse_tiers("0 mqtt, 900 mqtt email"), rate_limit=600.0)
+
+    def tearDown(self):
+        self.manager.close(wait=False)
+
+    def delivered(self) -> dict:
+        """ Waits for the channels to deliver, see [AlertManager.close] """
+        self.manager.close(wait=True)
+        return {c: [(n.condition, n.state, n.tier) for n in lst] for c, lst in self.sent.items()}
+
+    def test_tiers(self):
+        self.manager.sync([_hot()], now=T0)
+        self.manager.tick(now=T0 + 899)
+        self.manager.tick(now=T0 + 900)  # tier 1 is due
+        self.manager.tick(now=T0 + 1800)  # nothing left to escalate
+        self.manager.sync([], now=T0 + 2000)
+        self.assertEqual(self.delivered(), {
+            "mqtt": [("cpu_temp.threshold", RAISED, 0), ("cpu_temp.threshold", ESCALATED, 1),
+                     ("cpu_temp.threshold", CLEARED, 1)],
+            "email": [("cpu_temp.threshold", ESCALATED, 1), ("cpu_temp.threshold", CLEARED, 1)]})
+
+    def test_rate_limit(self):
+        self.manager.sync([_hot()], now=T0)
+        self.manager.sync([], now=T0 + 10)
+        # flapping: raised again right away, but the condition was notified 20 seconds ago
+        self.manager.sync([_hot()], now=T0 + 20)
+        self.manager.tick(now=T0 + 300)
+        self.assertEqual(self.manager.active["cpu_temp.threshold"]["tier"], -1)
+        self.manager.tick(now=T0 + 610)  # rate limit over, the pending notification goes out
+        self.assertEqual(self.delivered()["mqtt"], [("cpu_temp.threshold", RAISED, 0),
+                                                    ("cpu_temp.threshold", CLEARED, 0),
+                                                    ("cpu_temp.threshold", RAISED, 0)])
+
+    def test_clear_without_notification_is_silent(self):
+        self.manager.sync([_hot()], now=T0)
+        self.manager.sync([], now=T0 + 10)
+        self.manager.sync([_hot()], now=T0 + 20)  # rate limited, never notified
+        self.manager.sync([], now=T0 + 30)
+        self.assertEqual([s for _, s, _ in self.delivered()["mqtt"]], [RAISED, CLEARED])
+
+    def test_kinds_and_clear_alerts(self):
+        forecast = Alert("disk_full:/", "forecast", 3.0, 7.0, None)
+        self.manager.sync([_hot(), forecast], now=T0)
+        self.manager.sync([], kinds=("forecast",), now=T0 + 10)  # only forecast conditions are covered
+        self.assertEqual(list(self.manager.active), ["cpu_temp.threshold"])
+        self.manager.feed([Alert("cpu_temp", "cleared", 60.0, 65.0, None)], now=T0 + 20)
+        self.assertEqual(self.manager.active, {})
+
+    def test_rate_limit_overrides(self):
+        config = configparser.ConfigParser()
+        config.read_dict({"alerts": {"tiers": "0 mqtt", "rate_limit": "600", "rate_limit_disk_full": "60",
+                                     "rate_limit_cpu_temp.threshold": "5"}})
+        self.manager.configure(config)
+        self.assertEqual(self.manager._rate_limit("disk_full:/.forecast"), 60.0)
+        self.assertEqual(self.manager._rate_limit("cpu_temp.threshold"), 5.0)
+        self.assertEqual(self.manager._rate_limit("cpu_load.threshold"), 600.0)
+        self.assertEqual(self.manager.tiers, [Tier(0.0, ("mqtt",))])
+
+    def test_save_and_load(self):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, "alerts.json")
+            self.manager.sync([_hot()], now=T0)
+            self.manager.save(filename)
+            other = AlertManager("RPI-B", {}).load(filename)
+            self.assertEqual(other.active, self.manager.active)
+            self.assertEqual(other.last_sent, {"cpu_temp.threshold": T0})
+            other.close()
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
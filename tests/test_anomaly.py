@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import configparser
+import datetime
+import unittest
+
+from anomaly import AnomalyDetector, Ewma, Latch, MetricDetector
+from customtypes import Memory, PollData
+
+
+class EwmaTest(unittest.TestCase):
+    def test_mean_and_variance(self):
+        e = Ewma(0.5)
+        self.assertIsNone(e.mean)
+        for x in (10.0, 20.0, 20.0):
+            e.update(x)
+        self.assertEqual((e.count, e.mean), (3, 17.5))
+        self.assertGreater(e.std, 0.0)
+
+
+class LatchTest(unittest.TestCase):
+    def test_sustain(self):
+        latch = Latch(3)
+        self.assertEqual([latch.update(b, not b) for b in (True, True, False, True, True, True)],
+                         [None, None, None, None, None, "trip"])
+        self.assertEqual([latch.update(False, c) for c in (True, False, True, True, True)],
+                         [None, None, None, None, "clear"])
+
+
+class MetricDetectorTest(unittest.TestCase):
+    def test_threshold_with_hysteresis(self):
+        d = MetricDetector("cpu_temp", threshold=70.0, sustain=2, hysteresis=5.0, warmup=1000)
+        kinds = [[a.kind for a in d.update(v)] for v in (71, 60, 71, 72, 68, 67, 64, 63)]
+        # one spike does not trip, 68 and 67 are inside the hysteresis band
+        self.assertEqual(kinds, [[], [], [], ["threshold"], [], [], [], ["cleared"]])
+        self.assertFalse(d.breached)
+
+    def test_deviation_from_baseline(self):
+        d = MetricDetector("cpu_load", sustain=2, warmup=30)
+        alerts = []
+        for i in range(100):
+            alerts += d.update(10.0 + (i % 2))
+        self.assertEqual(alerts, [])
+        # a level shift: the fast average moves away from the baseline faster than the noise settles
+        for _ in range(20):
+            alerts += d.update(60.0)
+        self.assertEqual([a.kind for a in alerts], ["deviation"])
+        self.assertTrue(d.breached)
+
+    def test_missing_values_are_ignored(self):
+        d = MetricDetector("memory_percent", threshold=50.0, sustain=1)
+        self.assertEqual(d.update(None), [])
+        self.assertEqual(d.baseline.count, 0)
+
+
+class AnomalyDetectorTest(unittest.TestCase):
+    def config(self, cpu_load: str = "80") -> configparser.ConfigParser:
+        config = configparser.ConfigParser()
+        config.read_dict({"warning_thresholds": {"cpu_utilization_percent": cpu_load, "cpu_temp": "70",
+                                                 "disk_used_percent": "90", "memory_utilization": "95"},
+                          "anomaly": {"sustain_samples": "1", "warmup_samples": "1000"}})
+        return config
+
+    def test_feed_and_set_thresholds(self):
+        detector = AnomalyDetector.from_config(self.config())
+        when = datetime.datetime(2026, 7, 1, 12, 0)
+        sample = PollData(when, 85.0, 50.0, 40.0, True, memory=Memory(percent=30.0))
+        self.assertEqual([(a.metric, a.kind, a.when) for a in detector.feed(sample)],
+                         [("cpu_load", "threshold", when)])
+
+        detector.set_thresholds(self.config("100"))
+        self.assertEqual([a.kind for a in detector.feed(sample)], ["cleared"])
+        self.assertEqual(detector.detectors[0].fast.count, 2)  # the baseline is kept
+
+
+if __name__ == "__main__":
+    unittest.main()
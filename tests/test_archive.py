@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+import math
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from archive import SegmentArchive
+from customtypes import Memory, PollData, PollDataBatch
+from datalogger import DataLogger
+
+
+def _sample(when: datetime.datetime, load: float = 12.5, memory: float = 40.0) -> PollData:
+    return PollData(when, load, 48.25, 61.0, True, memory=Memory(percent=memory))
+
+
+class SegmentArchiveTest(unittest.TestCase):
+    TZ = "Europe/Stockholm"  # CET in winter, CEST (+1 hour) in summer
+
+    def setUp(self):
+        self._tz = os.environ.get("TZ")
+        os.environ["TZ"] = SegmentArchiveTest.TZ
+        time.tzset()
+        self.directory = tempfile.mkdtemp()
+        self.archive = SegmentArchive(os.path.join(self.directory, "archive"), "RPI-B")
+
+    def tearDown(self):
+        if self._tz is None:
+            del os.environ["TZ"]
+        else:
+            os.environ["TZ"] = self._tz
+        time.tzset()
+        shutil.rmtree(self.directory)
+
+    def test_round_trip_across_dst(self):
+        # winter time, the night the clocks go forward (2026-03-29 02:00 -> 03:00), and summer time
+        when = [datetime.datetime(2026, 1, 15, 12, 0), datetime.datetime(2026, 3, 29, 1, 59),
+                datetime.datetime(2026, 3, 29, 3, 0), datetime.datetime(2026, 7, 1, 12, 0)]
+        samples = [_sample(w, load=i) for i, w in enumerate(when)]
+        entry = self.archive.write_segment(samples)
+        self.assertEqual((entry["start"], entry["end"]), (when[0].timestamp(), when[-1].timestamp()))
+
+        rows = list(self.archive.iter_columns(["cpu_load", "memory_percent"]))
+        self.assertEqual(rows, [(w.timestamp(), float(i), 40.0) for i, w in enumerate(when)])
+        self.assertEqual([p.when for p in self.archive.read_batch()], when)
+
+        # the range filter uses the same clock
+        summer = list(self.archive.iter_columns(["cpu_load"], datetime.datetime(2026, 7, 1, 12, 0),
+                                                datetime.datetime(2026, 7, 1, 12, 1)))
+        self.assertEqual(summer, [(when[-1].timestamp(), 3.0)])
+
+    def test_same_rows_as_the_text_store(self):
+        when = [datetime.datetime(2026, 7, 1, 12, 0), datetime.datetime(2026, 7, 1, 12, 1)]
+        filename = os.path.join(self.directory, "polldata.dat")
+        DataLogger.create_data_log(filename, email_date=when[0], mqtt_date=when[0])
+        for w in when:
+            DataLogger.writeline_to_data_log(filename, _sample(w))
+        self.archive.write_segment(DataLogger.read_data_log(filename, False)[2])
+
+        metrics = list(PollDataBatch.COLUMNS[1:])
+        self.assertEqual(list(self.archive.iter_columns(metrics)), list(DataLogger.iter_columns(filename, metrics)))
+
+    def test_write_batch_from_store_rows(self):
+        when = datetime.datetime(2026, 7, 1, 12, 0)
+        batch = PollDataBatch.from_rows([(when.timestamp(), 1.0, 2.0, 3.0, 1.0, 4.0)])
+        self.archive.write_segment(batch)
+        self.assertEqual(self.archive.read_batch()[0].when, when)
+
+    def test_non_finite_values_are_missing(self):
+        when = datetime.datetime(2026, 7, 1, 12, 0)
+        self.archive.write_segment([_sample(when, load=math.inf, memory=-math.inf)])
+        self.assertEqual(list(self.archive.iter_columns(["cpu_load", "memory_percent"])),
+                         [(when.timestamp(), None, None)])
+
+
+if __name__ == "__main__":
+    unittest.main()
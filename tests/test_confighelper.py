@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from confighelper import ConfigWatcher, load_config
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.ini")
+
+
+class ConfigWatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "config.ini")
+        shutil.copyfile(CONFIG_FILE, self.filename)
+        with open(self.filename) as file:
+            self.text = file.read()
+        self.changes = []
+        self.watcher = ConfigWatcher(self.filename, 0.01, lambda old, new: self.changes.append((old, new)))
+
+    def tearDown(self):
+        self.watcher.stop()
+        shutil.rmtree(self.directory)
+
+    def edit(self, old: str, new: str, seconds: int):
+        """ Rewrites the config with [old] replaced and moves its modification time [seconds] ahead """
+        with open(self.filename, "w") as file:
+            file.write(self.text.replace(old, new, 1))
+        stamp = os.stat(CONFIG_FILE).st_mtime + seconds
+        os.utime(self.filename, (stamp, stamp))
+
+    def test_load_config(self):
+        cfg = load_config(self.filename)
+        self.assertEqual(cfg.thresholds.cpu_temp, 65)
+        self.assertEqual(cfg.sample_interval, 1.0)
+        self.assertFalse(cfg.instrumentation)
+        with self.assertRaises(ValueError):
+            load_config(os.path.join(self.directory, "missing.ini"))
+
+    def test_reload(self):
+        old = self.watcher.current
+        self.assertFalse(self.watcher.reload())  # unchanged
+        self.edit("cpu_temp : 65", "cpu_temp : 75", 10)
+        self.assertTrue(self.watcher.reload())
+        self.assertEqual(self.watcher.current.thresholds.cpu_temp, 75)
+        self.assertEqual(self.changes, [(old, self.watcher.current)])
+        self.assertFalse(self.watcher.reload())
+
+    def test_invalid_edit_keeps_the_previous_snapshot(self):
+        old = self.watcher.current
+        self.edit("sample_interval : 1 ", "sample_interval : 0 ", 10)
+        with self.assertLogs("confighelper", "ERROR"):
+            self.assertFalse(self.watcher.reload())
+        self.assertIs(self.watcher.current, old)
+        self.assertEqual(self.changes, [])
+
+        # fixing the file picks it up again
+        self.edit("cpu_temp : 65", "cpu_temp : 70", 20)
+        self.assertTrue(self.watcher.reload())
+        self.assertEqual(self.watcher.current.thresholds.cpu_temp, 70)
+
+    def test_failing_on_change_still_swaps(self):
+        def on_change(old, new):
+            raise RuntimeError("cannot apply")
+        self.watcher.on_change = on_change
+        self.edit("cpu_temp : 65", "cpu_temp : 75", 10)
+        with self.assertLogs("confighelper", "ERROR"):
+            self.assertTrue(self.watcher.reload())
+        self.assertEqual(self.watcher.current.thresholds.cpu_temp, 75)
+
+    def test_watcher_thread(self):
+        self.watcher.start()
+        self.edit("cpu_temp : 65", "cpu_temp : 75", 10)
+        deadline = time.monotonic() + 5.0
+        while not self.changes and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.watcher.current.thresholds.cpu_temp, 75)
+        self.watcher.stop()
+        self.watcher._thread.join(5.0)
+        self.assertFalse(self.watcher._thread.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import http.server
+import os
+import socket
+import struct
+import threading
+import time
+import unittest
+
+from connectivity import ConnectivityChecker, parse_target
+
+
+def _open_fds() -> int:
+    return len(os.listdir("/proc/self/fd"))
+
+
+class _DnsStub(object):
+    """ Answers every query with a bare header carrying the query id, or never answers if [silent] """
+
+    def __init__(self, silent: bool = False):
+        self.silent = silent
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.port = self.sock.getsockname()[1]
+        self.queries = 0
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                data, address = self.sock.recvfrom(512)
+            except OSError:
+                return  # closed
+            self.queries += 1
+            if not self.silent:
+                self.sock.sendto(data[:2] + struct.pack(">HHHHH", 0x8180, 1, 0, 0, 0), address)
+
+    def close(self):
+        self.sock.close()
+
+
+class _HttpHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_HEAD(self):
+        self.send_response(self.server.status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class _HttpStub(object):
+    def __init__(self, status: int = 200):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _HttpHandler)
+        self.server.daemon_threads = True
+        self.server.status = status
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ParseTargetTest(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(tuple(parse_target("tcp://8.8.8.8:53")), ("tcp", "8.8.8.8", 53, "/"))
+        self.assertEqual(tuple(parse_target("dns://1.1.1.1")), ("dns", "1.1.1.1", 53, "/"))
+        self.assertEqual(tuple(parse_target("http://example.com/health")), ("http", "example.com", 80, "/health"))
+        with self.assertRaises(ValueError):
+            parse_target("icmp://8.8.8.8")
+
+
+class ConnectivityCheckerTest(unittest.TestCase):
+    def setUp(self):
+        # a listening socket completes TCP handshakes from its backlog without ever accepting
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(16)
+        self.tcp_port = self.listener.getsockname()[1]
+        self.dns = _DnsStub()
+        self.http = _HttpStub()
+        self.closed_port = self._free_port()
+        self.checkers = []
+
+    def tearDown(self):
+        for c in self.checkers:
+            c.close()
+        self.listener.close()
+        self.dns.close()
+        self.http.close()
+
+    @staticmethod
+    def _free_port() -> int:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.bind(("127.0.0.1", 0))
+            return s.getsockname()[1]
+
+    def checker(self, targets: list, **kwargs) -> ConnectivityChecker:
+        c = ConnectivityChecker(targets, **kwargs)
+        self.checkers.append(c)
+        return c
+
+    def targets(self) -> list:
+        return ["tcp://127.0.0.1:{}".format(self.tcp_port), "dns://127.0.0.1:{}".format(self.dns.port),
+                "http://127.0.0.1:{}/".format(self.http.port), "tcp://127.0.0.1:{}".format(self.closed_port)]
+
+    def test_quorum(self):
+        online = self.checker(self.targets(), timeout=1.0, quorum=3)
+        self.assertTrue(online.check())
+        self.assertEqual(self.dns.queries, 1)
+        self.assertIsNotNone(online.rtt.mean)
+        self.assertEqual((online.probes, online.failures, online.online_ratio.mean), (1, 0, 100.0))
+
+        offline = self.checker(self.targets(), timeout=1.0, quorum=4)
+        self.assertFalse(offline.check())
+        self.assertEqual((offline.probes, offline.failures, offline.online_ratio.mean), (1, 1, 0.0))
+
+    def test_http_server_error_is_offline(self):
+        self.http.server.status = 503
+        c = self.checker(["http://127.0.0.1:{}/".format(self.http.port)], timeout=1.0)
+        self.assertFalse(c.check())
+        self.http.server.status = 404  # the server answers, so the host is online
+        self.assertTrue(c.check(force=True))
+
+    def test_backoff_and_force(self):
+        c = self.checker(self.targets()[:1], timeout=1.0, min_interval=10.0, max_interval=40.0)
+        self.assertTrue(c.check())
+        self.assertEqual((c.probes, c.interval), (1, 10.0))
+
+        # not due yet: the last result is returned without probing
+        self.assertTrue(c.check())
+        self.assertEqual(c.probes, 1)
+
+        # a stable state doubles the interval up to [max_interval]
+        for interval in (20.0, 40.0, 40.0):
+            self.assertTrue(c.check(force=True))
+            self.assertEqual(c.interval, interval)
+        self.assertEqual(c.probes, 4)
+
+        # a change goes back to [min_interval]
+        self.listener.close()
+        self.assertFalse(c.check(force=True))
+        self.assertEqual((c.interval, c.failures), (10.0, 1))
+        self.assertFalse(c.check())
+        self.assertEqual(c.probes, 5)
+
+    def test_timeouts(self):
+        silent_dns = _DnsStub(silent=True)
+        try:
+            # the tcp listener never accepts, so an http request on it is never answered
+            c = self.checker(["dns://127.0.0.1:{}".format(silent_dns.port),
+                              "http://127.0.0.1:{}/".format(self.tcp_port)], timeout=0.2)
+            start = time.monotonic()
+            self.assertFalse(c.check())
+            # dns waits one timeout, http one per attempt and the probes run in parallel
+            self.assertLess(time.monotonic() - start, 1.5)
+            self.assertEqual(silent_dns.queries, 1)
+            self.assertIsNone(socket.getdefaulttimeout())
+        finally:
+            silent_dns.close()
+
+    @unittest.skipUnless(os.path.isdir("/proc/self/fd"), "needs /proc/self/fd")
+    def test_sockets_are_closed(self):
+        c = self.checker(self.targets(), timeout=0.5, quorum=3)
+        c.check()  # starts the probe threads
+        before = _open_fds()
+        for _ in range(3):
+            c.check(force=True)
+        # only the kept-alive http connection stays open between checks
+        self.assertEqual(_open_fds(), before)
+        http_con = list(c._http.values())[0]
+        self.assertIsNotNone(http_con.sock)
+
+        c.close()
+        self.assertIsNone(http_con.sock)
+        self.assertEqual(c._http, {})
+        self.assertLessEqual(_open_fds(), before - 1)  # the stub may close its side a moment later
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import unittest
+
+from customtypes import FieldUpdates
+from eventbus import BLOCK, COALESCE, DROP_OLDEST, EventBus
+
+
+class _Gated(object):
+    """ A handler that holds on to its first notification until [gate] opens, so the queue fills up """
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.started = threading.Event()
+        self.received = []
+
+    def __call__(self, *args):
+        self.started.set()
+        self.gate.wait(5.0)
+        self.received.append(args)
+
+
+class EventBusTest(unittest.TestCase):
+    def setUp(self):
+        self.bus = EventBus()
+
+    def tearDown(self):
+        self.bus.close()
+
+    def fill(self, policy: str, values: list, **kwargs) -> _Gated:
+        """ Publishes [values] to a blocked subscriber with a queue of 2, then lets it run """
+        handler = _Gated()
+        sub = self.bus.subscribe(handler, policy=policy, maxsize=2, **kwargs)
+        self.bus(values[0])
+        self.assertTrue(handler.started.wait(5.0))
+        for v in values[1:]:
+            self.bus(v)
+        handler.gate.set()
+        sub.close(wait=True)
+        self.sub = sub
+        return handler
+
+    def test_delivery_in_order(self):
+        received = []
+        self.bus += received.append
+        self.assertEqual(len(self.bus), 1)
+        for i in range(50):
+            self.bus(i)
+        self.bus.close(wait=True)
+        self.assertEqual(received, list(range(50)))
+
+    def test_publish_does_not_wait_for_handlers(self):
+        handler = _Gated()
+        self.bus += handler
+        start = time.monotonic()
+        self.bus("slow")
+        self.bus("slow")
+        self.assertLess(time.monotonic() - start, 1.0)
+        handler.gate.set()
+
+    def test_drop_oldest(self):
+        handler = self.fill(DROP_OLDEST, [0, 1, 2, 3, 4])
+        self.assertEqual(handler.received, [(0,), (3,), (4,)])
+        self.assertEqual(self.sub.dropped, 2)
+
+    def test_coalesce_merges_field_updates(self):
+        handler = self.fill(COALESCE, [[FieldUpdates("load", 0, 1)], [FieldUpdates("load", 1, 2)],
+                                       [FieldUpdates("temp", 40, 41)], [FieldUpdates("load", 2, 3)],
+                                       [FieldUpdates("temp", 41, 42), FieldUpdates("ip", "a", "b")]])
+        self.assertEqual(handler.received[1:], [([FieldUpdates("load", 1, 2)],),
+                                                ([FieldUpdates("temp", 40, 42), FieldUpdates("load", 2, 3),
+                                                  FieldUpdates("ip", "a", "b")],)])
+        self.assertEqual(self.sub.dropped, 0)
+
+    def test_block_with_timeout(self):
+        handler = self.fill(BLOCK, [0, 1, 2, 3], block_timeout=0.1)
+        self.assertEqual(handler.received, [(0,), (1,), (2,)])
+        self.assertEqual(self.sub.dropped, 1)
+
+    def test_fields_filter(self):
+        received = []
+        self.bus.subscribe(received.append, fields=["load"])
+        self.bus([FieldUpdates("temp", 40, 41)])
+        self.bus([FieldUpdates("temp", 41, 42), FieldUpdates("load", 1, 2)])
+        self.bus.close(wait=True)
+        self.assertEqual(received, [[FieldUpdates("load", 1, 2)]])
+
+    def test_failing_handler_keeps_its_subscription(self):
+        received = []
+
+        def handler(x):
+            if x == 0:
+                raise RuntimeError("broken handler")
+            received.append(x)
+        self.bus += handler
+        self.bus(0)
+        self.bus(1)
+        self.bus.close(wait=True)
+        self.assertEqual(received, [1])
+
+    def test_unsubscribe(self):
+        received = []
+        self.bus += received.append
+        self.bus -= received.append
+        self.assertEqual(len(self.bus), 0)
+        self.bus(1)
+        self.assertEqual(received, [])
+        with self.assertRaises(ValueError):
+            self.bus.unsubscribe(received.append)
+        with self.assertRaises(ValueError):
+            self.bus.subscribe(received.append, policy="ignore")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+import http.client
+import time
+import unittest
+
+from customtypes import FieldUpdates, Memory, MountUsage, PollData, SystemInfo
+from eventbus import EventBus
+from exporter import CONTENT_TYPE, MetricsExporter
+
+
+class _Watcher(object):
+    """ What the exporter uses of a [SystemWatcher] """
+
+    def __init__(self):
+        self.system_info = SystemInfo()
+        self.ValueChanged = EventBus()
+
+
+class MetricsExporterTest(unittest.TestCase):
+    def setUp(self):
+        self.watcher = _Watcher()
+        si = self.watcher.system_info
+        si.cpu.load = 12.5
+        si.host.internet = True
+        si.fs.mounts = {"/": MountUsage("/", 1000, 400, 40.0, "/dev/sda1")}
+        si.memory = Memory(8000, 6000, 25.0, 0, 0.0, psi_io=1.5)
+        self.exporter = MetricsExporter(self.watcher, "RPI \"B\"", "127.0.0.1", 0).start()
+        self.port = self.exporter._server.server_port
+
+    def tearDown(self):
+        self.exporter.stop()
+        self.watcher.ValueChanged.close()
+
+    def get(self, path: str = "/metrics"):
+        con = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+        try:
+            con.request("GET", path)
+            resp = con.getresponse()
+            return resp.status, resp.getheader("Content-Type"), resp.read().decode("utf-8")
+        finally:
+            con.close()
+
+    def test_scrape(self):
+        status, content_type, body = self.get()
+        self.assertEqual((status, content_type), (200, CONTENT_TYPE))
+        lines = body.splitlines()
+        self.assertIn("# TYPE watchtorian_cpu_load_percent gauge", lines)
+        self.assertIn("watchtorian_cpu_load_percent{host=\"RPI \\\"B\\\"\"} 12.5", lines)
+        self.assertIn("watchtorian_internet_up{host=\"RPI \\\"B\\\"\"} 1.0", lines)
+        self.assertIn("watchtorian_mount_used_percent{device=\"/dev/sda1\",host=\"RPI \\\"B\\\"\",mount=\"/\"} 40.0",
+                      lines)
+        self.assertIn("watchtorian_pressure_some_percent{host=\"RPI \\\"B\\\"\",resource=\"io\"} 1.5", lines)
+        # not measured yet: no sample and no empty family
+        self.assertNotIn("cpu_temp_celsius", body)
+        self.assertNotIn("rollup_", body)
+        self.assertEqual(self.get("/other")[0], 404)
+
+    def test_rollups(self):
+        when = datetime.datetime(2026, 7, 1, 12, 0)
+        self.exporter.set_rollups([PollData(when - datetime.timedelta(days=1), 1.0, 40.0, 50.0, 100.0),
+                                   PollData(when, 20.0, 40.0, 50.0, 99.0)])
+        lines = self.get()[2].splitlines()
+        self.assertIn("watchtorian_rollup_cpu_load_percent{host=\"RPI \\\"B\\\"\"} 20.0", lines)
+        self.assertIn("watchtorian_rollup_period_end_timestamp_seconds{{host=\"RPI \\\"B\\\"\"}} {}".format(
+            repr(when.timestamp())), lines)
+
+    def test_rendered_on_value_changed(self):
+        self.watcher.system_info.cpu.load = 99.0
+        self.assertNotIn("} 99.0", self.get()[2])  # a scrape never renders
+        self.watcher.ValueChanged([FieldUpdates("load", 12.5, 99.0)])
+        deadline = time.monotonic() + 5.0
+        while "} 99.0" not in self.exporter.body.decode("utf-8") and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertIn("watchtorian_cpu_load_percent{host=\"RPI \\\"B\\\"\"} 99.0", self.get()[2].splitlines())
+
+
+if __name__ == "__main__":
+    unittest.main()
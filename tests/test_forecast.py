@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from archive import SegmentArchive
+from customtypes import MountUsage, PollData
+from datalogger import DataLogger
+from forecast import DiskForecaster, LinearTrend
+from sqlitelogger import SqliteDataLogger
+
+DAY = 86400.0
+START = datetime.datetime(2026, 7, 1, 12, 0)
+
+
+def _disk(days: float, percent: float, mount_percent: float = None) -> PollData:
+    mounts = [MountUsage("/data", 1000, 500, mount_percent)] if mount_percent is not None else None
+    return PollData(START + datetime.timedelta(days=days), 10.0, 40.0, percent, True, mounts=mounts)
+
+
+class LinearTrendTest(unittest.TestCase):
+    def test_slope_and_time_to(self):
+        trend = LinearTrend()
+        for day in range(5):
+            trend.update(day * DAY, 50.0 + day)
+        self.assertAlmostEqual(trend.slope * DAY, 1.0)
+        self.assertAlmostEqual(trend.time_to(100.0, 4 * DAY) / DAY, 46.0)
+
+    def test_needs_samples_and_growth(self):
+        trend = LinearTrend()
+        trend.update(0.0, 50.0)
+        trend.update(DAY, 51.0)
+        self.assertIsNone(trend.time_to(100.0, DAY))
+        for day in range(2, 5):
+            trend.update(day * DAY, 50.0)
+        trend.update(5 * DAY, 40.0)
+        self.assertIsNone(trend.time_to(100.0, 5 * DAY))
+
+    def test_outlier_is_down_weighted(self):
+        trend = LinearTrend()
+        for day in range(10):
+            trend.update(day * DAY, 50.0 + day + (0.1 if day % 2 else -0.1))
+        trend.update(10 * DAY, 10.0)  # a cleanup
+        self.assertGreater(trend.slope * DAY, 0.5)
+
+
+class DiskForecasterTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.state = os.path.join(self.directory, "forecast.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_warnings_within_horizon(self):
+        forecaster = DiskForecaster(horizon=30 * DAY).seed([_disk(d, 50.0 + d, 90.0 + d) for d in range(5)])
+        now = START + datetime.timedelta(days=4)
+        self.assertEqual([m for m, _ in forecaster.warnings(now)], ["/data"])
+        self.assertAlmostEqual(forecaster.time_to_full("/data", now) / DAY, 6.0)
+        self.assertAlmostEqual(forecaster.time_to_full(now=now) / DAY, 46.0)
+
+    def test_save_and_load(self):
+        forecaster = DiskForecaster(30 * DAY, DAY).seed([_disk(d, 50.0 + d) for d in range(5)])
+        forecaster.save(self.state)
+        loaded = DiskForecaster.load(self.state, 30 * DAY, DAY)
+        now = START + datetime.timedelta(days=4)
+        self.assertAlmostEqual(loaded.time_to_full(now=now), forecaster.time_to_full(now=now))
+        self.assertIsNone(DiskForecaster.load(os.path.join(self.directory, "missing.json"), DAY))
+
+    def test_seed_from_store(self):
+        filename = os.path.join(self.directory, "polldata.dat")
+        DataLogger.create_data_log(filename, email_date=START, mqtt_date=START,
+                                   aggregate_data=[_disk(d, 50.0 + d) for d in range(3)])
+        for d in range(3, 5):
+            DataLogger.writeline_to_data_log(filename, _disk(d, 50.0 + d))
+        forecaster = DiskForecaster.load_or_seed(self.state, 30 * DAY, None, DataLogger(), filename)
+        self.assertEqual(forecaster.trends[DiskForecaster.DEFAULT_MOUNT].count, 5)
+
+        # a saved state wins over the history
+        DiskForecaster(30 * DAY).save(self.state)
+        self.assertEqual(DiskForecaster.load_or_seed(self.state, 30 * DAY, None, DataLogger(), filename).trends, {})
+
+    def test_first_run_with_sqlite(self):
+        # a fresh install: neither forecast state nor database exist yet
+        filename = os.path.join(self.directory, "polldata.db")
+        store = SqliteDataLogger("RPI-B")
+        archive = SegmentArchive(os.path.join(self.directory, "archive"), "RPI-B")
+        forecaster = DiskForecaster.load_or_seed(self.state, 30 * DAY, None, store, filename, archive)
+        self.assertEqual(forecaster.trends, {})
+        self.assertFalse(os.path.exists(filename))
+
+        # the rest of a cron run: store the sample, update the trend, read the report history
+        data = _disk(0, 50.0)
+        store.writeline_to_data_log(filename, data)
+        forecaster.update(data.when, data.disk_usage_percent)
+        forecaster.save(self.state)
+        self.assertEqual(store.read_data_log(filename, True)[0], datetime.datetime.min)
+        self.assertEqual(DiskForecaster.load_or_seed(self.state, 30 * DAY, None, store, filename)
+                         .trends[DiskForecaster.DEFAULT_MOUNT].count, 1)
+        store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import procfs
+
+DISKSTATS = """   8       0 sda {reads} 10 {sectors_read} 400 {writes} 20 {sectors_written} 600 0 {ms_io} 1000 0 0 0 0
+   8       1 sda1 5 0 40 4 2 0 16 6 0 10 10 0 0 0 0
+   7       0 loop0 1 0 2 0 0 0 0 0 0 0 0 0 0 0 0
+"""
+
+MEMINFO = """MemTotal:        1000000 kB
+MemFree:          100000 kB
+MemAvailable:     250000 kB
+Buffers:           10000 kB
+SwapTotal:        200000 kB
+SwapFree:         150000 kB
+"""
+
+NET_DEV = """Inter-|   Receive                                                |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed
+    lo: 9999 99 0 0 0 0 0 0 9999 99 0 0 0 0 0 0
+  eth0: {rx} 100 1 2 0 0 0 0 {tx} 50 3 4 0 0 0 0
+"""
+
+PRESSURE = """some avg10=1.50 avg60=1.00 avg300=0.50 total=12345
+full avg10=0.25 avg60=0.10 avg300=0.05 total=2345
+"""
+
+
+class ProcfsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name: str, text: str) -> str:
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as file:
+            file.write(text)
+        return path
+
+    @staticmethod
+    def one_second_later(meter):
+        """ Makes the next poll see exactly one second since the previous one """
+        meter._prev_t = time.monotonic() - 1.0
+
+    def test_read_diskstats(self):
+        path = self.write("diskstats", DISKSTATS.format(reads=100, sectors_read=800, writes=50, sectors_written=400,
+                                                        ms_io=200))
+        self.assertEqual(procfs.read_diskstats(path, {"sda"}), {"sda": (100, 800, 400, 50, 400, 600, 200)})
+        self.assertEqual(sorted(procfs.read_diskstats(path)), ["loop0", "sda", "sda1"])
+        self.assertEqual(procfs.read_diskstats(os.path.join(self.directory, "missing")), {})
+
+    def test_disk_io_rates(self):
+        path = self.write("diskstats", DISKSTATS.format(reads=100, sectors_read=800, writes=50, sectors_written=400,
+                                                        ms_io=200))
+        meter = procfs.DiskIoMeter(path, {"sda"})
+        self.assertEqual(meter.poll(), {})  # rates need two readings
+        self.write("diskstats", DISKSTATS.format(reads=110, sectors_read=1000, writes=60, sectors_written=600,
+                                                 ms_io=700))
+        self.one_second_later(meter)
+        io = meter.poll()["sda"]
+        self.assertAlmostEqual(io.read_bps, 200 * procfs.SECTOR_SIZE, delta=1000)
+        self.assertAlmostEqual(io.read_iops, 10.0, delta=0.1)
+        self.assertAlmostEqual(io.busy_percent, 50.0, delta=1.0)
+
+        # a counter reset never gives negative rates
+        self.write("diskstats", DISKSTATS.format(reads=0, sectors_read=0, writes=0, sectors_written=0, ms_io=0))
+        self.one_second_later(meter)
+        self.assertEqual(meter.poll()["sda"].read_bps, 0.0)
+
+    def test_read_meminfo(self):
+        memory = procfs.read_meminfo(self.write("meminfo", MEMINFO))
+        self.assertEqual((memory.total, memory.available, memory.swap_total), (1024000000, 256000000, 204800000))
+        self.assertAlmostEqual(memory.percent, 75.0)
+        self.assertAlmostEqual(memory.swap_percent, 25.0)
+        self.assertIsNone(memory.psi_cpu)
+        self.assertIsNone(procfs.read_meminfo(os.path.join(self.directory, "missing")))
+
+    def test_read_meminfo_without_available(self):
+        # kernels before 3.14 have no MemAvailable
+        memory = procfs.read_meminfo(self.write("meminfo", MEMINFO.replace("MemAvailable:     250000 kB\n", "")))
+        self.assertAlmostEqual(memory.percent, 90.0)
+
+    def test_read_pressure(self):
+        self.write("cpu", PRESSURE)
+        self.assertEqual(procfs.read_pressure("cpu", self.directory + os.sep), 1.5)
+        self.assertIsNone(procfs.read_pressure("io", self.directory + os.sep))
+
+    def test_net_io_rates(self):
+        path = self.write("dev", NET_DEV.format(rx=1000, tx=500))
+        self.assertEqual(procfs.read_net_dev(path), {"eth0": (1000, 100, 3, 500, 50, 7)})
+        meter = procfs.NetIoMeter(path)
+        self.assertEqual(meter.poll(), {})
+        self.write("dev", NET_DEV.format(rx=3000, tx=1500))
+        self.one_second_later(meter)
+        net = meter.poll()["eth0"]
+        self.assertAlmostEqual(net.rx_bps, 2000.0, delta=10.0)
+        self.assertAlmostEqual(net.tx_bps, 1000.0, delta=10.0)
+        self.assertEqual(net.errors, 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+import io
+import json
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import query as q
+from archive import SegmentArchive
+from customtypes import Memory, PollData
+from datalogger import DataLogger
+from sqlitelogger import SqliteDataLogger
+
+START = datetime.datetime(2026, 7, 1, 12, 0)
+
+
+def _at(days: int, load: float = None, minutes: int = 0) -> PollData:
+    return PollData(START + datetime.timedelta(days=days, minutes=minutes), float(days) if load is None else load,
+                    40.0, 50.0, 100.0, memory=Memory(percent=25.0))
+
+
+def _day(days: int) -> datetime.datetime:
+    return START + datetime.timedelta(days=days)
+
+
+class QueryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.text_file = os.path.join(self.directory, "polldata.dat")
+        # aggregates out of order, as in logs written by older versions
+        DataLogger.create_data_log(self.text_file, email_date=START, mqtt_date=START,
+                                   aggregate_data=[_at(3), _at(0), _at(2), _at(1)])
+        for minutes in range(3):
+            DataLogger.writeline_to_data_log(self.text_file, _at(4, 10.0 + minutes, minutes))
+        self.db_file = os.path.join(self.directory, "polldata.db")
+        self.sqlite = SqliteDataLogger("RPI-B")
+        self.sqlite.create_data_log(self.db_file, email_date=START, mqtt_date=START,
+                                    aggregate_data=[_at(3), _at(0), _at(2), _at(1)])
+        self.sqlite.writelines_to_data_log(self.db_file, [_at(4, 10.0 + minutes, minutes) for minutes in range(3)])
+
+    def tearDown(self):
+        self.sqlite.close()
+        shutil.rmtree(self.directory)
+
+    def stores(self):
+        return [(DataLogger(), self.text_file), (self.sqlite, self.db_file)]
+
+    def rows(self, store, filename, resolution, start=None, end=None) -> list:
+        return [(datetime.datetime.fromtimestamp(r[0]), r[1])
+                for r in store.iter_columns(filename, ["cpu_load"], resolution, start, end)]
+
+    def test_rollup_out_of_order(self):
+        for store, filename in self.stores():
+            self.assertEqual(self.rows(store, filename, "rollup"), [(_day(d), float(d)) for d in range(4)])
+            self.assertEqual(self.rows(store, filename, "rollup", end=_day(2)), [(_day(0), 0.0), (_day(1), 1.0)])
+            self.assertEqual(self.rows(store, filename, "rollup", _day(1), _day(3)), [(_day(1), 1.0), (_day(2), 2.0)])
+
+    def test_raw_range(self):
+        for store, filename in self.stores():
+            self.assertEqual([r[1] for r in self.rows(store, filename, "raw")], [10.0, 11.0, 12.0])
+            self.assertEqual(self.rows(store, filename, "raw", _day(4) + datetime.timedelta(minutes=1),
+                                       _day(4) + datetime.timedelta(minutes=2)),
+                             [(_day(4) + datetime.timedelta(minutes=1), 11.0)])
+
+    def test_unknown_metric(self):
+        for store, filename in self.stores():
+            with self.assertRaises(ValueError):
+                list(store.iter_columns(filename, ["fan_speed"]))
+        with self.assertRaises(ValueError):
+            q.parse_metrics("cpu_load,fan_speed")
+
+    def test_parse_time(self):
+        now = datetime.datetime(2026, 7, 10, 12, 0)
+        self.assertEqual(q.parse_time("20181010T1644"), datetime.datetime(2018, 10, 10, 16, 44))
+        self.assertEqual(q.parse_time("2018-10-10 16:44"), datetime.datetime(2018, 10, 10, 16, 44))
+        self.assertEqual(q.parse_time("90d", now), now - datetime.timedelta(days=90))
+        with self.assertRaises(ValueError):
+            q.parse_time("yesterday")
+
+    def test_formats(self):
+        out = io.StringIO()
+        self.assertEqual(q.run_query(DataLogger(), self.text_file, out, ["cpu_load", "internet"], "rollup",
+                                     end=_day(1)), 1)
+        self.assertEqual(out.getvalue(), "time,cpu_load,internet\n{},0.0,100.0\n".format(START.isoformat()))
+
+        out = io.StringIO()
+        q.run_query(self.sqlite, self.db_file, out, ["cpu_load", "memory_percent"], fmt="jsonl", end=_day(4) +
+                    datetime.timedelta(minutes=1))
+        self.assertEqual([json.loads(line) for line in out.getvalue().splitlines()],
+                         [{"time": _day(4).isoformat(), "cpu_load": 10.0, "memory_percent": 25.0}])
+
+        out = io.BytesIO()
+        self.assertEqual(q.run_query(self.sqlite, self.db_file, out, ["cpu_load"], fmt="columns"), 3)
+        data = out.getvalue()
+        self.assertTrue(data.startswith(q.COLUMNS_MAGIC))
+        block = data[data.index(b"\n", len(q.COLUMNS_MAGIC)) + 1:]
+        n = struct.unpack("<I", block[:4])[0]
+        self.assertEqual(struct.unpack("<{}d".format(n), block[4 + n * 8:4 + n * 16]), (10.0, 11.0, 12.0))
+
+    def test_raw_reads_the_archive_first(self):
+        archive = SegmentArchive(os.path.join(self.directory, "archive"), "RPI-B")
+        archive.write_segment([_at(3, 5.0)])
+        out = io.StringIO()
+        self.assertEqual(q.run_query(self.sqlite, self.db_file, out, ["cpu_load"], archive=archive), 4)
+        self.assertEqual([line.split(",")[1] for line in out.getvalue().splitlines()[1:]],
+                         ["5.0", "10.0", "11.0", "12.0"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from customtypes import PollData
+from datalogger import DataLogger
+from reportcache import ReportCache
+from sqlitelogger import SqliteDataLogger
+
+START = datetime.datetime(2026, 7, 1, 12, 0)
+
+
+def _key(period: int) -> str:
+    return "p{:03d}".format(period)
+
+
+def _render(period: int) -> str:
+    return "<tr>{}</tr>".format(period)
+
+
+def _aggregate(days: int) -> PollData:
+    return PollData(START + datetime.timedelta(days=days), float(days), 40.0, 50.0, 100.0)
+
+
+class ReportCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "report_cache.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def render(self, cache: ReportCache, periods: list) -> str:
+        return cache.rows("history", sorted(periods, reverse=True), _key, _render)
+
+    def test_only_new_periods_are_rendered(self):
+        cache = ReportCache.load(self.filename)
+        self.assertIsNone(cache.newest("history"))
+        self.assertEqual(self.render(cache, [0, 1, 2]), "<tr>2</tr><tr>1</tr><tr>0</tr>")
+        cache.save()
+
+        cache = ReportCache.load(self.filename)
+        self.assertEqual(cache.newest("history"), _key(2))
+        self.assertEqual(self.render(cache, [0, 1, 2, 3]), "<tr>3</tr><tr>2</tr><tr>1</tr><tr>0</tr>")
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+    def test_periods_from_newest_on(self):
+        cache = ReportCache(self.filename)
+        self.render(cache, [0, 1, 2])
+        # the caller read only the newest cached period and the new ones
+        self.assertEqual(self.render(cache, [2, 3, 4]), "<tr>4</tr><tr>3</tr><tr>2</tr><tr>1</tr><tr>0</tr>")
+        self.assertEqual((cache.hits, cache.misses), (3, 5))
+        self.assertEqual(cache.newest("history"), _key(4))
+        # the whole history still matches the cache afterwards
+        self.assertEqual(self.render(cache, [0, 1, 2, 3, 4, 5]), "".join(map(_render, [5, 4, 3, 2, 1, 0])))
+        self.assertEqual(cache.misses, 6)
+
+    def test_stale_cache_renders_everything(self):
+        cache = ReportCache(self.filename)
+        self.render(cache, [0, 1, 2])
+        self.assertEqual(self.render(cache, [5, 6]), "<tr>6</tr><tr>5</tr>")
+        self.assertEqual(cache.misses, 5)
+
+    def test_broken_or_old_file_is_ignored(self):
+        with open(self.filename, "w") as file:
+            file.write("{not json")
+        self.assertIsNone(ReportCache.load(self.filename).newest("history"))
+        with open(self.filename, "w") as file:
+            file.write('{"version": 0, "sections": {"history": {"first": "a", "last": "b", "count": 1}}}')
+        self.assertIsNone(ReportCache.load(self.filename).newest("history"))
+
+
+class ReadAggregatesTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def check(self, store, filename):
+        self.assertEqual([a.cpu_load for a in store.read_aggregates(filename)], [0.0, 1.0, 2.0])
+        self.assertEqual([a.cpu_load for a in store.read_aggregates(filename, START + datetime.timedelta(days=1))],
+                         [1.0, 2.0])
+        with self.assertRaises(ValueError):
+            store.read_aggregates(os.path.join(self.directory, "missing"))
+
+    def test_text_store(self):
+        filename = os.path.join(self.directory, "polldata.dat")
+        # periods out of order, as in logs written by older versions
+        DataLogger.create_data_log(filename, email_date=START, mqtt_date=START,
+                                   aggregate_data=[_aggregate(2), _aggregate(0), _aggregate(1)])
+        DataLogger.writeline_to_data_log(filename, _aggregate(3))  # a sample, not an aggregate
+        self.check(DataLogger(), filename)
+
+    def test_sqlite_store(self):
+        filename = os.path.join(self.directory, "polldata.db")
+        store = SqliteDataLogger("RPI-B")
+        store.create_data_log(filename, email_date=START, mqtt_date=START,
+                              aggregate_data=[_aggregate(2), _aggregate(0), _aggregate(1)])
+        self.check(store, filename)
+        store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from archive import SegmentArchive
+from customtypes import DiskIo, Machine, Memory, MountUsage, NetIo, PollData
+from sqlitelogger import SqliteDataLogger
+
+
+def _sample(when: datetime.datetime, load: float = 12.5, internet=True, percent: float = 40.0) -> PollData:
+    return PollData(when, load, 48.25, 61.0, internet,
+                    [Machine("router", "192.168.1.1", 80, "socket", True)],
+                    [MountUsage("/", 1000, 400, percent)],
+                    [DiskIo("sda", 1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0)],
+                    Memory(8000, 6000, 25.0, 1000, 0.0, 0.5, 1.5, 2.5),
+                    [NetIo("eth0", 10.0, 20.0, 1.0, 2.0, 0.0)])
+
+
+class SqliteDataLoggerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "polldata.db")
+        self.store = SqliteDataLogger("RPI-B")
+        self.when = datetime.datetime(2026, 7, 1, 12, 0)
+        self.store.create_data_log(self.filename, email_date=self.when, mqtt_date=self.when)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def test_missing_file_raises(self):
+        with self.assertRaises(ValueError):
+            SqliteDataLogger("RPI-B").read_data_log(os.path.join(self.directory, "missing.db"), False)
+
+    def test_round_trip(self):
+        samples = [_sample(self.when + datetime.timedelta(minutes=i), load=i) for i in range(3)]
+        self.store.writelines_to_data_log(self.filename, samples)
+        email, mqtt, data, aggregates = self.store.read_data_log(self.filename, False)
+        self.assertEqual((email, mqtt, aggregates), (self.when, self.when, []))
+        self.assertEqual([str(d) for d in data], [str(s) for s in samples])
+        self.assertEqual(data[0].memory, samples[0].memory)
+        self.assertEqual(data[0].machines, samples[0].machines)
+
+    def test_unknown_internet_stays_unknown(self):
+        self.store.writelines_to_data_log(self.filename, [_sample(self.when, internet=None),
+                                                          _sample(self.when + datetime.timedelta(minutes=1))])
+        data = self.store.read_data_log(self.filename, False)[2]
+        self.assertEqual([d.internet for d in data], [None, True])
+        self.assertEqual(PollData.aggregate(data).internet, 100.0)
+
+    def test_hosts_are_separate(self):
+        other = SqliteDataLogger("RPI-C")
+        other.create_data_log(self.filename, email_date=self.when, mqtt_date=self.when)
+        other.writeline_to_data_log(self.filename, _sample(self.when))
+        self.assertEqual(self.store.read_data_log(self.filename, False)[2], [])
+        self.assertEqual(len(other.read_data_log(self.filename, False)[2]), 1)
+        other.close()
+
+    def test_aggregate(self):
+        self.store.writelines_to_data_log(self.filename, [_sample(self.when, load=10.0, percent=40.0),
+                                                          _sample(self.when, load=20.0, internet=False,
+                                                                  percent=60.0)])
+        aggregate = self.store.aggregate_data_log(self.filename)
+        self.assertEqual((aggregate.cpu_load, aggregate.internet, aggregate.memory_percent), (15.0, 50.0, 25.0))
+        self.assertEqual(aggregate.mounts, [MountUsage("/", 1000, 400, 50.0)])
+
+        email, mqtt, data, aggregates = self.store.read_data_log(self.filename, False)
+        self.assertEqual(data, [])
+        self.assertGreater(email, self.when)
+        self.assertEqual([(a.cpu_load, a.mounts) for a in aggregates], [(15.0, aggregate.mounts)])
+        self.assertIsNone(self.store.aggregate_data_log(self.filename))
+
+    def test_fleet_aggregate_archives_each_host(self):
+        other = SqliteDataLogger("RPI-C")
+        self.store.writelines_to_data_log(self.filename, [_sample(self.when, load=10.0)])
+        other.writelines_to_data_log(self.filename, [_sample(self.when, load=20.0), _sample(self.when, load=30.0)])
+        self.store.write_self_metrics(self.filename, self.when, {"poll.seconds": 0.5})
+        archive = SegmentArchive(os.path.join(self.directory, "archive"), "RPI-B")
+
+        rollups = self.store.aggregate_fleet_log(self.filename, archive)
+        self.assertEqual([(host, a.cpu_load, count) for host, a, count in rollups],
+                         [("RPI-B", 10.0, 1), ("RPI-C", 25.0, 2)])
+        self.assertEqual([r[1] for r in archive.iter_columns(["cpu_load"])], [10.0])
+        self.assertEqual([r[1] for r in archive.iter_columns(["cpu_load"], host="RPI-C")], [20.0, 30.0])
+        con = self.store._connect(self.filename)
+        self.assertEqual(con.execute("SELECT COUNT(*) FROM samples").fetchone()[0], 0)
+        self.assertEqual(con.execute("SELECT COUNT(*) FROM self_metrics").fetchone()[0], 0)
+        self.assertEqual(len(other.read_data_log(self.filename, False)[3]), 1)
+        other.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import signal
+import time
+import unittest
+
+from collectors import Collector, EXPENSIVE
+from workers import CollectorWorkers
+
+
+class _Quick(Collector):
+    name = "quick"
+    cost = EXPENSIVE
+
+    def probe(self):
+        return os.getpid()
+
+
+class _Hang(Collector):
+    """ A probe stuck like a read on a dead NFS mount """
+    name = "hang"
+    cost = EXPENSIVE
+
+    def probe(self):
+        time.sleep(60)
+
+
+class _Stubborn(Collector):
+    """ A probe that ignores SIGTERM """
+    name = "stubborn"
+    cost = EXPENSIVE
+
+    def probe(self):
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        time.sleep(60)
+
+
+class _Crash(Collector):
+    name = "crash"
+    cost = EXPENSIVE
+
+    def probe(self):
+        os._exit(3)
+
+
+class CollectorWorkersTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = CollectorWorkers(1, kill_grace=0.5)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def results(self, seconds: float = 10.0) -> list:
+        """ Runs the supervisor loop until a result arrives or [seconds] passed """
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            self.pool.wait(0.1)
+            ret = self.pool.collect()
+            if ret:
+                return ret
+        self.fail("no result within {}s".format(seconds))
+
+    def test_probe_result(self):
+        c = _Quick()
+        self.assertTrue(self.pool.submit(c, 5))
+        r = self.results()[0]
+        self.assertIs(r.collector, c)
+        self.assertIsNone(r.error)
+        self.assertNotEqual(r.value, os.getpid())  # probed in the worker process
+        self.assertEqual(self.pool.busy, 0)
+
+    def test_hung_probe_is_killed_and_worker_replaced(self):
+        hang = _Hang()
+        self.pool.submit(hang, 0.5)
+        old = self.pool._workers[0].process
+        start = time.monotonic()
+
+        r = self.results()[0]
+        self.assertIs(r.collector, hang)
+        self.assertTrue(r.timed_out)
+        self.assertLess(time.monotonic() - start, 3.0)
+        self.assertEqual((self.pool.timeouts, self.pool.restarts), (1, 1))
+
+        old.join(2.0)
+        self.assertFalse(old.is_alive())
+        self.assertIsNot(self.pool._workers[0].process, old)
+
+        # the replacement takes new probes right away
+        self.pool.submit(_Quick(), 5)
+        r = self.results()[0]
+        self.assertIsNone(r.error)
+        self.assertEqual(r.value, self.pool._workers[0].process.pid)
+
+    def test_sigterm_ignored_is_killed(self):
+        self.pool.submit(_Stubborn(), 0.5)
+        old = self.pool._workers[0].process
+        self.assertTrue(self.results()[0].timed_out)
+        deadline = time.monotonic() + 5.0
+        while old.is_alive() and time.monotonic() < deadline:
+            self.pool.wait(0.1)
+            self.pool.collect()
+        self.assertFalse(old.is_alive())
+        self.assertEqual(old.exitcode, -signal.SIGKILL)
+
+    def test_crashed_worker_is_replaced(self):
+        self.pool.submit(_Crash(), 5)
+        r = self.results()[0]
+        self.assertFalse(r.timed_out)
+        self.assertIn("exited", r.error)
+        self.assertEqual(self.pool.restarts, 1)
+        self.pool.submit(_Quick(), 5)
+        self.assertIsNone(self.results()[0].error)
+
+    def test_running_collector_is_not_queued_twice(self):
+        hang = _Hang()
+        self.assertTrue(self.pool.submit(hang, 5))
+        self.assertFalse(self.pool.submit(hang, 5))
+        self.assertEqual(self.pool.busy, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
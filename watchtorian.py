@@ -1,9 +1,13 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import argparse
 import configparser
+import json
 import logging.config
 import os
+import sys
+import time
 from datetime import datetime as dt
 
 import httplib2
@@ -11,10 +15,22 @@ from apiclient import discovery
 
 import confighelper as ch
 import gmail
+import query as q
 import systemwatcher as sw
+from alerting import AlertManager
+from archive import SegmentArchive
+from anomaly import Alert, AnomalyDetector
+from collectors import MachinesCollector, create_collectors
+from connectivity import ConnectivityChecker
 from customtypes import PollData
+from exporter import MetricsExporter
 from datalogger import DataLogger
+from forecast import DiskForecaster
+from fleetcollector import FleetCollector, push_samples
+from instrumentation import INSTRUMENTS
 from mqtthelper import mqtt_publish
+from reportcache import ReportCache
+from sqlitelogger import SqliteDataLogger
 
 
 def script_home_path():
@@ -29,6 +45,11 @@ def path_join(filename, basedir=script_home_path()):
 LOGGING_CONFIG_FILE = path_join("logging_config.ini")
 APP_CONFIG_FILE = "config.ini"
 DATA_LOG_FILE = "poll_data/polldata.dat"
+DATA_LOG_DB = "poll_data/polldata.db"
+FORECAST_STATE_FILE = "poll_data/forecast.json"
+ALERT_STATE_FILE = "poll_data/alerts.json"
+REPORT_CACHE_FILE = "poll_data/report_cache.json"
+ARCHIVE_DIR = "poll_data/archive"
 
 # Logging setup, so that we can have unified logging throughout the app
 logging.config.fileConfig(fname=LOGGING_CONFIG_FILE, disable_existing_loggers=False)
@@ -36,106 +57,452 @@ logger = logging.getLogger(__name__)
 
 try:
     def main():
-        config = configparser.ConfigParser(inline_comment_prefixes=(";", "#"))
-        config.read(APP_CONFIG_FILE)
+        cfg = ch.load_config(APP_CONFIG_FILE)
+        INSTRUMENTS.enabled = cfg.instrumentation
+        store, store_file = get_data_log(cfg)
 
         # fetch interesting system data that we will use for statistics
-        swo = sw.SystemWatcher()
-        swo._update_host_fs()
-        swo._update_cpu_internet_uptime()
-        data = PollData.from_system_info(swo.system_info)
+        with INSTRUMENTS.timer("collect"):
+            with sw.SystemWatcher(collector_list=create_collectors(cfg.parser),
+                                  connectivity=ConnectivityChecker.from_config(cfg.parser),
+                                  worker_processes=cfg.parser.getint("collectors", "worker_processes",
+                                                                     fallback=0)) as swo:
+                swo.poll_once()
+                data = PollData.from_system_info(swo.system_info)
         logger.info("fetched system data")
 
-        # TODO - Poll machines
-        # m = Machine("RPI-A", "192.168.1.170", 443, "TCP/ping", True)
-        # data.machines.append(m)
+        # Load the disk trend before [data] is stored: a first run seeds it from the data log,
+        # which must not hold [data] yet because [check_disk_forecast] adds it below
+        with INSTRUMENTS.timer("forecast.load"):
+            forecaster = get_disk_forecaster(cfg, store, store_file)
 
         # Write system data to permanent storage
-        DataLogger.writeline_to_data_log(DATA_LOG_FILE, data)
-        logger.info("wrote data to file ./" + DATA_LOG_FILE)
+        with INSTRUMENTS.timer("write"):
+            store.writeline_to_data_log(store_file, data)
+        logger.info("wrote data to file ./" + store_file)
 
         # Does any value exceed a threshold?
-        # In that case we need to send a report immediately
-        send_warning = False
-        if data.cpu_load >= config.getint("warning_thresholds", "cpu_utilization_percent"):
-            send_warning = True
+        with INSTRUMENTS.timer("thresholds"):
+            alerts = check_thresholds(cfg, data)
+
+        # Will the disk be full soon?
+        with INSTRUMENTS.timer("forecast"):
+            alerts += check_disk_forecast(forecaster, data)
+
+        # Alert right away. Conditions and rate limits are remembered between runs
+        with INSTRUMENTS.timer("alerts"):
+            alert_manager = create_alert_manager(lambda: cfg).load(ALERT_STATE_FILE)
+            alert_manager.sync(alerts)
+            alert_manager.save(ALERT_STATE_FILE)
+            alert_manager.close(wait=True)
+
+        report(cfg, store, store_file, data)
+        write_self_metrics(cfg, store, store_file)
+
+
+    def check_thresholds(cfg: ch.AppConfig, data: PollData):
+        """
+        Compares a single sample against the fixed levels in [warning_thresholds]
+        :return: a list of [Alert], one per value that exceeds its threshold
+        """
+        alerts = []
+        if data.cpu_load >= cfg.thresholds.cpu_load:
+            alerts.append(Alert("cpu_load", "threshold", data.cpu_load, cfg.thresholds.cpu_load, data.when))
             logger.info("CPU load threshold exceeded!")
-        if data.cpu_temp >= config.getint("warning_thresholds", "cpu_temp"):
-            send_warning = True
+        if data.cpu_temp >= cfg.thresholds.cpu_temp:
+            alerts.append(Alert("cpu_temp", "threshold", data.cpu_temp, cfg.thresholds.cpu_temp, data.when))
             logger.info("CPU temp threshold exceeded!")
-        if data.disk_usage_percent >= config.getint("warning_thresholds", "disk_used_percent"):
-            send_warning = True
+        if data.disk_usage_percent >= cfg.thresholds.disk_percent:
+            alerts.append(Alert("disk_usage_percent", "threshold", data.disk_usage_percent,
+                                cfg.thresholds.disk_percent, data.when))
             logger.info("Disk usage threshold exceeded!")
+        if data.memory_percent is not None and data.memory_percent >= cfg.thresholds.memory_percent:
+            alerts.append(Alert("memory_percent", "threshold", data.memory_percent,
+                                cfg.thresholds.memory_percent, data.when))
+            logger.info("Memory usage threshold exceeded!")
+        return alerts
+
+
+    def get_disk_forecaster(cfg: ch.AppConfig, store, store_file):
+        """
+        Loads the disk fill-rate trend saved by the previous run. The very first time, the trend
+        is seeded from the archive, the aggregate rows and the samples in the data log (if there is one yet),
+        so call it before the current sample is stored and add that sample with [check_disk_forecast].
+        :return: a [DiskForecaster]
+        """
+        return DiskForecaster.load_or_seed(FORECAST_STATE_FILE, cfg.thresholds.disk_full_horizon,
+                                           cfg.forecast_half_life, store, store_file, get_archive(cfg))
+
+
+    def check_disk_forecast(forecaster: DiskForecaster, data: PollData):
+        """
+        Adds [data] to the disk trend and saves the trend for the next run.
+        :return: a list of [Alert] (value and limit in days), one per disk projected to be full within the horizon
+        """
+        forecaster.update(data.when, data.disk_usage_percent)
+        for m in data.mounts or []:
+            forecaster.update(data.when, m.percent, m.mount)
+        forecaster.save(FORECAST_STATE_FILE)
+        alerts = []
+        for mount, seconds in forecaster.warnings():
+            logger.info("Disk {} is projected to be full in {:.1f} days!".format(mount, seconds / 86400))
+            alerts.append(Alert("disk_full:" + mount, "forecast", seconds / 86400, forecaster.horizon / 86400,
+                                data.when))
+        return alerts
+
+
+    def create_alert_manager(get_cfg):
+        """
+        Builds the [AlertManager] with its channels: "mqtt" publishes a JSON alert to [alerts] mqtt_topic,
+        "email" sends a short alert email. Both are skipped when not configured.
+        :param get_cfg: callable that returns the current [AppConfig], so a reloaded config applies to alerts
+        :return: an [AlertManager]
+        """
+        def send_mqtt(n):
+            cfg = get_cfg()
+            topic = cfg.parser.get("alerts", "mqtt_topic", fallback="")
+            if topic:
+                publish(cfg, {topic: json.dumps({"host": n.host, "condition": n.condition, "state": n.state,
+                                                 "tier": n.tier + 1, "value": n.alert.value,
+                                                 "limit": n.alert.limit, "since": n.since})})
+
+        def send_email(n):
+            cfg = get_cfg()
+            if cfg.email_report.enabled:
+                send_email_report(cfg.parser, gmail.apply_alert_email_template(
+                    n, path_join("email_templates/alert.html")),
+                    "{} {} {}".format(cfg.parser.get("alerts", "email_subject", fallback="Watchtorian alert:"),
+                                      n.condition, n.state))
+
+        return AlertManager.from_config(get_cfg().parser, get_cfg().name, {"mqtt": send_mqtt, "email": send_email})
+
+
+    def report(cfg: ch.AppConfig, store, store_file, data: PollData):
+        """
+        Publishes [data] to MQTT and/or a fleet collector and sends the email report when it is due.
+        Warnings do not go through here, see [create_alert_manager].
+        :return: the aggregate rows that were read (the newest last) if the period was aggregated, else None
+        """
+        # Push the sample to a fleet collector?
+        if cfg.push_address:
+            push_samples(cfg.push_address, cfg.push_port, cfg.name, [data])
 
         # Get the last time we created a report
-        dl = DataLogger.read_data_log(DATA_LOG_FILE, True)
+        with INSTRUMENTS.timer("read_data_log"):
+            dl = store.read_data_log(store_file, True)
 
         # Is it time to publish to MQTT broker?
-        mqtt_enabled, mqtt_interval = ch.get_report(config, "publish_to_mqtt")
-        if mqtt_enabled and (dt.now() - dl[1]).total_seconds() > mqtt_interval:
+        if cfg.mqtt_report.enabled and (dt.now() - dl[1]).total_seconds() > cfg.mqtt_report.interval:
+            topics = cfg.mqtt
             to_pub = dict()
-            to_pub[config.get("MQTT", "topic_alive")] = "on"
-            to_pub[config.get("MQTT", "topic_cpu_temp")] = data.cpu_temp
-            to_pub[config.get("MQTT", "topic_cpu_load")] = data.cpu_load
-            to_pub[config.get("MQTT", "topic_cpu_internet")] = data.internet
-            to_pub[config.get("MQTT", "topic_diskusagepercent")] = data.disk_usage_percent
-            mqtt_publish(
-                to_pub,
-                config.get("MQTT", "broker_ip"),
-                int(config.get("MQTT", "broker_port")),
-                config.get("MQTT", "broker_user"),
-                config.get("MQTT", "broker_pwd")
-            )
+            to_pub[topics.topic_alive] = "on"
+            to_pub[topics.topic_cpu_temp] = data.cpu_temp
+            to_pub[topics.topic_cpu_load] = data.cpu_load
+            to_pub[topics.topic_internet] = data.internet
+            to_pub[topics.topic_disk_percent] = data.disk_usage_percent
+            if topics.topic_memory_percent and data.memory_percent is not None:
+                to_pub[topics.topic_memory_percent] = data.memory_percent
+            if topics.topic_sample:
+                # full sample for a fleet collector ("python3 watchtorian.py collect")
+                to_pub[topics.topic_sample] = str(data)
+            with INSTRUMENTS.timer("mqtt"):
+                publish(cfg, to_pub)
 
         # Is it time to send an email report?
-        email_enabled, email_interval = ch.get_report(config, "send_emails")
-        if send_warning or email_enabled and (dt.now() - dl[0]).total_seconds() > email_interval:
+        if cfg.email_report.enabled and (dt.now() - dl[0]).total_seconds() > cfg.email_report.interval:
             # Save report date because it will be overwritten when doing Aggregate
             last_report = dl[0]
 
             # aggregate data (an unfortunate side-affect is that the last report date will be set to Now()
-            aggregate_data()
+            with INSTRUMENTS.timer("aggregate"):
+                aggregate_data(store, store_file, get_archive(cfg))
 
-            # Load data
-            dl = DataLogger.read_data_log(DATA_LOG_FILE, False)
-
-            # get email credentials
-            email_config = ch.config_section_map(config, "email")
-            credentials = gmail.get_email_credentials()
-            http = credentials.authorize(httplib2.Http())
-            service = discovery.build('gmail', 'v1', http=http, cache_discovery=False)
+            # Load the periods the report cache does not hold yet, plus its newest one for the changes
+            # rows of earlier periods are rendered once and reused, only new periods are rendered
+            cache = ReportCache.load(REPORT_CACHE_FILE)
+            newest = cache.newest("history")
+            with INSTRUMENTS.timer("read_data_log"):
+                aggregates = store.read_aggregates(store_file, dt.strptime(newest, gmail.HISTORY_KEY_FORMAT)
+                                                   if newest is not None else None)
+                if newest is not None and (not aggregates or
+                                           aggregates[0].when.strftime(gmail.HISTORY_KEY_FORMAT) != newest):
+                    aggregates = store.read_aggregates(store_file)  # the cache is stale, read everything
 
             # build html email from a template
-            html_email = gmail.apply_email_template(
-                last_report, config.get("app", "name"), data, dl, path_join("email_templates/default.html"))
+            with INSTRUMENTS.timer("render"):
+                html_email = gmail.apply_email_template(
+                    last_report, cfg.name, data, (dl[0], dl[1], None, aggregates),
+                    path_join("email_templates/default.html"), INSTRUMENTS.summary(), cache)
+                cache.save()
+            with INSTRUMENTS.timer("send"):
+                send_email_report(cfg.parser, html_email)
+            return aggregates
+        return None
+
+
+    def publish(cfg: ch.AppConfig, to_pub: dict):
+        """
+        Publishes {topic: payload} to the broker in section [MQTT]
+        :return: None
+        """
+        mqtt_publish(to_pub, cfg.mqtt.broker_ip, cfg.mqtt.broker_port, cfg.mqtt.broker_user, cfg.mqtt.broker_pwd)
+
+
+    def write_self_metrics(cfg: ch.AppConfig, store, store_file):
+        """
+        Stores Watchtorian's own stage timings and resource usage next to the system data
+        and publishes them to [MQTT] topic_self_metrics (if set). The timers start over afterwards.
+        :return: None
+        """
+        if not INSTRUMENTS.enabled:
+            return
+        metrics = INSTRUMENTS.snapshot()
+        store.write_self_metrics(store_file, dt.now(), metrics)
+        if cfg.mqtt.topic_self_metrics:
+            publish(cfg, {cfg.mqtt.topic_self_metrics: json.dumps(metrics)})
+        INSTRUMENTS.reset()
+
+
+    def daemon():
+        """
+        Daemon mode. Samples the system every [daemon] sample_interval seconds and runs every sample
+        through the streaming [AnomalyDetector], which replaces the one-sample threshold check.
+        Its alerts go to the [AlertManager] right away, within one sample interval of a breach.
+        Escalations are sent within one sample interval too ([AlertManager.tick]), all clears with the sample
+        that ends the condition.
+        Every [daemon] store_interval seconds the latest sample is stored and reported just like [main].
+        If [exporter] listen_port is set, the current values are also served to Prometheus.
+        config.ini is watched for changes: thresholds, report intervals, MQTT topics, machines and the
+        daemon intervals apply without a restart. Storage, collectors and the exporter need a restart.
+        :return: None
+        """
+        watcher = ch.ConfigWatcher(APP_CONFIG_FILE)
+        cfg = watcher.current
+        INSTRUMENTS.enabled = cfg.instrumentation
+        store, store_file = get_data_log(cfg)
+        detector = AnomalyDetector.from_config(cfg.parser)
+        alert_manager = create_alert_manager(lambda: watcher.current)
+
+        def on_sample(sample):
+            alert_manager.feed(detector.feed(sample))
+
+        forecaster = get_disk_forecaster(cfg, store, store_file)
+        swo = sw.SystemWatcher(cfg.sample_interval, collector_list=create_collectors(cfg.parser),
+                               connectivity=ConnectivityChecker.from_config(cfg.parser),
+                               worker_processes=cfg.parser.getint("collectors", "worker_processes", fallback=0))
+
+        def on_config_change(old: ch.AppConfig, new: ch.AppConfig):
+            INSTRUMENTS.enabled = new.instrumentation
+            detector.set_thresholds(new.parser)
+            alert_manager.configure(new.parser)
+            swo.update_delay = new.sample_interval
+            forecaster.horizon = new.thresholds.disk_full_horizon
+            for c in swo.collectors:
+                if isinstance(c, MachinesCollector):
+                    c.set_machines(new.machines)
+            if new.storage != old.storage:
+                logger.warning("[app] storage changed, restart Watchtorian to switch storage")
 
-            gmail.send_email_message(service, email_config["user"],
-                                     gmail.create_email_message(email_config["from_address"],
-                                                                email_config["to_address"],
-                                                                email_config["subject"], html_email))
-            logger.info("Sent email report to " + email_config["to_address"])
+        watcher.on_change = on_config_change
+        swo.Sampled.subscribe(on_sample, maxsize=1000)
+        exporter = None
+        if cfg.parser.getint("exporter", "listen_port", fallback=0) > 0:
+            exporter = MetricsExporter(swo, cfg.name, cfg.parser.get("exporter", "listen_address"),
+                                       cfg.parser.getint("exporter", "listen_port")).start()
+            try:
+                exporter.set_rollups(store.read_aggregates(store_file))
+            except ValueError:
+                logger.info("No data log yet, no rollups to export")
+        swo.start_monitoring()
+        watcher.start()
+        try:
+            last_store = time.monotonic()
+            while True:
+                # escalations fall due with time, not with samples: send them even if nothing was sampled
+                alert_manager.tick()
+                # wait in slices, so a changed store_interval applies without waiting out the old one
+                remaining = last_store + watcher.current.store_interval - time.monotonic()
+                if remaining > 0:
+                    time.sleep(min(remaining, watcher.interval, watcher.current.sample_interval))
+                    continue
+                last_store = time.monotonic()
+                cfg = watcher.current  # one snapshot per round, a reload never changes it half way
+                data = PollData.from_system_info(swo.system_info)
+                with INSTRUMENTS.timer("write"):
+                    store.writeline_to_data_log(store_file, data)
+                with INSTRUMENTS.timer("forecast"):
+                    alert_manager.sync(check_disk_forecast(forecaster, data), kinds=("forecast",))
+                rollups = report(cfg, store, store_file, data)
+                write_self_metrics(cfg, store, store_file)
+                if exporter is not None and rollups is not None:
+                    exporter.set_rollups(rollups)
+        finally:
+            watcher.stop()
+            if exporter is not None:
+                exporter.stop()
+            swo.stop_monitoring()
+            alert_manager.close(wait=False)
 
 
-    def aggregate_data():
+    def collect():
+        """
+        Fleet collector mode. Ingests samples from many Watchtorian agents (MQTT and/or TCP push),
+        stores each host's samples in the shared SQLite store and sends one fleet-wide email report
+        with per-host rollups instead of one email per host.
+        :return: None
+        """
+        config = ch.read_config(APP_CONFIG_FILE)
+        store = SqliteDataLogger(config.get("collector", "name"))
+        fc = FleetCollector(store, config.get("collector", "db_file"),
+                            config.getint("collector", "batch_size"),
+                            config.getfloat("collector", "flush_interval"),
+                            config.getint("collector", "max_pending", fallback=100000)).start()
+        try:
+            if config.get("collector", "mqtt_topic", fallback=""):
+                fc.subscribe_mqtt(config.get("collector", "mqtt_topic"),
+                                  config.get("MQTT", "broker_ip"),
+                                  int(config.get("MQTT", "broker_port")),
+                                  config.get("MQTT", "broker_user"),
+                                  config.get("MQTT", "broker_pwd"))
+            if config.getint("collector", "listen_port", fallback=0) > 0:
+                fc.listen(config.get("collector", "listen_address"), config.getint("collector", "listen_port"))
+
+            email_enabled, email_interval = ch.get_report(config, "send_emails")
+            archive = get_archive(ch.load_config(APP_CONFIG_FILE))
+            while True:
+                time.sleep(60)
+                last_report = store.read_data_log(config.get("collector", "db_file"), True)[0]
+                if email_enabled and (dt.now() - last_report).total_seconds() > email_interval:
+                    rollups = fc.build_fleet_report(archive)
+                    html_email = gmail.apply_fleet_email_template(
+                        last_report, config.get("collector", "name"), rollups, path_join("email_templates/fleet.html"))
+                    send_email_report(config, html_email)
+        finally:
+            fc.stop()
+
+
+    def query(args):
+        """
+        Query mode. Streams stored history to a file or stdout as CSV, JSON lines or binary columns,
+        see [query.run_query]. Log output is moved to stderr when the data goes to stdout.
+        :param args: parsed command line, see --start, --end, --metrics, --resolution, --host, --format, --output
+        :return: None
+        """
+        cfg = ch.load_config(APP_CONFIG_FILE)
+        store, store_file = get_data_log(cfg)
+        archive = get_archive(cfg)
+        if args.db:
+            store, store_file, archive = SqliteDataLogger(cfg.name), args.db, None
+        elif args.host and args.host != cfg.name and cfg.storage != "sqlite":
+            raise ValueError("The text data log only holds host '{}'. Query other hosts from a SQLite store "
+                             "or a fleet collector (--db)".format(cfg.name))
+        metrics = q.parse_metrics(args.metrics)
+        start = q.parse_time(args.start) if args.start else None
+        end = q.parse_time(args.end) if args.end else None
+        binary = args.format == "columns"
+
+        if args.output == "-":
+            for h in logging.getLogger().handlers:
+                if isinstance(h, logging.StreamHandler) and h.stream is sys.stdout:
+                    h.setStream(sys.stderr)
+            out = sys.stdout.buffer if binary else sys.stdout
+        else:
+            out = open(args.output, "wb" if binary else "w", newline=None if binary else "")
+        try:
+            count = q.run_query(store, store_file, out, metrics, args.resolution, start, end, args.host, args.format,
+                                archive)
+            out.flush()
+        except BrokenPipeError:
+            # the reader stopped early (e.g. | head), that is not an error
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            return
+        finally:
+            if out not in (sys.stdout, sys.stdout.buffer):
+                out.close()
+        logger.info("query wrote {} rows".format(count))
+
+
+    def send_email_report(config: configparser.ConfigParser, html_email: str, subject: str = None):
+        """
+        Sends [html_email] to the address configured in section [email]
+        :param subject: None = [email] subject
+        :return: None
+        """
+        # get email credentials
+        email_config = ch.config_section_map(config, "email")
+        credentials = gmail.get_email_credentials()
+        http = credentials.authorize(httplib2.Http())
+        service = discovery.build('gmail', 'v1', http=http, cache_discovery=False)
+
+        gmail.send_email_message(service, email_config["user"],
+                                 gmail.create_email_message(email_config["from_address"],
+                                                            email_config["to_address"],
+                                                            subject or email_config["subject"], html_email))
+        logger.info("Sent email report to " + email_config["to_address"])
+
+
+    def aggregate_data(store, store_file, archive: SegmentArchive = None):
         """
          Compute data aggregate for whole period (since last email report)
          and save it to file (bad idea! it shouldn't)
+        :param store: [DataLogger] or [SqliteDataLogger]
+        :param store_file: path and filename the store reads from
+        :param archive: keeps the samples of the period in a compressed segment. None = drop them
         :return: None
         """
-        # Load the entire data file
-        df = DataLogger.read_data_log(DATA_LOG_FILE, False)
+        store.aggregate_data_log(store_file, archive)
+        logger.info("Aggregate data complete. New data file created.")
 
-        # compute the average for all existing data
-        df[3].append(PollData.aggregate(df[2]))
 
-        # save a new file with ONLY the aggregate data
-        now = dt.now()
-        DataLogger.create_data_log(DATA_LOG_FILE, True, now, now, None, df[3])
-        logger.info("Aggregate data complete. New data file created.")
+    def get_archive(cfg: ch.AppConfig):
+        """
+        The archive of closed periods configured in section [archive].
+        :return: a [SegmentArchive], or None if archiving is disabled
+        """
+        if cfg.parser.get("archive", "enabled", fallback="False").strip() not in ch.TRUE_VALUES:
+            return None
+        return SegmentArchive(cfg.parser.get("archive", "directory", fallback=ARCHIVE_DIR), cfg.name,
+                              cfg.parser.get("archive", "codec", fallback="zlib"),
+                              cfg.parser.getint("archive", "level", fallback=6))
+
+
+    def get_data_log(cfg: ch.AppConfig):
+        """
+        Picks the storage backend selected by [app] storage in config.ini.
+        :return: tuple (store, path and filename the store reads from)
+        """
+        if cfg.storage == "sqlite":
+            return SqliteDataLogger(cfg.name), DATA_LOG_DB
+        return DataLogger(), DATA_LOG_FILE
 
 
     if __name__ == "__main__":
-        main()
+        parser = argparse.ArgumentParser(description="System monitor for Raspbian/Debian systems")
+        parser.add_argument("command", nargs="?", default="run", choices=["run", "daemon", "collect", "query"],
+                            help="run: poll this host once (default, for cron). "
+                                 "daemon: keep sampling this host. "
+                                 "collect: run as fleet collector for many agents. "
+                                 "query: export stored history")
+        query_args = parser.add_argument_group("query")
+        query_args.add_argument("--start", help="first point in time, e.g. 20181010T1644, 2018-10-10 or 90d (ago)")
+        query_args.add_argument("--end", help="end of the range (exclusive). Default = everything after --start")
+        query_args.add_argument("--metrics", default="", help="comma separated, default all: " + ", ".join(q.METRICS))
+        query_args.add_argument("--resolution", default="raw", choices=q.RESOLUTIONS,
+                                help="raw: stored samples. rollup: one aggregate per report period")
+        query_args.add_argument("--host", help="host to query. Default = [app] name")
+        query_args.add_argument("--format", default="csv", choices=q.FORMATS,
+                                help="csv, jsonl (JSON lines) or columns (binary float64 blocks)")
+        query_args.add_argument("--output", default="-", help="file to write to. Default = stdout")
+        query_args.add_argument("--db", help="query this SQLite store (e.g. a fleet collector's db_file) instead")
+        args = parser.parse_known_args()[0]
+        if args.command == "daemon":
+            daemon()
+        elif args.command == "collect":
+            collect()
+        elif args.command == "query":
+            query(args)
+        else:
+            main()
 
 except KeyboardInterrupt:
     logger.info("Keyboard Interrupt. exiting program")
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import logging
+import multiprocessing
+import signal
+import time
+from multiprocessing import connection
+
+logger = logging.getLogger(__name__)
+
+# error is None if the probe succeeded. seconds = time from dispatch to result
+Result = collections.namedtuple("Result", ["collector", "value", "error", "timed_out", "seconds"])
+
+
+def _worker_main(conn):
+    """
+    Body of a worker process: runs [Collector.probe] for every collector it receives and sends back
+    (job id, value, error). Exits when the supervisor closes its end of the pipe.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C is for the supervisor, it stops the workers
+    while True:
+        try:
+            job_id, collector = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            reply = (job_id, collector.probe(), None)
+        except Exception as e:
+            reply = (job_id, None, "{}: {}".format(type(e).__name__, e))
+        try:
+            conn.send(reply)
+        except (EOFError, OSError):
+            return
+        except Exception as e:  # the value could not be pickled
+            conn.send((job_id, None, "{}: {}".format(type(e).__name__, e)))
+
+
+class _Worker(object):
+    """ One worker process, its end of the pipe and the job it is running """
+
+    def __init__(self, ctx, index: int):
+        self.index = index
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child,), daemon=True,
+                                   name="collector-worker-{}".format(index))
+        self.process.start()
+        child.close()
+        self.job = None  # (job id, collector, dispatched, deadline)
+
+
+class CollectorWorkers(object):
+    """
+    Runs [Collector.probe] of expensive collectors in a pool of supervised worker processes, so a probe
+    that hangs in a syscall, leaks or crashes can never stall the sampling loop or take the process down.
+    Nothing here blocks: [submit] queues a probe, [collect] returns what has finished, [wait] is the
+    sampling loop's sleep and returns early when a result arrives.
+    Results come back over one pipe per worker. The supervisor is also the watchdog: a probe that runs past
+    its timeout is terminated (SIGTERM, SIGKILL after [kill_grace]) and a dead worker is replaced at once.
+    Not thread safe, use it from one thread (the polling thread).
+     Example:
+        pool = CollectorWorkers(2)
+        pool.submit(collector, timeout=10)
+        pool.wait(1.0)
+        for r in pool.collect():
+            r.collector.apply(watcher, r.value) if r.error is None else ...
+    """
+
+    def __init__(self, processes: int = 2, kill_grace: float = 1.0):
+        """
+        :param processes: number of worker processes
+        :param kill_grace: seconds between SIGTERM and SIGKILL of a worker that timed out
+        """
+        # forkserver: workers are forked from a clean single threaded server, not from this threaded process
+        methods = multiprocessing.get_all_start_methods()
+        self._ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        self.kill_grace = kill_grace
+        self.restarts = 0
+        self.timeouts = 0
+        self._next_id = 0
+        self._queue = collections.deque()  # (collector, timeout) waiting for an idle worker
+        self._dying = []  # [process, time of SIGKILL or None once killed]
+        self._workers = [_Worker(self._ctx, i) for i in range(max(1, processes))]
+
+    @property
+    def busy(self) -> int:
+        """ number of probes queued or running """
+        return len(self._queue) + sum(1 for w in self._workers if w.job is not None)
+
+    def submit(self, collector, timeout: float) -> bool:
+        """
+        Queues [collector.probe]. A collector is never queued twice, so a probe that is still running
+        (or stuck until its timeout) skips its turn instead of piling up.
+        :param timeout: seconds the probe may run once a worker picked it up
+        :return: False if the collector is already queued or running
+        """
+        if any(c is collector for c, _ in self._queue) or \
+                any(w.job is not None and w.job[1] is collector for w in self._workers):
+            return False
+        self._queue.append((collector, timeout))
+        self._dispatch(time.monotonic())
+        return True
+
+    def collect(self) -> list:
+        """
+        Picks up finished probes without waiting. Also the watchdog: kills probes past their timeout
+        and replaces workers that died.
+        :return: a list of [Result]
+        """
+        now = time.monotonic()
+        results = []
+        for i, w in enumerate(self._workers):
+            if w.job is None:
+                if not w.process.is_alive():
+                    logger.warning("collector worker {} exited with code {}, restarting it".format(
+                        w.index, w.process.exitcode))
+                    self._workers[i] = self._restart(w)
+                continue
+            job_id, collector, dispatched, deadline = w.job
+            try:
+                if w.conn.poll():
+                    reply_id, value, error = w.conn.recv()
+                    if reply_id == job_id:
+                        w.job = None
+                        results.append(Result(collector, value, error, False, now - dispatched))
+                    continue
+            except (EOFError, OSError):
+                pass  # the worker died while sending, handled below
+            if not w.process.is_alive():
+                results.append(Result(collector, None, "worker exited with code {}".format(w.process.exitcode),
+                                      False, now - dispatched))
+                self._workers[i] = self._restart(w)
+            elif now >= deadline:
+                self.timeouts += 1
+                results.append(Result(collector, None, "timed out", True, now - dispatched))
+                self._workers[i] = self._restart(w)
+        self._reap(now)
+        self._dispatch(now)
+        return results
+
+    def wait(self, timeout: float):
+        """
+        Sleeps up to [timeout] seconds, less if a result arrives, a worker dies or a probe times out.
+        Call [collect] afterwards. Retired workers are killed by [collect], so at most one sleep late.
+        """
+        now = time.monotonic()
+        running = [w for w in self._workers if w.job is not None]
+        if running:
+            timeout = min(timeout, max(0.0, min(w.job[3] for w in running) - now))
+            connection.wait([w.conn for w in running] + [w.process.sentinel for w in running], timeout)
+        elif timeout > 0:
+            time.sleep(timeout)
+
+    def close(self):
+        """ Stops every worker. Does not wait for running probes. """
+        for w in self._workers:
+            w.conn.close()  # an idle worker exits on EOF
+            if w.job is not None:
+                w.process.terminate()
+        deadline = time.monotonic() + self.kill_grace
+        for w in self._workers:
+            w.process.join(max(0.0, deadline - time.monotonic()))
+            if w.process.is_alive():
+                w.process.kill()
+        for p, _ in self._dying:
+            if p.is_alive():
+                p.kill()
+        self._workers = []
+        self._dying = []
+        self._queue.clear()
+
+    def _dispatch(self, now: float):
+        for i, w in enumerate(self._workers):
+            if not self._queue:
+                return
+            if w.job is not None:
+                continue
+            collector, timeout = self._queue.popleft()
+            self._next_id += 1
+            try:
+                w.conn.send((self._next_id, collector))
+            except (EOFError, OSError):
+                self._queue.appendleft((collector, timeout))
+                self._workers[i] = w = self._restart(w)
+                continue
+            w.job = (self._next_id, collector, now, now + timeout)
+
+    def _restart(self, w: _Worker) -> _Worker:
+        """ Retires [w] (SIGTERM now, SIGKILL after [kill_grace] if needed) and starts a new worker """
+        w.conn.close()
+        if w.process.is_alive():
+            w.process.terminate()
+            self._dying.append([w.process, time.monotonic() + self.kill_grace])
+        else:
+            w.process.join(0)
+        self.restarts += 1
+        return _Worker(self._ctx, w.index)
+
+    def _reap(self, now: float):
+        """ Joins retired workers that exited, kills those that ignored SIGTERM """
+        for d in list(self._dying):
+            p, kill_at = d
+            if not p.is_alive():
+                p.join(0)
+                self._dying.remove(d)
+            elif kill_at is not None and now >= kill_at:
+                logger.warning("collector worker pid {} ignored SIGTERM, killing it".format(p.pid))
+                p.kill()
+                d[1] = None  # a process stuck in uninterruptible sleep stays here until it can die